@@ -0,0 +1,135 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import piexif
+from PIL import Image
+from histogram import compute_histogram
+from palette import extract_palette
+
+FEATURES = ("info", "exif", "color", "histogram", "class")
+CHUNK_SIZE = 8
+
+def exif_to_dict(exif_dict):
+    # piexif解析结果转为{标签名: 值}，bytes尽量解码为字符串
+    exif_data = {}
+    for ifd in exif_dict:
+        if isinstance(exif_dict[ifd], dict):
+            for tag in exif_dict[ifd]:
+                tag_name = piexif.TAGS[ifd][tag]["name"]
+                value = exif_dict[ifd][tag]
+                if isinstance(value, bytes):
+                    try:
+                        value = value.decode()
+                    except Exception:
+                        value = str(value)
+                exif_data[tag_name] = value
+    return exif_data
+
+def classify_shape(width, height):
+    if width > height*1.5:
+        return "横幅"
+    elif height > width*1.5:
+        return "竖幅"
+    return "方形"
+
+def _analyze(path, features):
+    # 单个文件只打开一次：文件头信息和EXIF不需要解码像素；需要直方图时完整解码一次，
+    # 主色直接在解码后的像素上采样，否则主色按DCT缩放解码
+    result = {}
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            if "info" in features:
+                result["info"] = {
+                    "format": img.format, "mode": img.mode, "size": (width, height),
+                    "file_size": os.path.getsize(path), "dpi": img.info.get("dpi"),
+                    "frames": getattr(img, "n_frames", 1),
+                }
+            if "exif" in features:
+                raw = img.info.get("exif")
+                try:
+                    result["exif"] = exif_to_dict(piexif.load(raw)) if raw else {}
+                except Exception:
+                    result["exif"] = {}
+            if "histogram" in features:
+                img.load()
+                result["histogram"] = compute_histogram(img)
+            if "color" in features or "class" in features:
+                dom_color, palette = extract_palette(img)
+                if "color" in features:
+                    result["color"] = {"dominant": dom_color, "palette": palette}
+                if "class" in features:
+                    color_str = str(dom_color) if dom_color else "未知"
+                    result["class"] = [classify_shape(width, height), f"主色:{color_str}"]
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+def _analyze_chunk(paths, features):
+    return [_analyze(path, features) for path in paths]
+
+def analyze_images(paths, features=FEATURES, workers=None, chunk_size=CHUNK_SIZE):
+    # 逐个产出(路径, {特征: 结果})，顺序与输入一致；paths可以是生成器。
+    # workers>1时分进程处理，在途任务数有上限，海量文件也不会一次性提交全部任务
+    features = tuple(features)
+    for feature in features:
+        if feature not in FEATURES:
+            raise ValueError(f"未知的分析项: {feature}")
+    paths = iter(paths)
+    def chunks():
+        while True:
+            chunk = [p for _, p in zip(range(chunk_size), paths)]
+            if not chunk:
+                return
+            yield chunk
+    if not workers or workers <= 1:
+        for chunk in chunks():
+            for path in chunk:
+                yield path, _analyze(path, features)
+        return
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        pending = deque()
+        for chunk in chunks():
+            pending.append((chunk, pool.submit(_analyze_chunk, chunk, features)))
+            if len(pending) >= workers * 2:
+                chunk, future = pending.popleft()
+                yield from zip(chunk, future.result())
+        while pending:
+            chunk, future = pending.popleft()
+            yield from zip(chunk, future.result())
+    finally:
+        # 调用方提前停止迭代时，取消尚未开始的任务
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def get_exif_data(image_path):
+    try:
+        return exif_to_dict(piexif.load(image_path))
+    except Exception:
+        return {}
+
+def compute_histograms(file_paths, workers=None):
+    # 批量计算直方图，返回{路径: 直方图}，无法读取的文件为None
+    return {path: result.get("histogram") for path, result in analyze_images(file_paths, ("histogram",), workers)}
+
+def smart_classify(image_path):
+    try:
+        with Image.open(image_path) as img:
+            shape = classify_shape(*img.size)
+            # 尺寸来自文件头，主色在同一个文件对象上缩小解码取得，只解码一次
+            try:
+                dom_color, _ = extract_palette(img)
+            except Exception:
+                dom_color = None
+        color_str = str(dom_color) if dom_color else "未知"
+        return [shape, f"主色:{color_str}"]
+    except Exception:
+        return ["无法识别"]
+
+def classify_images(file_paths, workers=None, chunksize=16):
+    # 批量分类，返回{路径: 标签}；workers>1时分进程处理
+    if workers and workers > 1 and len(file_paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            return dict(zip(file_paths, pool.map(smart_classify, file_paths, chunksize=chunksize)))
+    return {path: smart_classify(path) for path in file_paths}
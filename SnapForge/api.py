@@ -1,15 +1,242 @@
-from fastapi import FastAPI, File, UploadFile, Form
-from logic import ImageProcessor
+from typing import List
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from urllib.parse import quote
+from logic import ImageProcessor, InvalidImageError, ProcessLog, _cache_key
+from filters import parse_chain
+from archive import iter_zip
+from cache import ResultCache
 
+import asyncio
+import multiprocessing
+import mimetypes
 import tempfile
 import shutil
+import uuid
 import os
 
-app = FastAPI(title="SnapForge API")
 processor = ImageProcessor()
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_WORKERS = int(os.environ.get("SNAPFORGE_WORKERS", os.cpu_count() or 1))
+MAX_QUEUE = int(os.environ.get("SNAPFORGE_MAX_QUEUE", MAX_WORKERS * 4))
+REQUEST_TIMEOUT = float(os.environ.get("SNAPFORGE_TIMEOUT", 120))
+# /process/把单个上传整个读进内存处理，限制其大小；批量接口逐文件写盘，不受此限制
+MAX_UPLOAD_BYTES = int(os.environ.get("SNAPFORGE_MAX_UPLOAD_BYTES", 64 * 1024 * 1024))
+CACHE_DIR = os.environ.get("SNAPFORGE_CACHE_DIR")
+CACHE_MAX_BYTES = int(os.environ.get("SNAPFORGE_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+cache = ResultCache(CACHE_DIR, CACHE_MAX_BYTES) if CACHE_DIR else None
+
+class WorkerPool:
+    # 有界进程池：最多workers个任务在执行、max_queue个在排队，超出直接拒绝，内存占用可预期
+    def __init__(self, workers, max_queue, timeout):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.executor = None
+        self.slots = None
+        self.in_flight = 0
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+    def start(self):
+        self.slots = asyncio.Semaphore(self.workers)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+    def metrics(self):
+        return {
+            "workers": self.workers, "max_queue": self.max_queue,
+            "in_flight": self.in_flight, "queued": self.queued,
+            "completed": self.completed, "failed": self.failed,
+            "rejected": self.rejected, "timed_out": self.timed_out,
+        }
+    def _release(self, future):
+        # 任务真正结束才归还槽位：超时的请求虽已返回，但其进程仍在运行，仍需计入占用
+        self.in_flight -= 1
+        self.slots.release()
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+        else:
+            self.completed += 1
+    def admit(self):
+        # 排队已满时直接拒绝；接口在读取请求体之前先调用，被拒绝的请求不占内存
+        if self.executor is None:
+            raise HTTPException(status_code=503, detail="处理服务未就绪")
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=429, detail="请求过多，请稍后重试", headers={"Retry-After": "1"})
+    async def run(self, func, *args, on_abandon=None):
+        # on_abandon(future)：请求已超时或被取消而任务仍在工作进程中运行时调用，
+        # 调用方借此把临时文件的清理推迟到任务真正结束
+        self.admit()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise HTTPException(status_code=503, detail="排队超时，请稍后重试", headers={"Retry-After": "1"})
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        executor = self.executor
+        try:
+            future = executor.submit(func, *args)
+        except Exception:
+            self.in_flight -= 1
+            self.slots.release()
+            self._restart(executor)
+            raise HTTPException(status_code=503, detail="处理进程不可用")
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._release, f))
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=max(0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            if on_abandon:
+                on_abandon(future)
+            raise HTTPException(status_code=504, detail="处理超时")
+        except asyncio.CancelledError:
+            # 客户端断开：任务照常在工作进程中跑完
+            if on_abandon:
+                on_abandon(future)
+            raise
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise HTTPException(status_code=503, detail="处理进程异常退出，请重试")
+    def _restart(self, broken):
+        # 子进程崩溃(如OOM被杀)后进程池不可再用，重建一个新的。同一次崩溃会让所有在途请求都失败，
+        # 只有第一个负责重建：已被换掉的旧池不再处理，否则会关掉新池并取消刚提交上去的任务
+        if self.executor is not broken:
+            return
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        broken.shutdown(wait=False, cancel_futures=True)
+
+pool = WorkerPool(MAX_WORKERS, MAX_QUEUE, REQUEST_TIMEOUT)
+
+@asynccontextmanager
+async def lifespan(app):
+    pool.start()
+    try:
+        yield
+    finally:
+        pool.shutdown()
+
+app = FastAPI(title="SnapForge API", lifespan=lifespan)
+
+class TempDir:
+    # 请求的临时目录；任务被放弃但仍在运行时，由任务结束回调负责删除
+    def __init__(self):
+        self.path = tempfile.mkdtemp()
+        self.owned = True
+    def defer(self, future):
+        self.owned = False
+        future.add_done_callback(lambda f: self.cleanup())
+    def release(self):
+        # 交给响应的后台任务删除
+        self.owned = False
+        return self.path
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+def run_batch(args):
+    # 在工作进程中执行；日志对象无法跨进程回传，因此返回日志文本
+    log = ProcessLog()
+    _, _, res_paths = processor.batch_process(process_log=log, **args)
+    return res_paths, log.get_text()
+
+def run_bytes(data, filename, options):
+    # 单张图片在工作进程中直接从内存处理，返回(输出字节, 扩展名, 错误信息)，不经过临时文件
+    try:
+        result, out_ext = processor.process_bytes(data, filename, **options)
+        return result, out_ext, None
+    except InvalidImageError:
+        return None, None, f"跳过: {filename}（不是有效图片）"
+    except Exception as e:
+        return None, None, f"失败: {filename}，原因: {str(e)}"
+
+def safe_name(filename):
+    # 文件名只保留安全字符，防止路径穿越
+    return "".join(x for x in os.path.basename(filename or "") if x.isalnum() or x in "._-")
+
+async def read_upload(file):
+    # 最多读MAX_UPLOAD_BYTES+1字节，超限时不会把整个上传读进内存
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="上传文件过大")
+    data = await file.read(MAX_UPLOAD_BYTES + 1)
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="上传文件过大")
+    return data
+
+def save_upload(file, target_dir, index=0):
+    # 分块拷贝到磁盘，不把整个上传读进内存
+    name = safe_name(file.filename)
+    path = os.path.join(target_dir, f"{index:04d}_{name or 'upload'}")
+    with open(path, "wb") as out:
+        shutil.copyfileobj(file.file, out, UPLOAD_CHUNK_SIZE)
+    return path
+
+def build_options(convert_format, resize_width, resize_height,
+                  watermark_text, watermark_pos, filter_type, rotate, target_size=0, target_ssim=0.0):
+    watermark = {"text": watermark_text, "pos": watermark_pos} if watermark_text else None
+    return {
+        "convert_format": convert_format,
+        "resize_enabled": resize_width>0 and resize_height>0,
+        "resize_width": resize_width or None,
+        "resize_height": resize_height or None,
+        "watermark": watermark,
+        "filter_type": filter_type or None,
+        "rotate": rotate,
+        "encode": {"target_size": target_size or None, "target_ssim": target_ssim or None} if target_size or target_ssim else None,
+    }
+
+def build_args(paths, prefix, *options):
+    return dict(build_options(*options), files=paths, prefix=prefix)
+
+def media_type_for(path):
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+def content_disposition(name):
+    # 与FileResponse相同：非ASCII文件名用RFC 5987编码
+    quoted = quote(name)
+    return f"attachment; filename*=utf-8''{quoted}" if quoted != name else f"attachment; filename=\"{name}\""
+
+def iter_multipart(paths, boundary):
+    for path in paths:
+        name = os.path.basename(path)
+        yield (
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type_for(path)}\r\n"
+            f"Content-Disposition: {content_disposition(name)}\r\n"
+            f"Content-Length: {os.path.getsize(path)}\r\n\r\n"
+        ).encode()
+        with open(path, "rb") as fin:
+            while True:
+                block = fin.read(UPLOAD_CHUNK_SIZE)
+                if not block:
+                    break
+                yield block
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+@app.get("/metrics")
+async def metrics():
+    data = pool.metrics()
+    if cache is not None:
+        data["cache"] = cache.stats()
+    return data
 
 @app.post("/process/")
-def process_image(
+async def process_image(
     file: UploadFile = File(...),
     prefix: str = Form("api"),
     convert_format: str = Form(""),
@@ -18,28 +245,91 @@ def process_image(
     watermark_text: str = Form(""),
     watermark_pos: str = Form("bottom-right"),
     filter_type: str = Form(""),
-    rotate: int = Form(0)
+    rotate: int = Form(0),
+    target_size: int = Form(0),
+    target_ssim: float = Form(0.0),
+    output: str = Form("json")
 ):
-    temp_dir = tempfile.mkdtemp()
+    if output not in ("json", "binary"):
+        raise HTTPException(status_code=400, detail="output 只支持 json 或 binary")
     try:
-        path = os.path.join(temp_dir, file.filename)
-        with open(path, "wb") as out:
-            out.write(file.file.read())
-        watermark = {"text": watermark_text, "pos": watermark_pos} if watermark_text else None
-        args = {
-            "files": [path],
-            "prefix": prefix,
-            "convert_format": convert_format,
-            "resize_enabled": resize_width>0 and resize_height>0,
-            "resize_width": resize_width or None,
-            "resize_height": resize_height or None,
-            "watermark": watermark,
-            "filter_type": filter_type or None,
-            "rotate": rotate,
-        }
-        _, _, res_paths = processor.batch_process(**args)
-        with open(res_paths[0], "rb") as fin:
-            content = fin.read()
-        return {"filename": os.path.basename(res_paths[0]), "content": content.hex()}
+        parse_chain(filter_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # 上传内容直接在内存中处理，结果也直接返回：不写临时文件，也不从磁盘读回结果
+    pool.admit()
+    data = await read_upload(file)
+    filename = safe_name(file.filename) or "upload"
+    prefix = safe_name(prefix)
+    options = build_options(convert_format, resize_width, resize_height,
+                            watermark_text, watermark_pos, filter_type, rotate, target_size, target_ssim)
+    result = None
+    cache_key = None
+    if cache is not None:
+        # 相同源文件+相同参数直接从磁盘缓存返回，不进入进程池
+        try:
+            out_ext = processor._output_extension(data, filename, processor._normalize_extension(convert_format))
+        except (InvalidImageError, ValueError):
+            out_ext = None
+        if out_ext:
+            # 与ImageProcessor相同的key(含滤镜版本)，滤镜实现变化后旧结果自动失效
+            cache_key = await run_in_threadpool(_cache_key, cache, cache.digest_bytes(data), processor._job_options(**options), out_ext)
+            result = await run_in_threadpool(cache.get_bytes, cache_key, out_ext)
+            cache.record(result is not None)
+    if result is None:
+        result, out_ext, error = await pool.run(run_bytes, data, filename, options)
+        if result is None:
+            raise HTTPException(status_code=422, detail=error)
+        if cache_key:
+            await run_in_threadpool(cache.put_bytes, cache_key, result, out_ext)
+    name = processor._generate_filename(prefix, 1, out_ext)
+    if output == "binary":
+        return Response(content=result, media_type=media_type_for(name), headers={"Content-Disposition": content_disposition(name)})
+    return {"filename": name, "content": result.hex()}
+
+@app.post("/process/batch")
+async def process_batch(
+    files: List[UploadFile] = File(...),
+    prefix: str = Form("api"),
+    convert_format: str = Form(""),
+    resize_width: int = Form(0),
+    resize_height: int = Form(0),
+    watermark_text: str = Form(""),
+    watermark_pos: str = Form("bottom-right"),
+    filter_type: str = Form(""),
+    rotate: int = Form(0),
+    target_size: int = Form(0),
+    target_ssim: float = Form(0.0),
+    output: str = Form("zip")
+):
+    if output not in ("zip", "multipart"):
+        raise HTTPException(status_code=400, detail="output 只支持 zip 或 multipart")
+    try:
+        parse_chain(filter_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # prefix会拼进输出文件名，与上传文件名一样清理，防止写到输出目录之外
+    prefix = safe_name(prefix)
+    pool.admit()
+    temp_dir = TempDir()
+    try:
+        paths = [await run_in_threadpool(save_upload, f, temp_dir.path, i) for i, f in enumerate(files)]
+        args = build_args(paths, prefix, convert_format, resize_width, resize_height,
+                          watermark_text, watermark_pos, filter_type, rotate, target_size, target_ssim)
+        res_paths, log_text = await pool.run(run_batch, args, on_abandon=temp_dir.defer)
+        if not res_paths:
+            raise HTTPException(status_code=422, detail=log_text)
+        background = BackgroundTask(shutil.rmtree, temp_dir.release(), ignore_errors=True)
+        if output == "zip":
+            return StreamingResponse(
+                iter_zip(res_paths), media_type="application/zip", background=background,
+                headers={"Content-Disposition": "attachment; filename=\"results.zip\""}
+            )
+        boundary = uuid.uuid4().hex
+        return StreamingResponse(
+            iter_multipart(res_paths, boundary), background=background,
+            media_type=f"multipart/mixed; boundary={boundary}"
+        )
     finally:
-        shutil.rmtree(temp_dir)
\ No newline at end of file
+        if temp_dir.owned:
+            temp_dir.cleanup()
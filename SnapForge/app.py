@@ -1,12 +1,16 @@
 import os
+import mimetypes
 import streamlit as st
-import zipfile
-import io
 from logic import (
-    ImageProcessor, ProcessLog, find_duplicate_images,
-    ai_image_recognition_cloud, get_exif_data, get_image_main_color,
-    plot_image_histogram, ocr_image, smart_classify, remove_background
+    ImageProcessor, InvalidImageError, ProcessLog, find_duplicate_images,
+    ai_image_recognition_cloud, analyze_images, render_histogram,
+    ocr_images, classify_images, remove_backgrounds
 )
+from archive import write_zip
+from cache import ResultCache
+from cloud import UploadStats
+from encoder import EncodeStats
+from hashstore import HashStore
 from PIL import Image
 from utils_i18n import get_translator
 
@@ -66,6 +70,24 @@ st.sidebar.title("🌐")
 lang = st.sidebar.selectbox("界面语言 / Language", ["中文", "English"])
 _ = get_translator(lang)
 
+# Streamlit每次交互都会重跑整个脚本：缓存对象在进程内只建一次，
+# 否则每次都重新扫描缓存目录，命中统计也被清零
+@st.cache_resource
+def get_result_cache(root):
+    return ResultCache(root)
+
+@st.cache_resource
+def get_processor():
+    return ImageProcessor(cache=get_result_cache(os.path.join("output", ".cache")))
+
+def deferred_file(path):
+    # 下载按钮的数据延迟到点击时才读取：未点击的重跑和会话不占内存。
+    # 点击后Streamlit仍会把整个文件读入内存再提供下载，这一点无法绕过
+    def read():
+        with open(path, "rb") as f:
+            return f.read()
+    return read
+
 # ---------- 主体 ----------
 st.markdown('<div class="main-card">', unsafe_allow_html=True)
 tab_titles = [
@@ -76,7 +98,7 @@ tabs = st.tabs(tab_titles)
 
 # ---------- Tab 0: 批量/单文件图片处理 ----------
 with tabs[0]:
-    processor = ImageProcessor()
+    processor = get_processor()
     def save_uploaded_files(files, output_dir):
         os.makedirs(output_dir, exist_ok=True)
         file_paths = []
@@ -88,14 +110,30 @@ with tabs[0]:
                 out.write(f.read())
             file_paths.append(temp_path)
         return file_paths
-    def pack_files_to_zip(file_paths):
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w") as zipf:
-            for file in file_paths:
-                if os.path.exists(file):
-                    zipf.write(file, arcname=os.path.basename(file))
-        zip_buffer.seek(0)
-        return zip_buffer
+    def process_in_memory(f, args):
+        # 单文件直接在内存中处理：上传内容不写入output/，结果字节直接用于下载和预览，返回[(文件名, 输出字节)]
+        skip = ("files", "prefix", "start_number", "extension", "progress_callback", "process_log", "workers", "encode_stats")
+        options = {k: v for k, v in args.items() if k not in skip}
+        log = args["process_log"]
+        data = f.getvalue()
+        try:
+            result, out_ext = processor.process_bytes(data, f.name, **options)
+        except InvalidImageError:
+            log.add(f"跳过: {f.name}（不是有效图片）", level="skip")
+            return []
+        except Exception as e:
+            log.add(f"失败: {f.name}，原因: {str(e)}", level="error")
+            return []
+        new_filename = processor._generate_filename(args["prefix"], args["start_number"], out_ext)
+        if args["encode"]:
+            args["encode_stats"].record(len(data), len(result))
+        log.add(f"成功: {f.name} → {new_filename}", level="info")
+        return [(new_filename, result)]
+    def pack_files_to_zip(file_paths, zip_path):
+        # 流式写到磁盘，打包过程不在内存中拼接整个压缩包
+        with open(zip_path, "wb") as out:
+            write_zip((f for f in file_paths if os.path.exists(f)), out)
+        return zip_path
 
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.markdown(f'<h3>{_("📂 上传图片 & 选择模式")}</h3>', unsafe_allow_html=True)
@@ -123,6 +161,12 @@ with tabs[0]:
         enable_compress = st.checkbox(_("启用质量压缩"))
         quality = st.slider(_("压缩质量 (1-100)"), 1, 100, 85, disabled=not enable_compress)
         st.caption(_("💡 JPEG/WEBP用质量，PNG为压缩等级"))
+        enable_encode = st.checkbox(_("优化编码（更小文件）"))
+        encode = None
+        if enable_encode:
+            target_kb = st.number_input(_("目标体积（KB，0为不限）"), min_value=0, value=0)
+            target_ssim = st.slider(_("目标画质SSIM（0为不限）"), 0.0, 0.99, 0.0, 0.01)
+            encode = {"target_size": target_kb * 1024 or None, "target_ssim": target_ssim or None}
     with st.expander(_("尺寸调整与高级选项"), expanded=False):
         enable_resize = st.checkbox(_("启用尺寸调整"))
         resize_width = st.number_input(_("目标宽度(px)"), min_value=1, value=800, disabled=not enable_resize)
@@ -138,9 +182,10 @@ with tabs[0]:
         watermark = None
         if enable_watermark:
             wm_text = st.text_input(_("水印内容"), "SnapForge")
-            wm_pos = st.selectbox(_("水印位置"), ["bottom-right","bottom-left","top-right","top-left","center"])
+            wm_pos = st.selectbox(_("水印位置"), ["bottom-right","bottom-left","top-right","top-left","center","tile"])
             wm_size = st.slider(_("水印字号"), 10, 120, 32)
-            watermark = {"text": wm_text, "size": wm_size, "pos": wm_pos, "color": (255,255,255,128)}
+            wm_angle = st.slider(_("水印角度"), -90, 90, 30 if wm_pos == "tile" else 0)
+            watermark = {"text": wm_text, "size": wm_size, "pos": wm_pos, "color": (255,255,255,128), "angle": wm_angle}
         enable_crop = st.checkbox(_("启用批量裁剪"))
         crop_params = None
         if enable_crop:
@@ -150,7 +195,24 @@ with tabs[0]:
             crop_h = st.number_input(_("裁剪高"), 0)
             crop_params = {"x": crop_x, "y": crop_y, "w": crop_w, "h": crop_h}
         rotate = st.number_input(_("批量旋转角度"), -360, 360, 0)
-        filter_type = st.selectbox(_("批量滤镜"), ["", "grayscale", "sharpen", "blur", "contour", "emboss", "edge", "enhance"])
+        # 多选的先后顺序即滤镜链的执行顺序
+        filter_chain = st.multiselect(_("批量滤镜"), ["grayscale", "sharpen", "blur", "contour", "emboss", "edge", "enhance",
+                                                      "brightness", "contrast", "gaussian", "unsharp"])
+        filter_params = {}
+        if "brightness" in filter_chain:
+            filter_params["brightness"] = {"factor": st.slider(_("亮度系数"), 0.2, 3.0, 1.2)}
+        if "contrast" in filter_chain:
+            filter_params["contrast"] = {"factor": st.slider(_("对比度系数"), 0.2, 3.0, 1.5)}
+        if "gaussian" in filter_chain:
+            filter_params["gaussian"] = {"radius": st.slider(_("高斯模糊半径"), 0.5, 20.0, 2.0)}
+        if "unsharp" in filter_chain:
+            filter_params["unsharp"] = {
+                "radius": st.slider(_("USM锐化半径"), 0.5, 10.0, 2.0),
+                "amount": st.slider(_("USM锐化强度(%)"), 10, 500, 150),
+                "threshold": st.slider(_("USM锐化阈值"), 0, 20, 3),
+            }
+        filter_type = [dict(filter_params.get(name, {}), type=name) for name in filter_chain]
+        workers = st.number_input(_("并行进程数"), min_value=1, max_value=os.cpu_count() or 1, value=1)
     st.markdown('</div>', unsafe_allow_html=True)
 
     st.markdown('<div class="card res-card">', unsafe_allow_html=True)
@@ -175,8 +237,9 @@ with tabs[0]:
                 st.stop()
             os.makedirs(output_dir, exist_ok=True)
             try:
-                file_paths = save_uploaded_files(files, output_dir)
-                if mode == _("批量处理（多文件上传）") and extension:
+                single = mode == _("单文件处理")
+                file_paths = [] if single else save_uploaded_files(files, output_dir)
+                if not single and extension:
                     selected_paths = [f for f in file_paths if os.path.splitext(f)[1].lower() == extension]
                     if not selected_paths:
                         result_area.error(_(f"没有找到扩展名为{extension}的文件。"), icon="❌")
@@ -193,7 +256,7 @@ with tabs[0]:
                     'files': file_paths,
                     'prefix': prefix if enable_rename else '',
                     'start_number': start_num if enable_rename else 1,
-                    'extension': extension if extension else os.path.splitext(file_paths[0])[1].lower(),
+                    'extension': extension if extension or single else os.path.splitext(file_paths[0])[1].lower(),
                     'convert_format': target_ext if enable_convert else '',
                     'quality': quality if enable_compress else None,
                     'progress_callback': streamlit_progress_callback,
@@ -208,10 +271,17 @@ with tabs[0]:
                     'rotate': rotate,
                     'filter_type': filter_type if filter_type else None,
                     'process_log': log,
+                    'workers': workers,
+                    'encode': encode,
+                    'encode_stats': EncodeStats(),
                 }
                 with st.spinner(_("图片处理中，请耐心等待...")):
                     result_area.info(_("正在处理图片，请耐心等待..."), icon="⏳")
-                    processed, total_files, result_file_paths = processor.batch_process(**args)
+                    if single:
+                        results = process_in_memory(files[0], args)
+                        processed, total_files, result_file_paths = len(results), 1, results
+                    else:
+                        processed, total_files, result_file_paths = processor.batch_process(**args)
                     progress_bar.progress(100)
                     log_area.text_area(_("处理日志"), log.get_text(), height=200)
                     if processed == 0:
@@ -220,11 +290,23 @@ with tabs[0]:
                         result_area.warning(_(f"⚠️ 有部分图片未处理成功：{processed}/{total_files}"))
                     else:
                         result_area.success(_(f"✅ 处理完成：{processed}/{total_files} 个文件"))
-                    if result_file_paths:
-                        zip_buffer = pack_files_to_zip(result_file_paths)
+                    info = args['encode_stats'].stats()
+                    if info["images"]:
+                        st.caption(_("输出体积：") + f"{info['original_bytes'] / 1e6:.1f} MB → {info['encoded_bytes'] / 1e6:.2f} MB（{-info['saved_ratio']:+.0%}）")
+                    if single and result_file_paths:
+                        new_filename, result = result_file_paths[0]
+                        download_area.download_button(
+                            label=_("⬇️ 下载处理结果"),
+                            data=result,
+                            file_name=new_filename,
+                            mime=mimetypes.guess_type(new_filename)[0] or "application/octet-stream",
+                            use_container_width=True
+                        )
+                    elif result_file_paths:
+                        zip_path = pack_files_to_zip(result_file_paths, os.path.join(output_dir, "处理结果.zip"))
                         download_area.download_button(
                             label=_("⬇️ 下载全部处理结果（zip包）"),
-                            data=zip_buffer,
+                            data=deferred_file(zip_path),
                             file_name="处理结果.zip",
                             mime="application/zip",
                             use_container_width=True
@@ -253,14 +335,17 @@ with tabs[1]:
         st.write(f"{_('文件大小')}: {os.path.getsize(temp_path)//1024} KB")
         dpi = img.info.get("dpi")
         if dpi: st.write(_(f"DPI: {dpi}"))
-        exif_data = get_exif_data(temp_path)
+        # 一次打开同时取得EXIF、主色和直方图
+        analysis = next(analyze_images([temp_path], features=("exif", "color", "histogram")))[1]
+        exif_data = analysis.get("exif")
         if exif_data:
             with st.expander(_("EXIF详细信息")):
                 for k,v in exif_data.items():
                     st.write(f"`{k}`: {v}")
         else:
             st.info(_("无EXIF元数据"))
-        dom_color, palette = get_image_main_color(temp_path)
+        dom_color = analysis.get("color", {}).get("dominant")
+        palette = analysis.get("color", {}).get("palette", [])
         if dom_color:
             st.write(_("主色调:"))
             st.markdown(f'<div style="width:50px;height:30px;background:rgb{dom_color};display:inline-block;border-radius:3px;border:1px solid #888"></div>', unsafe_allow_html=True)
@@ -269,7 +354,7 @@ with tabs[1]:
                 st.markdown(f'<div style="width:30px;height:20px;background:rgb{col};display:inline-block;border-radius:2px;border:1px solid #ccc"></div>', unsafe_allow_html=True)
         else:
             st.info(_("无法获取主色信息"))
-        buf = plot_image_histogram(temp_path)
+        buf = render_histogram(analysis["histogram"]) if "histogram" in analysis else None
         if buf:
             st.image(buf, caption=_("RGB直方图"), use_column_width=False)
         else:
@@ -282,6 +367,8 @@ with tabs[2]:
     st.subheader(_("图片去重"))
     files = st.file_uploader(_("上传需去重的图片"), type=["jpg","jpeg","png","bmp","gif","tiff","webp"], accept_multiple_files=True)
     threshold = st.slider(_("相似度阈值(越低越严格)"), 0, 20, 8)
+    grouping = st.radio(_("分组方式"), [_("相似聚类（cluster）"), _("逐个比对（greedy）")], horizontal=True)
+    dedup_workers = st.number_input(_("并行进程数"), min_value=1, max_value=os.cpu_count() or 1, value=1, key="dedup_workers")
     run_btn = st.button(_("开始去重"), use_container_width=True, disabled=not files)
     output_dir = "output"
     if run_btn and files:
@@ -293,7 +380,12 @@ with tabs[2]:
                 out.write(f.read())
             file_paths.append(path)
         with st.spinner(_("正在查找重复图片...")):
-            dups = find_duplicate_images(file_paths, threshold)
+            # 哈希记录持久化在输出目录，重复上传的图片不再重新计算
+            with HashStore(os.path.join(output_dir, ".phash.db")) as store:
+                dups = find_duplicate_images(
+                    file_paths, threshold, store=store, workers=dedup_workers,
+                    grouping=["cluster", "greedy"][[_("相似聚类（cluster）"), _("逐个比对（greedy）")].index(grouping)]
+                )
             if not dups:
                 st.success(_("未检测到重复图片。"))
             else:
@@ -318,9 +410,9 @@ with tabs[3]:
         api_params["secret_key"] = st.text_input("Baidu Secret Key")
     elif provider == "deepseek":
         api_params["api_key"] = st.text_input("DeepSeek API Key")
-        user_endpoint = st.text_input("DeepSeek Endpoint", value="https://api.deepseek.com/v1/vision/detect")
-        allowed_endpoints = ["https://api.deepseek.com/v1/vision/detect"]
-        api_params["endpoint"] = user_endpoint if user_endpoint in allowed_endpoints else "https://api.deepseek.com/v1/vision/detect"
+        # 地址白名单校验在cloud模块中进行，不在白名单内的地址会回退到官方地址
+        api_params["endpoint"] = st.text_input("DeepSeek Endpoint", value="https://api.deepseek.com/v1/vision/detect")
+    shrink_upload = st.checkbox(_("上传前缩小图片（更快）"), value=True)
     run_btn = st.button(_("开始AI识别"), use_container_width=True, disabled=not files)
     output_dir = "output"
     if run_btn and files:
@@ -333,7 +425,14 @@ with tabs[3]:
             file_paths.append(path)
         with st.spinner(_("正在识别图片内容...")):
             try:
-                results = ai_image_recognition_cloud(file_paths, provider=provider, **api_params)
+                upload_stats = UploadStats()
+                if not shrink_upload:
+                    api_params["max_side"] = 0
+                results = ai_image_recognition_cloud(file_paths, provider=provider, stats=upload_stats,
+                                                     cache=get_result_cache(os.path.join(output_dir, ".cache")), **api_params)
+                info = upload_stats.stats()
+                if info["images"]:
+                    st.caption(_("上传体积：") + f"{info['original_bytes'] / 1e6:.1f} MB → {info['uploaded_bytes'] / 1e6:.2f} MB（-{info['saved_ratio']:.0%}）")
                 for path, tags in results.items():
                     if os.path.exists(path):
                         st.image(path, caption=os.path.basename(path), width=180)
@@ -346,6 +445,7 @@ with tabs[4]:
     st.subheader(_("批量OCR文字识别"))
     files = st.file_uploader(_("上传图片进行OCR"), type=["jpg","jpeg","png","bmp","gif","tiff","webp"], accept_multiple_files=True)
     output_dir = "output"
+    ocr_preprocess = st.checkbox(_("扫描件预处理（灰度、二值化）"))
     if st.button(_("开始OCR识别"), disabled=not files):
         os.makedirs(output_dir, exist_ok=True)
         file_paths = []
@@ -354,10 +454,16 @@ with tabs[4]:
             with open(path, "wb") as out:
                 out.write(f.read())
             file_paths.append(path)
+        # 先列出所有图片，识别结果按完成先后逐个填入
+        slots = {}
         for idx, p in enumerate(file_paths):
             if os.path.exists(p):
                 st.image(p, caption=os.path.basename(p), width=180)
-                st.text_area(_("识别结果"), ocr_image(p), key=f"ocr_result_{idx}_{os.path.basename(p)}")
+                slots[p] = (idx, st.empty())
+                slots[p][1].info(_("识别中..."))
+        for p, text in ocr_images(list(slots), preprocess=ocr_preprocess, cache=get_result_cache(os.path.join(output_dir, ".cache"))):
+            idx, slot = slots[p]
+            slot.text_area(_("识别结果"), text, key=f"ocr_result_{idx}_{os.path.basename(p)}")
 
     st.subheader(_("智能图片分类（尺寸/主色调）"))
     files2 = st.file_uploader(_("上传图片进行智能分类"), type=["jpg","jpeg","png","bmp","gif","tiff","webp"], accept_multiple_files=True, key="classify")
@@ -369,41 +475,45 @@ with tabs[4]:
             with open(path, "wb") as out:
                 out.write(f.read())
             file_paths.append(path)
+        # 图片较多时分进程批量分类
+        labels = classify_images(file_paths, workers=os.cpu_count() if len(file_paths) > 32 else None)
         for p in file_paths:
             if os.path.exists(p):
                 st.image(p, caption=os.path.basename(p), width=120)
-                st.write(_("分类结果:"), ", ".join(smart_classify(p)))
+                st.write(_("分类结果:"), ", ".join(labels[p]))
 
 # ---------- Tab 5: 图片去背景 ----------
 with tabs[5]:
     st.subheader(_("图片去背景"))
     files = st.file_uploader(_("上传图片进行去背景"), type=["jpg","jpeg","png","bmp","gif","tiff","webp"], accept_multiple_files=True)
     output_dir = "output"
+    fast_mask = st.checkbox(_("大图缩小后求蒙版（更快）"), value=True)
     if st.button(_("开始去背景"), disabled=not files):
         os.makedirs(output_dir, exist_ok=True)
-        result_paths = []
+        in_paths = []
         for f in files:
             in_path = os.path.join(output_dir, f.name)
             with open(in_path, "wb") as out:
                 out.write(f.read())
-            out_path = os.path.splitext(in_path)[0] + "_nobg.png"
-            try:
-                remove_background(in_path, output_path=out_path)
+            in_paths.append(in_path)
+        out_paths = [os.path.splitext(p)[0] + "_nobg.png" for p in in_paths]
+        result_paths = []
+        # 复用同一个模型会话，解码与保存在后台线程中与推理重叠
+        for in_path, out_path, error in remove_backgrounds(in_paths, out_paths, mask_size=1024 if fast_mask else None):
+            if error:
+                st.error(f"{os.path.basename(in_path)} 去背景失败: {error}")
+            else:
                 result_paths.append(out_path)
-            except Exception as e:
-                st.error(f"{os.path.basename(f.name)} 去背景失败: {e}")
         for p in result_paths:
             if os.path.exists(p):
                 st.image(p, caption=os.path.basename(p), width=180)
         if result_paths:
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, "w") as zipf:
-                for file in result_paths:
-                    zipf.write(file, arcname=os.path.basename(file))
-            zip_buffer.seek(0)
+            zip_path = os.path.join(output_dir, "去背景结果.zip")
+            with open(zip_path, "wb") as out:
+                write_zip(result_paths, out)
             st.download_button(
                 label=_("⬇️ 下载全部去背景结果（zip包）"),
-                data=zip_buffer,
+                data=deferred_file(zip_path),
                 file_name="去背景结果.zip",
                 mime="application/zip",
                 use_container_width=True
@@ -415,7 +525,10 @@ with tabs[6]:
     rfp = st.session_state.get("result_file_paths", [])
     if rfp:
         for p in rfp[:6]:
-            if os.path.exists(p):
+            # 单文件模式在内存中处理，记录的是(文件名, 输出字节)
+            if isinstance(p, tuple):
+                st.image(p[1], caption=p[0], width=160)
+            elif os.path.exists(p):
                 st.image(p, caption=os.path.basename(p), width=160)
             else:
                 st.warning(f"{p} 文件不存在，可能已被删除")
@@ -0,0 +1,80 @@
+import os
+import time
+import zipfile
+
+# 已压缩格式直接存储，再DEFLATE只会浪费CPU
+STORED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
+CHUNK_SIZE = 1024 * 1024
+
+class _ChunkBuffer:
+    # zipfile写入的不可seek目标：暂存写出的字节，由生成器按块取走，内存占用与单块大小相当
+    def __init__(self):
+        self.chunks = []
+        self.pending = 0
+        self.offset = 0
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.pending += len(data)
+        self.offset += len(data)
+        return len(data)
+    def tell(self):
+        return self.offset
+    def flush(self):
+        pass
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        self.pending = 0
+        return data
+
+def _entry_info(entry):
+    # 条目可以是文件路径，或(包内文件名, 路径/bytes)
+    if isinstance(entry, (tuple, list)):
+        arcname, source = entry
+    else:
+        arcname, source = os.path.basename(entry), entry
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+        size = len(source)
+    else:
+        info = zipfile.ZipInfo.from_file(source, arcname)
+        size = os.path.getsize(source)
+    ext = os.path.splitext(arcname)[1].lower()
+    info.compress_type = zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+    return info, source, size
+
+def iter_zip(entries, chunk_size=CHUNK_SIZE):
+    # 边处理边打包：entries可以是逐个产出结果的生成器，zip数据按块产出，不在内存中拼整个压缩包
+    buf = _ChunkBuffer()
+    with zipfile.ZipFile(buf, "w", allowZip64=True) as zipf:
+        for entry in entries:
+            info, source, size = _entry_info(entry)
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                with zipf.open(info, "w", force_zip64=size > zipfile.ZIP64_LIMIT) as dest:
+                    view = memoryview(source)
+                    for start in range(0, size, chunk_size):
+                        dest.write(view[start:start + chunk_size])
+                        if buf.pending >= chunk_size:
+                            yield buf.drain()
+            else:
+                with open(source, "rb") as src, zipf.open(info, "w", force_zip64=size > zipfile.ZIP64_LIMIT) as dest:
+                    while True:
+                        block = src.read(chunk_size)
+                        if not block:
+                            break
+                        dest.write(block)
+                        if buf.pending >= chunk_size:
+                            yield buf.drain()
+            if buf.pending:
+                yield buf.drain()
+    tail = buf.drain()
+    if tail:
+        yield tail
+
+def write_zip(entries, fileobj, chunk_size=CHUNK_SIZE):
+    # 流式写入已打开的文件/socket等对象，返回写出的总字节数
+    total = 0
+    for chunk in iter_zip(entries, chunk_size):
+        fileobj.write(chunk)
+        total += len(chunk)
+    return total
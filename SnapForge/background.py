@@ -0,0 +1,90 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+from PIL import Image, ImageOps
+
+# 模型与线程数可用环境变量配置；模型留空时使用rembg的默认模型，线程数为0时由onnxruntime自行决定
+DEFAULT_MODEL = os.environ.get("SNAPFORGE_REMBG_MODEL") or None
+INTRA_OP_THREADS = int(os.environ.get("SNAPFORGE_REMBG_INTRA_THREADS", 0))
+INTER_OP_THREADS = int(os.environ.get("SNAPFORGE_REMBG_INTER_THREADS", 0))
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(model=None, intra_op_threads=None, inter_op_threads=None):
+    # 每种(模型, 线程配置)在进程内只创建一次ONNX会话并长期复用；会话的推理可被多个线程同时调用。
+    # rembg会加载onnxruntime和模型，首次使用时才导入
+    model = model or DEFAULT_MODEL
+    intra = INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads
+    inter = INTER_OP_THREADS if inter_op_threads is None else inter_op_threads
+    key = (model, intra, inter)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            import onnxruntime as ort
+            from rembg import new_session
+            opts = ort.SessionOptions()
+            opts.intra_op_num_threads = intra
+            opts.inter_op_num_threads = inter
+            session = new_session(model, sess_opts=opts) if model else new_session(sess_opts=opts)
+            _sessions[key] = session
+        return session
+
+def cutout(img, session=None, mask_size=None):
+    # mask_size：大图先缩小到该边长求蒙版，再把蒙版放大回原尺寸作为透明通道，原图像素不经过模型
+    from rembg import remove
+    session = session or get_session()
+    if mask_size and max(img.size) > mask_size:
+        img = ImageOps.exif_transpose(img)
+        small = img.copy()
+        small.thumbnail((mask_size, mask_size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+        mask = remove(small, session=session, only_mask=True).convert("L")
+        result = img.convert("RGBA")
+        result.putalpha(mask.resize(img.size, Image.Resampling.BILINEAR))
+        return result
+    return remove(img, session=session)
+
+def remove_background(image_path, output_path=None, model=None, mask_size=None):
+    with Image.open(image_path) as img:
+        result = cutout(img, get_session(model), mask_size)
+        if output_path:
+            result.save(output_path)
+        return result
+
+def _load(path):
+    img = Image.open(path)
+    img.load()
+    return img
+
+def remove_backgrounds(image_paths, output_paths, model=None, mask_size=None, prefetch=2, io_workers=2):
+    # 批量去背景：后台线程提前解码后续图片、并行保存已完成的结果，推理在当前线程串行使用同一个会话。
+    # 按输入顺序逐个产出(源路径, 输出路径, 错误)，成功时错误为None
+    session = get_session(model)
+    jobs = iter(zip(image_paths, output_paths))
+    with ThreadPoolExecutor(max_workers=io_workers) as io_pool:
+        loads, saves = deque(), deque()
+        def submit_load():
+            job = next(jobs, None)
+            if job:
+                loads.append((job, io_pool.submit(_load, job[0])))
+        for _ in range(max(prefetch, 1)):
+            submit_load()
+        while loads:
+            (src, dst), future = loads.popleft()
+            submit_load()
+            try:
+                result = cutout(future.result(), session, mask_size)
+                saves.append((src, dst, io_pool.submit(result.save, dst)))
+            except Exception as e:
+                saves.append((src, dst, e))
+            while len(saves) > prefetch or (saves and not loads):
+                src, dst, pending = saves.popleft()
+                if isinstance(pending, Exception):
+                    yield src, None, pending
+                    continue
+                try:
+                    pending.result()
+                    yield src, dst, None
+                except Exception as e:
+                    yield src, None, e
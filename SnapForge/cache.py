@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+class ResultCache:
+    # 按内容寻址的磁盘结果缓存：key = 源文件字节哈希 + 处理参数的规范化哈希，超过容量按最近使用时间淘汰
+    def __init__(self, root, max_bytes=1024 * 1024 * 1024):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._size = self._scan_size()
+    def __getstate__(self):
+        # 进程池传参时锁对象不可序列化
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+    @staticmethod
+    def digest_bytes(data):
+        return hashlib.sha256(data).hexdigest()
+    @staticmethod
+    def digest_file(path, chunk_size=1024 * 1024):
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(chunk_size), b""):
+                h.update(block)
+        return h.hexdigest()
+    @staticmethod
+    def make_key(source_digest, params):
+        # 参数按键排序后序列化，保证同样的设置总能得到同一个key
+        canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(f"{source_digest}:{canonical}".encode("utf-8")).hexdigest()
+    def _path(self, key, suffix=""):
+        return os.path.join(self.root, key[:2], key + suffix)
+    def get(self, key, suffix=""):
+        # 命中返回缓存文件路径，并刷新修改时间作为LRU依据
+        path = self._path(key, suffix)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+    def get_bytes(self, key, suffix=""):
+        path = self.get(key, suffix)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+    def put_file(self, key, src_path, suffix=""):
+        with open(src_path, "rb") as src:
+            return self._store(key, suffix, lambda out: shutil.copyfileobj(src, out))
+    def put_bytes(self, key, data, suffix=""):
+        return self._store(key, suffix, lambda out: out.write(data))
+    def _store(self, key, suffix, writer):
+        path = self._path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再原子替换，并发写同一个key或读到半个文件都不会出问题
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                writer(out)
+            size = os.path.getsize(temp_path)
+            # 覆盖已有条目时只计大小之差，否则累计值只增不减，会提前触发淘汰
+            try:
+                size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self.track(size)
+        return path
+    def track(self, size):
+        # 累计占用增加size字节，超出容量时淘汰；工作进程持有的是副本，其写入的条目由父进程调用补记
+        with self._lock:
+            self._size += size
+            over = self._size > self.max_bytes
+        if over:
+            self._evict()
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+    def stats(self):
+        # 占用取增量维护的计数，不遍历目录；只在构造和淘汰时按磁盘重新统计
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "bytes": self._size, "max_bytes": self.max_bytes,
+        }
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+    def _evict(self):
+        # 重新扫描目录（其他进程也可能写入），从最久未使用的开始删到容量的90%
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._size = total
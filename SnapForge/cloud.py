@@ -0,0 +1,268 @@
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
+import os
+import random
+import threading
+import time
+from PIL import Image, ImageOps
+
+DEEPSEEK_ENDPOINT = "https://api.deepseek.com/v1/vision/detect"
+# 允许的自定义地址(逗号分隔)，例如内网网关或本地模拟服务；不在列表中的地址一律回退到官方地址
+ALLOWED_ENDPOINTS = [DEEPSEEK_ENDPOINT] + [
+    e.strip() for e in os.environ.get("SNAPFORGE_DEEPSEEK_ENDPOINTS", "").split(",") if e.strip()
+]
+# 各服务的默认并发数和每秒请求数，可通过参数覆盖
+PROVIDER_LIMITS = {
+    "baidu": {"concurrency": 2, "rate": 2.0},
+    "deepseek": {"concurrency": 16, "rate": 50.0},
+}
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+REQUEST_TIMEOUT = 15
+# 百度：18为QPS超限，SDK108为超时，可重试；其余错误码直接返回
+BAIDU_RETRY_CODES = {18, "18", "SDK108"}
+# 上传前缩图：最长边、JPEG质量和单张字节预算，识别标签对这个尺寸已足够；最长边为0时上传原图
+UPLOAD_MAX_SIDE = int(os.environ.get("SNAPFORGE_UPLOAD_MAX_SIDE", 1024))
+UPLOAD_QUALITY = int(os.environ.get("SNAPFORGE_UPLOAD_QUALITY", 85))
+UPLOAD_MAX_BYTES = int(os.environ.get("SNAPFORGE_UPLOAD_MAX_BYTES", 200 * 1024))
+UPLOAD_MIN_QUALITY = 50
+UPLOAD_VERSION = 1
+
+class TokenBucket:
+    # 令牌桶限速：每秒补充rate个令牌，最多积攒capacity个，允许短时突发
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+    def set_rate(self, rate, capacity=None):
+        with self.lock:
+            self.rate = rate
+            self.capacity = capacity or max(1.0, rate)
+            self.tokens = min(self.tokens, self.capacity)
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def provider_bucket(provider, identity, rate):
+    # 每个服务(及账号/地址)在进程内共用一个令牌桶：多批识别同时进行(如多个Streamlit会话)时限速不叠加
+    with _buckets_lock:
+        bucket = _buckets.get((provider, identity))
+        if bucket is None:
+            bucket = _buckets[(provider, identity)] = TokenBucket(rate)
+        elif bucket.rate != rate:
+            bucket.set_rate(rate)
+        return bucket
+
+class RetryableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _backoff(attempt, retry_after=None):
+    # 指数退避加随机抖动；服务端给出Retry-After时以其为准
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX)
+    return min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)) * (0.5 + random.random() / 2)
+
+def _with_retries(call, retries):
+    for attempt in range(retries + 1):
+        try:
+            return call()
+        except RetryableError as e:
+            if attempt == retries:
+                raise
+            time.sleep(_backoff(attempt, e.retry_after))
+
+def _pooled_session(concurrency):
+    # 所有工作线程共用一个长连接会话，连接池大小与并发数一致
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+class UploadStats:
+    # 统计一批识别实际上传的字节数：original为原文件大小，uploaded为缩图后发出的大小
+    def __init__(self):
+        self.images = 0
+        self.cached = 0
+        self.original_bytes = 0
+        self.uploaded_bytes = 0
+        self._lock = threading.Lock()
+    def record(self, original, uploaded):
+        with self._lock:
+            self.images += 1
+            self.original_bytes += original
+            self.uploaded_bytes += uploaded
+    def record_cached(self):
+        with self._lock:
+            self.cached += 1
+    def stats(self):
+        saved = self.original_bytes - self.uploaded_bytes
+        return {
+            "images": self.images, "cached": self.cached,
+            "original_bytes": self.original_bytes, "uploaded_bytes": self.uploaded_bytes,
+            "saved_bytes": saved, "saved_ratio": saved / self.original_bytes if self.original_bytes else 0.0,
+        }
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def shrink_for_upload(data, max_side=UPLOAD_MAX_SIDE, quality=UPLOAD_QUALITY, max_bytes=UPLOAD_MAX_BYTES):
+    # 缩到最长边max_side并重新编码为JPEG，超出字节预算时逐步降低质量、再继续缩小；
+    # 已经足够小的图片或无法解码的文件原样上传
+    if not max_side or (max_bytes and len(data) <= max_bytes):
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            # JPEG在解码阶段直接按1/2、1/4、1/8缩小，大图不必完整解码
+            img.draft("RGB", (max_side, max_side))
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ("RGBA", "LA", "P"):
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel("A"))
+                img = background
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS, reducing_gap=2.0)
+            while True:
+                for q in range(quality, UPLOAD_MIN_QUALITY - 1, -10):
+                    buf = io.BytesIO()
+                    img.save(buf, format="JPEG", quality=q, optimize=True)
+                    if not max_bytes or buf.tell() <= max_bytes:
+                        break
+                if not max_bytes or buf.tell() <= max_bytes or max(img.size) <= 256:
+                    break
+                img = img.resize((max(1, img.width * 3 // 4), max(1, img.height * 3 // 4)), Image.Resampling.LANCZOS)
+    except Exception:
+        return data
+    return buf.getvalue() if buf.tell() < len(data) else data
+
+def _recognize_all(file_paths, provider, identity, request, concurrency, rate, retries, cache,
+                   max_side, quality, max_bytes, stats):
+    # 通用并发框架：读文件 -> 查缓存 -> 缩图 -> 限速 -> 带重试的请求 -> 写缓存；返回{路径: 标签}，顺序与输入一致。
+    # 缩图在各工作线程中并行进行，缩好的图也按源文件哈希缓存，换服务商或重试失败的图片时不必再缩
+    bucket = provider_bucket(provider, identity, rate)
+    stats = stats if stats is not None else UploadStats()
+    upload = {"max_side": max_side, "quality": quality, "max_bytes": max_bytes, "version": UPLOAD_VERSION}
+    def prepare(data, digest):
+        if cache is None:
+            return shrink_for_upload(data, max_side, quality, max_bytes)
+        key = cache.make_key(digest, dict(upload, task="upload"))
+        payload = cache.get_bytes(key, ".jpg")
+        if payload is None:
+            payload = shrink_for_upload(data, max_side, quality, max_bytes)
+            if payload is not data:
+                cache.put_bytes(key, payload, ".jpg")
+        return payload
+    def work(path):
+        try:
+            data = _read(path)
+            key = digest = None
+            if cache is not None:
+                digest = cache.digest_bytes(data)
+                key = cache.make_key(digest, {"task": "recognize", "provider": provider, "identity": identity, "upload": upload})
+                cached = cache.get_bytes(key, ".json")
+                cache.record(cached is not None)
+                if cached is not None:
+                    stats.record_cached()
+                    return json.loads(cached.decode("utf-8"))
+            payload = prepare(data, digest)
+            stats.record(len(data), len(payload))
+            def call():
+                bucket.acquire()
+                return request(payload)
+            tags = _with_retries(call, retries) or ["未识别"]
+            if key:
+                cache.put_bytes(key, json.dumps(tags, ensure_ascii=False).encode("utf-8"), ".json")
+            return tags
+        except Exception as e:
+            return [f"调用失败: {e}"]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return dict(zip(file_paths, pool.map(work, file_paths)))
+
+def ai_image_recognition_cloud(file_paths, provider="baidu", **provider_kwargs):
+    if provider == "baidu":
+        return ai_recognition_baidu(file_paths, **provider_kwargs)
+    elif provider == "deepseek":
+        return ai_recognition_deepseek(file_paths, **provider_kwargs)
+    else:
+        return {path: ["未实现"] for path in file_paths}
+
+def ai_recognition_baidu(file_paths, app_id=None, api_key=None, secret_key=None, concurrency=None, rate=None,
+                         retries=MAX_RETRIES, cache=None, max_side=UPLOAD_MAX_SIDE, quality=UPLOAD_QUALITY,
+                         max_bytes=UPLOAD_MAX_BYTES, stats=None, **kwargs):
+    try:
+        from aip import AipImageClassify
+    except ImportError:
+        raise Exception("请先 pip install baidu-aip")
+    if not app_id or not api_key or not secret_key:
+        return {path: ["缺少API参数"] for path in file_paths}
+    limits = PROVIDER_LIMITS["baidu"]
+    concurrency = concurrency or limits["concurrency"]
+    client = AipImageClassify(app_id, api_key, secret_key)
+    # SDK内部已有会话，换上与并发数匹配的连接池
+    client.s = _pooled_session(concurrency)
+    def request(data):
+        res = client.advancedGeneral(data)
+        if res.get("error_code") in BAIDU_RETRY_CODES:
+            raise RetryableError(res.get("error_msg", "请求过于频繁"))
+        if "error_code" in res:
+            raise Exception(res.get("error_msg", res["error_code"]))
+        return [item['keyword'] for item in res.get('result', [])]
+    return _recognize_all(file_paths, "baidu", app_id, request, concurrency, rate or limits["rate"], retries, cache,
+                          max_side, quality, max_bytes, stats)
+
+def ai_recognition_deepseek(file_paths, api_key=None, endpoint=None, concurrency=None, rate=None,
+                            retries=MAX_RETRIES, cache=None, max_side=UPLOAD_MAX_SIDE, quality=UPLOAD_QUALITY,
+                            max_bytes=UPLOAD_MAX_BYTES, stats=None, **kwargs):
+    import requests
+    if not api_key:
+        return {path: ["缺少API参数"] for path in file_paths}
+    limits = PROVIDER_LIMITS["deepseek"]
+    concurrency = concurrency or limits["concurrency"]
+    url = endpoint if endpoint in ALLOWED_ENDPOINTS else DEEPSEEK_ENDPOINT
+    session = _pooled_session(concurrency)
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/octet-stream"
+    }
+    def request(data):
+        try:
+            response = session.post(url, data=data, headers=headers, timeout=REQUEST_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise RetryableError(str(e))
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = response.headers.get("Retry-After")
+            raise RetryableError(f"HTTP {response.status_code}", float(retry_after) if retry_after and retry_after.isdigit() else None)
+        response.raise_for_status()
+        res = response.json()
+        if "labels" in res:
+            return res["labels"]
+        elif "result" in res:
+            return [item.get("label", "") for item in res["result"]]
+        return ["未识别"]
+    try:
+        return _recognize_all(file_paths, "deepseek", url, request, concurrency, rate or limits["rate"], retries, cache,
+                              max_side, quality, max_bytes, stats)
+    finally:
+        session.close()
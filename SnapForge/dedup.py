@@ -0,0 +1,23 @@
+from hashindex import cluster_near_duplicates, group_near_duplicates
+from hashing import HASH_VERSION, hash_images
+
+def find_duplicate_images(file_paths, threshold=8, store=None, algorithm="phash", workers=None, grouping="greedy"):
+    # store为HashStore时，未变化或内容相同的文件直接复用已存哈希，只对新文件解码计算；
+    # 新文件批量缩小解码、向量化计算哈希，workers>1时分进程解码
+    tag = f"{algorithm}:v{HASH_VERSION}"
+    known, pending = store.lookup(file_paths, tag) if store is not None else ({}, [(path, None, None, None) for path in file_paths])
+    valid, values = hash_images([item[0] for item in pending], (algorithm,), workers=workers)
+    computed = []
+    for item, ok, value in zip(pending, valid.tolist(), values[algorithm].tolist()):
+        if ok:
+            known[item[0]] = value
+            computed.append(item + (value,))
+    if store is not None:
+        store.store(computed, tag)
+    hashes = {path: known[path] for path in file_paths if path in known}
+    # 多索引哈希做阈值查询，避免O(n²)两两比较；greedy为逐个取组首的原有分组，cluster为并查集连通分组
+    if grouping == "cluster":
+        return cluster_near_duplicates(list(hashes.items()), threshold, workers)
+    if grouping == "greedy":
+        return group_near_duplicates(list(hashes.items()), threshold, workers)
+    raise ValueError(f"未知的分组方式: {grouping}")
@@ -0,0 +1,240 @@
+import io
+import math
+import os
+import threading
+import time
+from PIL import Image
+
+# 每张图编码调优(质量搜索、较慢的压缩选项)可用的CPU秒数；超出后采用已找到的最好结果
+CPU_BUDGET = float(os.environ.get("SNAPFORGE_ENCODE_CPU_BUDGET", 2.0))
+MIN_QUALITY = 10
+MAX_QUALITY = 95
+# 探针：从原图均匀取若干块全分辨率小块拼成约PROBE_PIXELS的小图，在其上搜索质量。
+# 不用整体缩小的图：JPEG/WEBP每像素字节数和压缩失真都与分辨率有关，缩小后估计偏差很大
+PROBE_PIXELS = 512 * 512
+PROBE_TILE = 128
+# 整图编码结果超出目标体积时，按实际偏差修正后重新搜索的最多次数
+MAX_FULL_ENCODES = 4
+WEBP_METHOD = 6
+SSIM_WINDOW = 8
+# 探针只是原图的一部分，SSIM目标留一点余量
+SSIM_MARGIN = 0.003
+
+class EncodeStats:
+    # 统计一批输出的字节数：original为源文件大小，encoded为最终输出大小
+    def __init__(self):
+        self.images = 0
+        self.original_bytes = 0
+        self.encoded_bytes = 0
+        self._lock = threading.Lock()
+    def record(self, original, encoded):
+        with self._lock:
+            self.images += 1
+            self.original_bytes += original
+            self.encoded_bytes += encoded
+    def stats(self):
+        saved = self.original_bytes - self.encoded_bytes
+        return {
+            "images": self.images, "original_bytes": self.original_bytes, "encoded_bytes": self.encoded_bytes,
+            "saved_bytes": saved, "saved_ratio": saved / self.original_bytes if self.original_bytes else 0.0,
+        }
+
+class _Budget:
+    def __init__(self, seconds):
+        self.deadline = time.thread_time() + seconds
+    def remaining(self):
+        return self.deadline - time.thread_time()
+
+def _encode(img, params):
+    buf = io.BytesIO()
+    img.save(buf, **params)
+    return buf.getvalue()
+
+def _timed_encode(img, params):
+    start = time.thread_time()
+    data = _encode(img, params)
+    return data, time.thread_time() - start
+
+def make_probe(img):
+    # 返回(探针图, 原图像素数/探针像素数)；小图直接用原图
+    if img.width * img.height <= 2 * PROBE_PIXELS:
+        return img, 1.0
+    grid = max(1, math.isqrt(PROBE_PIXELS) // PROBE_TILE)
+    # 小块边长对齐到16，与JPEG的MCU边界重合，拼接处不额外增加编码代价
+    tile_w = max(16, min(PROBE_TILE, img.width // grid) // 16 * 16)
+    tile_h = max(16, min(PROBE_TILE, img.height // grid) // 16 * 16)
+    probe = Image.new(img.mode, (tile_w * grid, tile_h * grid))
+    for gy in range(grid):
+        for gx in range(grid):
+            x = gx * img.width // grid + (img.width // grid - tile_w) // 2
+            y = gy * img.height // grid + (img.height // grid - tile_h) // 2
+            probe.paste(img.crop((x, y, x + tile_w, y + tile_h)), (gx * tile_w, gy * tile_h))
+    return probe, img.width * img.height / (probe.width * probe.height)
+
+def ssim(a, b, window=SSIM_WINDOW):
+    # 灰度SSIM，window x window均匀窗口，用积分图求各窗口的均值与方差
+    import numpy as np
+    a = np.asarray(a.convert("L"), dtype=np.float64)
+    b = np.asarray(b.convert("L"), dtype=np.float64)
+    if min(a.shape) < window:
+        window = min(a.shape)
+    def mean(x):
+        s = np.zeros((x.shape[0] + 1, x.shape[1] + 1))
+        s[1:, 1:] = x.cumsum(0).cumsum(1)
+        w = window
+        return (s[w:, w:] - s[:-w, w:] - s[w:, :-w] + s[:-w, :-w]) / (w * w)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mu_a, mu_b = mean(a), mean(b)
+    var_a = mean(a * a) - mu_a ** 2
+    var_b = mean(b * b) - mu_b ** 2
+    cov = mean(a * b) - mu_a * mu_b
+    value = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(value.mean())
+
+def _bisect(lo, hi, ok, budget):
+    # ok(q)随q单调：返回[lo, hi]内最大的满足ok的q，都不满足返回None；预算用尽时返回已确认的最好值
+    best = None
+    while lo <= hi:
+        if best is not None and budget.remaining() <= 0:
+            break
+        q = (lo + hi) // 2
+        if ok(q):
+            best, lo = q, q + 1
+        else:
+            hi = q - 1
+    return best
+
+class _QualitySearch:
+    # 在探针上按质量编码并缓存结果：字节数按像素比例放大估计整图体积，SSIM与探针原图比较
+    def __init__(self, img, params, budget):
+        self.probe, self.scale = make_probe(img)
+        # 元数据不随像素数增长，估计时单独加上
+        self.overhead = len(params.get("exif") or b"")
+        self.params = {k: v for k, v in params.items() if k != "exif"}
+        self.budget = budget
+        self.cache = {}
+    def encode(self, q):
+        if q not in self.cache:
+            self.cache[q] = _encode(self.probe, dict(self.params, quality=q))
+        return self.cache[q]
+    def estimate(self, q):
+        return len(self.encode(q)) * self.scale + self.overhead
+    def for_size(self, target, hi, correction=1.0):
+        q = _bisect(MIN_QUALITY, hi, lambda q: self.estimate(q) * correction <= target, self.budget)
+        return MIN_QUALITY if q is None else q
+    def for_ssim(self, target, hi):
+        # SSIM随质量升高：求满足目标的最低质量，即对-q求最大
+        if self.scale > 1:
+            target = min(1.0, target + SSIM_MARGIN)
+        def ok(q):
+            with Image.open(io.BytesIO(self.encode(q))) as decoded:
+                return ssim(self.probe, decoded) >= target
+        q = _bisect(-hi, -MIN_QUALITY, lambda nq: ok(-nq), self.budget)
+        return hi if q is None else -q
+
+def _lossy(img, params, options, budget):
+    # JPEG/WEBP：质量由目标体积/目标SSIM搜索得出，给定quality时作为上限
+    target_size = options.get("target_size")
+    target_ssim = options.get("target_ssim")
+    cap = params.get("quality") or MAX_QUALITY
+    if not target_size and not target_ssim:
+        return _encode(img, params)
+    search = _QualitySearch(img, params, budget)
+    q = cap
+    if target_ssim:
+        q = search.for_ssim(target_ssim, cap)
+    if target_size:
+        # 体积是硬约束：与SSIM目标冲突时以体积为准
+        q = min(q, search.for_size(target_size, cap))
+    data = _encode(img, dict(params, quality=q))
+    encodes = 1
+    while target_size and len(data) > target_size and q > MIN_QUALITY and encodes < MAX_FULL_ENCODES:
+        if budget.remaining() <= 0:
+            break
+        # 探针估计偏小：按整图实际体积修正比例，在更低的质量里重新搜索
+        correction = len(data) / search.estimate(q)
+        q = min(q - 1, search.for_size(target_size, q - 1, correction))
+        data = _encode(img, dict(params, quality=q))
+        encodes += 1
+    return data
+
+def _webp(img, params, options, budget):
+    params = dict(params)
+    method = options.get("method", WEBP_METHOD)
+    probe, scale = make_probe(img)
+    if method > 4:
+        # 慢速档按探针耗时估算整图耗时，预算内才用
+        _, seconds = _timed_encode(probe, dict(params, method=method))
+        if seconds * scale > budget.remaining():
+            method = 4
+    params["method"] = method
+    lossless = options.get("lossless", "auto")
+    if lossless == "auto":
+        # 颜色很少的图(截图、图标、图表)无损往往更小；在探针上比较两种方式的体积
+        lossless = False
+        if img.getcolors(256) is not None:
+            lossy_probe = _encode(probe, params)
+            lossless = len(_encode(probe, dict(params, lossless=True))) <= len(lossy_probe)
+    if lossless:
+        return _encode(img, dict(params, lossless=True))
+    return _lossy(img, params, options, budget)
+
+def to_palette(img, colors):
+    # 不超过256种颜色时无损转为调色板图，透明度写入调色板的tRNS
+    import numpy as np
+    bands = len(img.getbands())
+    pixels = np.asarray(img).reshape(img.height, img.width, bands)
+    codes = np.zeros((img.height, img.width), dtype=np.uint32)
+    for band in range(bands):
+        codes |= pixels[:, :, band].astype(np.uint32) << (8 * band)
+    entries = sorted(sum(int(v) << (8 * band) for band, v in enumerate(c if bands > 1 else (c,))) for _, c in colors)
+    table = np.array(entries, dtype=np.uint32)
+    index = np.searchsorted(table, codes).astype(np.uint8)
+    out = Image.frombytes("P", img.size, index.tobytes())
+    values = [[(code >> (8 * band)) & 255 for band in range(bands)] for code in entries]
+    colour = 1 if img.mode in ("L", "LA") else 3
+    palette = []
+    for value in values:
+        palette += value[:1] * 3 if colour == 1 else value[:3]
+    out.putpalette(palette)
+    if "A" in img.getbands():
+        out.info["transparency"] = bytes(value[-1] for value in values)
+    return out
+
+def _png(img, params, options, budget):
+    params = dict(params)
+    if options.get("palette", True) and img.mode in ("L", "LA", "RGB", "RGBA"):
+        colors = img.getcolors(256)
+        # 灰度图转调色板只有在不超过16级时才能降低位深
+        if colors is not None and not (img.mode == "L" and len(colors) > 16):
+            img = to_palette(img, colors)
+    if options.get("optimize", True):
+        probe, scale = make_probe(img)
+        _, seconds = _timed_encode(probe, dict(params, optimize=True))
+        if seconds * scale <= budget.remaining():
+            params["optimize"] = True
+    return _encode(img, params)
+
+def encode_image(img, dest_path, save_params, options):
+    # 按目标格式调优编码并写出(dest_path也可以是可写文件对象，此时save_params须含format)，返回输出字节数。options:
+    # target_size(字节)、target_ssim(0~1)、optimize/progressive(JPEG、PNG)、method/lossless(WEBP)、
+    # palette(PNG无损转调色板)、cpu_budget(秒)
+    fmt = save_params.get("format") or Image.registered_extensions().get(os.path.splitext(dest_path)[1].lower())
+    budget = _Budget(options.get("cpu_budget", CPU_BUDGET))
+    params = dict(save_params, format=fmt)
+    if fmt == "JPEG":
+        params["optimize"] = options.get("optimize", True)
+        params["progressive"] = options.get("progressive", True)
+        data = _lossy(img, params, options, budget)
+    elif fmt == "WEBP":
+        data = _webp(img, params, options, budget)
+    elif fmt == "PNG":
+        data = _png(img, params, options, budget)
+    else:
+        data = _encode(img, params)
+    if hasattr(dest_path, "write"):
+        dest_path.write(data)
+    else:
+        with open(dest_path, "wb") as f:
+            f.write(data)
+    return len(data)
@@ -0,0 +1,239 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageFilter
+
+CONTRAST_FACTOR = 1.5
+# 滤镜输出变化时递增(2：卷积不再作用于透明通道)，使带滤镜的处理结果缓存失效
+FILTER_VERSION = 2
+# 图片像素数达到THREAD_PIXELS时卷积按行块多线程执行(NumPy与Pillow计算期间都会释放GIL)
+FILTER_WORKERS = int(os.environ.get("SNAPFORGE_FILTER_WORKERS", min(8, os.cpu_count() or 1)))
+THREAD_PIXELS = 2 * 1024 * 1024
+# 卷积每次处理的行数，int16中间结果能留在CPU缓存里
+BLOCK_ROWS = 32
+# 逐像素滤镜：连续出现时合并成一张查找表，一次point完成
+POINT_FILTERS = ("brightness", "contrast", "grayscale")
+# Pillow内置卷积核(SHARPEN/BLUR/CONTOUR/EMBOSS/FIND_EDGES)的NumPy整数实现，取值与Pillow逐像素一致；值为卷积半径
+KERNELS = {"sharpen": 1, "blur": 2, "contour": 1, "emboss": 1, "edge": 1}
+# 带参数的滤镜：参数名与默认值，按顺序对应"名称:参数1:参数2"写法
+PARAMS = {
+    "brightness": (("factor", 1.2),),
+    "contrast": (("factor", CONTRAST_FACTOR),),
+    "gaussian": (("radius", 2.0),),
+    "unsharp": (("radius", 2.0), ("amount", 150), ("threshold", 3)),
+}
+ALIASES = {"enhance": "contrast"}
+
+def parse_chain(filter_type):
+    # filter_type可以是单个滤镜名、逗号分隔的字符串("sharpen,gaussian:3")或列表，
+    # 列表项为滤镜名或{"type": 名称, 参数名: 值}；返回[(名称, 参数元组)]
+    if not filter_type:
+        return []
+    if isinstance(filter_type, str):
+        items = [s.strip() for s in filter_type.split(",") if s.strip()]
+    elif isinstance(filter_type, dict):
+        items = [filter_type]
+    else:
+        items = list(filter_type)
+    steps = []
+    for item in items:
+        if isinstance(item, dict):
+            name, given, args = item.get("type"), item, ()
+        else:
+            name, *args = str(item).split(":")
+            given = {}
+        name = ALIASES.get(name, name)
+        if name not in POINT_FILTERS and name not in KERNELS and name not in PARAMS:
+            raise ValueError(f"未知滤镜: {name}")
+        spec = PARAMS.get(name, ())
+        if len(args) > len(spec):
+            raise ValueError(f"滤镜参数过多: {item}")
+        params = []
+        for i, (key, default) in enumerate(spec):
+            value = args[i] if i < len(args) else given.get(key, default)
+            params.append(type(default)(float(value)))
+        steps.append((name, tuple(params)))
+    return steps
+
+def is_grayscale(filter_type):
+    return parse_chain(filter_type) == [("grayscale", ())]
+
+def contrast_steps(filter_type):
+    # 对比度以当前图片的平均亮度为中心；分块处理时这些步骤需先整幅预扫描求均值
+    return [i for i, (name, _) in enumerate(parse_chain(filter_type)) if name == "contrast"]
+
+def _halo(name, params):
+    if name in KERNELS:
+        return KERNELS[name]
+    if name in ("gaussian", "unsharp"):
+        # Pillow的高斯模糊为三次盒式模糊，每次半径不超过ceil(radius)
+        return 3 * (math.ceil(params[0]) + 1)
+    return 0
+
+def chain_halo(filter_type):
+    # 条带上下各需多算的行数，保证与整幅处理结果一致
+    return sum(_halo(name, params) for name, params in parse_chain(filter_type))
+
+def _blend_lut(base, factor):
+    # 与Image.blend(纯色图, 原图, factor)逐像素一致：float32计算后截断取整
+    import numpy as np
+    values = np.float32(base) + np.float32(factor) * (np.arange(256, dtype=np.float32) - np.float32(base))
+    return np.clip(values, 0, 255).astype(np.uint8)
+
+def _point_table(img, lut):
+    # 颜色通道查表，透明通道保持不变
+    table = lut.tolist()
+    return table * (len(img.getbands()) - 1) + list(range(256)) if "A" in img.getbands() else table * len(img.getbands())
+
+def _mean_luminance(img, lut, identity):
+    # 与ImageEnhance.Contrast相同：取灰度图的平均值并四舍五入
+    if img.mode in ("L", "LA"):
+        hist = img.histogram()[:256]
+        total = sum(int(lut[v]) * h for v, h in enumerate(hist))
+    else:
+        src = img if identity else img.point(_point_table(img, lut))
+        hist = src.convert("L").histogram()
+        total = sum(v * h for v, h in enumerate(hist))
+    return int(total / max(1, sum(hist)) + 0.5)
+
+def _apply_point(img, group, means):
+    # 一组连续的亮度/对比度合成一张查找表；遇到灰度时先查表再转灰度，灰度只出现在组尾
+    import numpy as np
+    lut = np.arange(256, dtype=np.uint8)
+    identity = True
+    for index, name, params in group:
+        if name == "grayscale":
+            if not identity:
+                img = img.point(_point_table(img, lut))
+            return img.convert({"RGB": "L", "RGBA": "LA"}.get(img.mode, img.mode))
+        if name == "contrast":
+            mean = means.get(index)
+            if mean is None:
+                mean = _mean_luminance(img, lut, identity)
+            lut = _blend_lut(mean, params[0])[lut]
+        else:
+            lut = _blend_lut(0, params[0])[lut]
+        identity = False
+    return img if identity else img.point(_point_table(img, lut))
+
+def _box_sum(x, r):
+    # (2r+1)x(2r+1)窗口求和，先横向再纵向；结果比x每边小r
+    width, height = x.shape[1] - 2 * r, x.shape[0] - 2 * r
+    rows = x[:, :width].copy()
+    for i in range(1, 2 * r + 1):
+        rows += x[:, i:i + width]
+    total = rows[:height].copy()
+    for i in range(1, 2 * r + 1):
+        total += rows[i:i + height]
+    return total
+
+def _convolve(name, x):
+    # x为带r行/列边距的int16块；Pillow取整方式为floor(v+0.5)，卷积核第一行对应下一行像素
+    import numpy as np
+    if name == "blur":
+        ring = _box_sum(x, 2)
+        ring -= _box_sum(x[1:-1, 1:-1], 1)
+        ring += 8
+        ring >>= 4
+        return ring
+    centre = x[1:-1, 1:-1]
+    if name == "emboss":
+        return centre + (128 - x[2:, :-2])
+    total = _box_sum(x, 1)
+    if name == "sharpen":
+        # (32c - 2*八邻域)/16 = (17c - 九宫格和)/8
+        total -= centre * np.int16(17)
+        total -= 4
+        np.negative(total, out=total)
+        total >>= 3
+        return total
+    np.negative(total, out=total)
+    total += centre * np.int16(9)
+    if name == "contour":
+        total += 255
+    return total
+
+def _map_blocks(func, height, block, workers):
+    ranges = [(y, min(height, y + block)) for y in range(0, height, block)]
+    if workers > 1 and len(ranges) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda r: func(*r), ranges))
+    else:
+        for y0, y1 in ranges:
+            func(y0, y1)
+
+def _workers(img, workers):
+    return workers if img.width * img.height >= THREAD_PIXELS else 1
+
+def _apply_kernel(img, name, workers):
+    # 只对颜色通道卷积，透明通道原样保留；与Pillow一样最外圈r个像素不变
+    import numpy as np
+    r = KERNELS[name]
+    src = np.asarray(img)
+    if src.ndim == 2:
+        src = src[:, :, None]
+    height, width = src.shape[:2]
+    if height <= 2 * r or width <= 2 * r:
+        return img.copy()
+    out = src.copy()
+    def run(y0, y1):
+        # 连续内存上按全部通道计算比只取颜色通道的跨步切片更快，透明通道最后整体还原
+        values = _convolve(name, src[y0:y1 + 2 * r].astype(np.int16))
+        np.clip(values, 0, 255, out=values)
+        out[y0 + r:y1 + r, r:width - r] = values
+    _map_blocks(run, height - 2 * r, BLOCK_ROWS, _workers(img, workers))
+    if "A" in img.getbands():
+        out[:, :, -1] = src[:, :, -1]
+    return Image.fromarray(out[:, :, 0] if out.shape[2] == 1 else out)
+
+def _apply_pillow(img, kernel, halo, workers):
+    # 高斯模糊/USM交给Pillow；带透明通道时只处理颜色通道。大图按带重叠的行块多线程执行
+    alpha = img.getchannel("A") if "A" in img.getbands() else None
+    colour = img.convert(img.mode[:-1]) if alpha is not None else img
+    workers = _workers(img, workers)
+    if workers > 1:
+        import numpy as np
+        src = np.asarray(colour)
+        out = np.empty_like(src)
+        height = src.shape[0]
+        def run(y0, y1):
+            a, b = max(0, y0 - halo), min(height, y1 + halo)
+            part = np.asarray(Image.fromarray(src[a:b]).filter(kernel))
+            out[y0:y1] = part[y0 - a:y1 - a]
+        _map_blocks(run, height, max(BLOCK_ROWS, 8 * halo, -(-height // workers)), workers)
+        result = Image.fromarray(out)
+    else:
+        result = colour.filter(kernel)
+    if alpha is not None:
+        result.putalpha(alpha)
+    return result
+
+def apply_chain(img, filter_type, means=None, stop=None, workers=None):
+    # 依次执行滤镜链：连续的逐像素滤镜合并查表，卷积只作用于颜色通道。
+    # means为预先求得的对比度中心({步骤序号: 均值})，stop表示只执行前stop步(分块预扫描用)
+    steps = parse_chain(filter_type)[:stop]
+    means = means or {}
+    workers = FILTER_WORKERS if workers is None else workers
+    if steps and img.mode not in ("L", "LA", "RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+    i = 0
+    while i < len(steps):
+        name, params = steps[i]
+        if name in POINT_FILTERS:
+            group = []
+            while i < len(steps) and steps[i][0] in POINT_FILTERS:
+                group.append((i,) + steps[i])
+                i += 1
+                if group[-1][1] == "grayscale":
+                    break
+            img = _apply_point(img, group, means)
+            continue
+        if name in KERNELS:
+            img = _apply_kernel(img, name, workers)
+        elif name == "gaussian":
+            img = _apply_pillow(img, ImageFilter.GaussianBlur(params[0]), _halo(name, params), workers)
+        else:
+            kernel = ImageFilter.UnsharpMask(params[0], params[1], params[2])
+            img = _apply_pillow(img, kernel, _halo(name, params), workers)
+        i += 1
+    return img
@@ -0,0 +1,209 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from math import comb
+import multiprocessing
+import numpy as np
+
+# 单次展开的候选对上限，限制大桶(大量相同哈希)时的内存峰值
+MAX_PAIRS_PER_BLOCK = 1 << 22
+# 段位宽不超过该值时用稠密计数表定位桶，否则用二分查找
+DENSE_TABLE_BITS = 24
+# 哈希数量少于该值时不值得启动进程池
+PARALLEL_MIN_HASHES = 20000
+
+_POPCOUNT_LUT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def popcount64(values):
+    # uint64数组逐元素数1的个数；numpy<2.0没有bitwise_count时按字节查表
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _POPCOUNT_LUT[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1)
+
+def _split(bits, m):
+    # 返回每段的(移位, 位宽)，各段位宽最多相差1
+    chunks, shift = [], 0
+    for i in range(m):
+        width = bits // m + (1 if i < bits % m else 0)
+        chunks.append((shift, width))
+        shift += width
+    return chunks
+
+def _flip_masks(width, radius):
+    masks = []
+    for k in range(min(radius, width) + 1):
+        for positions in combinations(range(width), k):
+            mask = 0
+            for p in positions:
+                mask |= 1 << p
+            masks.append(mask)
+    return masks
+
+def choose_chunks(threshold, n, bits=64):
+    # 多索引哈希：哈希切成m段，距离<=threshold的两个哈希至少有一段距离<=threshold//m（抽屉原理）。
+    # 估算每个查询的代价(探测次数+候选数)选最省的m；都不如两两比较时返回空列表
+    best, best_cost = None, n
+    for m in range(1, min(threshold + 1, bits) + 1):
+        chunks = _split(bits, m)
+        radius = threshold // m
+        cost = 0
+        for _, width in chunks:
+            probes = sum(comb(width, k) for k in range(min(radius, width) + 1))
+            cost += probes + probes * n / (1 << width)
+        if cost < best_cost:
+            best, best_cost = (chunks, radius), cost
+    if best is None:
+        return []
+    chunks, radius = best
+    return [(shift, width, _flip_masks(width, radius)) for shift, width in chunks]
+
+def _expand(rows, starts, counts, order):
+    # 把每个查询命中的桶区间[start, start+count)展开成(行, 列)候选对，按块产出
+    total_counts = np.cumsum(counts)
+    begin = 0
+    while begin < len(rows):
+        base = total_counts[begin - 1] if begin else 0
+        end = int(np.searchsorted(total_counts, base + MAX_PAIRS_PER_BLOCK, side="right"))
+        end = max(end, begin + 1)
+        cnt = counts[begin:end]
+        size = int(cnt.sum())
+        offsets = np.arange(size) - np.repeat(np.cumsum(cnt) - cnt, cnt)
+        yield np.repeat(rows[begin:end], cnt), order[np.repeat(starts[begin:end], cnt) + offsets]
+        begin = end
+
+def _mask_pairs(arr, threshold, shift, width, masks):
+    # 对一段的若干翻转掩码查表，返回校验通过的候选对编码i*n+j
+    n = len(arr)
+    found = []
+    keys = (arr >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+    order = np.argsort(keys, kind="stable")
+    if width <= DENSE_TABLE_BITS:
+        keys = keys.astype(np.intp)
+        counts_table = np.bincount(keys, minlength=1 << width)
+        starts_table = np.cumsum(counts_table) - counts_table
+    else:
+        sorted_keys = keys[order]
+    for mask in masks:
+        probe = keys ^ (mask if width <= DENSE_TABLE_BITS else np.uint64(mask))
+        if width <= DENSE_TABLE_BITS:
+            starts, counts = starts_table[probe], counts_table[probe]
+        else:
+            starts = np.searchsorted(sorted_keys, probe, side="left")
+            counts = np.searchsorted(sorted_keys, probe, side="right") - starts
+        rows = np.nonzero(counts)[0]
+        for i, j in _expand(rows, starts[rows], counts[rows], order):
+            # 每对只保留i<j一次，再校验真实距离
+            keep = i < j
+            i, j = i[keep], j[keep]
+            keep = popcount64(arr[i] ^ arr[j]) <= threshold
+            if keep.any():
+                found.append(i[keep].astype(np.int64) * n + j[keep])
+    return found
+
+def _tile_pairs(arr, threshold, row_begin, row_end):
+    # 两两比较的一个行块：只算上三角，列方向再按块切分，单块内存不超过MAX_PAIRS_PER_BLOCK个距离
+    n = len(arr)
+    found = []
+    rows = np.arange(row_begin, row_end)
+    col_block = max(1, MAX_PAIRS_PER_BLOCK // max(len(rows), 1))
+    for col_begin in range(row_begin, n, col_block):
+        cols = np.arange(col_begin, min(col_begin + col_block, n))
+        dist = popcount64(arr[rows, None] ^ arr[None, cols])
+        i, j = np.nonzero(dist <= threshold)
+        i, j = rows[i], cols[j]
+        keep = i < j
+        if keep.any():
+            found.append(i[keep].astype(np.int64) * n + j[keep])
+    return found
+
+_worker_arr = None
+
+def _init_pair_worker(arr):
+    # 进程池初始化时传一次哈希数组，避免每个任务重复序列化
+    global _worker_arr
+    _worker_arr = arr
+
+def _run_pair_task(task):
+    kind, args = task
+    if kind == "mask":
+        return _mask_pairs(_worker_arr, *args)
+    return _tile_pairs(_worker_arr, *args)
+
+def _pair_tasks(n, threshold, parts):
+    # 多索引哈希按(段, 掩码子集)切任务；退化为两两比较时按行块切任务
+    chunks = choose_chunks(threshold, n)
+    tasks = []
+    if chunks:
+        for shift, width, masks in chunks:
+            step = max(1, -(-len(masks) // parts))
+            for begin in range(0, len(masks), step):
+                tasks.append(("mask", (threshold, shift, width, masks[begin:begin + step])))
+    else:
+        # 上三角每行工作量不同，按面积均分行块
+        bounds = sorted({int(n - n * ((parts - k) / parts) ** 0.5) for k in range(parts + 1)})
+        tasks = [("tile", (threshold, b, e)) for b, e in zip(bounds, bounds[1:]) if e > b]
+    return tasks
+
+def near_pairs(values, threshold, workers=None):
+    # 返回所有汉明距离<=threshold的下标对(i, j)，i<j，按(i, j)升序；workers>1时分进程计算
+    n = len(values)
+    if n < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    arr = np.asarray(values, dtype=np.uint64)
+    parallel = workers and workers > 1 and n >= PARALLEL_MIN_HASHES
+    tasks = _pair_tasks(n, threshold, workers if parallel else 1)
+    found = []
+    if parallel:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_pair_worker, initargs=(arr,)) as pool:
+            for part in pool.map(_run_pair_task, tasks):
+                found.extend(part)
+    else:
+        for kind, args in tasks:
+            found.extend(_mask_pairs(arr, *args) if kind == "mask" else _tile_pairs(arr, *args))
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    codes = np.unique(np.concatenate(found))
+    return np.stack([codes // n, codes % n], axis=1)
+
+def cluster_near_duplicates(hashes, threshold, workers=None):
+    # 并查集聚类：距离<=threshold的条目连通即归为一组(传递闭包)，结果与输入顺序无关；
+    # 组内按输入顺序排列，组按首个成员的位置排序
+    pairs = near_pairs([value for _, value in hashes], threshold, workers)
+    parent = list(range(len(hashes)))
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    for i, j in pairs.tolist():
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            # 以下标小的为根，组首固定为最靠前的成员
+            if ri < rj:
+                parent[rj] = ri
+            else:
+                parent[ri] = rj
+    members = {}
+    for i in range(len(hashes)):
+        members.setdefault(find(i), []).append(hashes[i][0])
+    return [group for _, group in sorted(members.items()) if len(group) > 1]
+
+def group_near_duplicates(hashes, threshold, workers=None):
+    # hashes为按输入顺序排列的(key, int哈希)；分组结果与逐对比较的贪心算法一致：
+    # 按顺序取未归组的条目为组首，收集所有未归组且距离<=threshold的条目，按输入顺序排列
+    pairs = near_pairs([value for _, value in hashes], threshold, workers)
+    neighbors = {}
+    for i, j in pairs.tolist():
+        neighbors.setdefault(i, []).append(j)
+        neighbors.setdefault(j, []).append(i)
+    used = set()
+    groups = []
+    for i, (key, _) in enumerate(hashes):
+        if key in used or i not in neighbors:
+            continue
+        matches = sorted(j for j in neighbors[i] if hashes[j][0] not in used)
+        if matches:
+            group = [key] + [hashes[j][0] for j in matches]
+            used.update(group)
+            groups.append(group)
+    return groups
@@ -0,0 +1,102 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+from PIL import Image
+
+ALGORITHMS = ("phash", "dhash", "ahash", "whash")
+# 哈希算法实现变化时递增，持久化的旧哈希不再复用
+HASH_VERSION = 2
+HASH_SIZE = 8
+# JPEG按DCT缩放解码到不小于该边长，感知哈希只需要几十像素
+DRAFT_SIZE = 256
+# wHash固定在64x64上取Haar低频，等价于8x8块均值；不随原图尺寸变化，避免大图上做大尺寸小波变换
+WHASH_SCALE = 64
+CHUNK_SIZE = 64
+
+# 各算法需要的灰度缩略图尺寸(宽, 高)
+_SIZES = {
+    "phash": (HASH_SIZE * 4, HASH_SIZE * 4),
+    "dhash": (HASH_SIZE + 1, HASH_SIZE),
+    "ahash": (HASH_SIZE, HASH_SIZE),
+    "whash": (WHASH_SCALE, WHASH_SCALE),
+}
+
+def _dct_matrix(n, k):
+    # DCT-II基的前k行；感知哈希只比较系数与中位数的大小，缩放系数可以省略
+    rows = np.arange(k)[:, None]
+    cols = np.arange(n)[None, :]
+    return np.cos(np.pi * (2 * cols + 1) * rows / (2 * n))
+
+_DCT = _dct_matrix(HASH_SIZE * 4, HASH_SIZE)
+
+def _pack(bits):
+    # (k, 8, 8)布尔数组按行优先、高位在前打包成uint64，与imagehash的十六进制表示一致
+    packed = np.packbits(bits.reshape(len(bits), -1), axis=1)
+    return packed.view(">u8").ravel().astype(np.uint64)
+
+def _median_bits(values):
+    flat = values.reshape(len(values), -1)
+    return values > np.median(flat, axis=1)[:, None, None]
+
+def phash(stack):
+    low = _DCT @ stack @ _DCT.T
+    return _pack(_median_bits(low))
+
+def dhash(stack):
+    return _pack(stack[:, :, 1:] > stack[:, :, :-1])
+
+def ahash(stack):
+    return _pack(stack > stack.mean(axis=(1, 2))[:, None, None])
+
+def whash(stack):
+    block = WHASH_SCALE // HASH_SIZE
+    means = stack.reshape(len(stack), HASH_SIZE, block, HASH_SIZE, block).mean(axis=(2, 4))
+    return _pack(_median_bits(means))
+
+_FUNCS = {"phash": phash, "dhash": dhash, "ahash": ahash, "whash": whash}
+
+def _load_gray(path, sizes):
+    # 一次解码，按各算法所需尺寸生成灰度小图；reducing_gap让大图先整数倍缩小再精细重采样
+    with Image.open(path) as img:
+        img.draft("L", (DRAFT_SIZE, DRAFT_SIZE))
+        gray = img.convert("L")
+    return [np.asarray(gray.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0), dtype=np.float64) for size in sizes]
+
+def _hash_chunk(paths, algorithms):
+    # 进程池任务：解码一批文件，堆叠成(k, h, w)数组后每种算法一次性向量化计算
+    sizes = [_SIZES[a] for a in algorithms]
+    valid = np.zeros(len(paths), dtype=bool)
+    stacks = [[] for _ in algorithms]
+    for i, path in enumerate(paths):
+        try:
+            arrays = _load_gray(path, sizes)
+        except Exception:
+            continue
+        valid[i] = True
+        for stack, arr in zip(stacks, arrays):
+            stack.append(arr)
+    result = {}
+    for algorithm, stack in zip(algorithms, stacks):
+        values = np.zeros(len(paths), dtype=np.uint64)
+        if stack:
+            values[valid] = _FUNCS[algorithm](np.stack(stack))
+        result[algorithm] = values
+    return valid, result
+
+def hash_images(paths, algorithms=("phash",), workers=None, chunk_size=CHUNK_SIZE):
+    # 返回(valid, {算法: uint64数组})，与paths一一对应；无法解码的文件valid为False、哈希为0
+    algorithms = tuple(algorithms)
+    for algorithm in algorithms:
+        if algorithm not in _FUNCS:
+            raise ValueError(f"未知的哈希算法: {algorithm}")
+    paths = list(paths)
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    if workers and workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            parts = list(pool.map(_hash_chunk, chunks, [algorithms] * len(chunks)))
+    else:
+        parts = [_hash_chunk(chunk, algorithms) for chunk in chunks]
+    if not parts:
+        return np.zeros(0, dtype=bool), {a: np.zeros(0, dtype=np.uint64) for a in algorithms}
+    valid = np.concatenate([p[0] for p in parts])
+    return valid, {a: np.concatenate([p[1][a] for p in parts]) for a in algorithms}
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import sqlite3
+
+class HashStore:
+    # 感知哈希持久化目录：按(路径, 大小, 修改时间)判断文件是否变化，变化后再按内容摘要查找，
+    # 只有全新的内容才需要重新解码计算哈希
+    def __init__(self, db_path):
+        self.db_path = db_path
+        parent = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(parent, exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "path TEXT NOT NULL, algorithm TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+            "digest TEXT NOT NULL, value INTEGER NOT NULL, PRIMARY KEY (path, algorithm))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS hashes_digest ON hashes (digest, algorithm)")
+        self.conn.commit()
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    def close(self):
+        if self.conn:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+    @staticmethod
+    def _to_db(value):
+        # SQLite整数是有符号64位，无符号哈希按补码存取
+        return value - (1 << 64) if value >= 1 << 63 else value
+    @staticmethod
+    def _from_db(value):
+        return value + (1 << 64) if value < 0 else value
+    @staticmethod
+    def digest_file(path, chunk_size=1024 * 1024):
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(chunk_size), b""):
+                h.update(block)
+        return h.hexdigest()
+    def lookup(self, paths, algorithm):
+        # algorithm为算法及版本标识，不同算法的哈希互不复用；返回(已知哈希{路径: 值}, 待计算[(路径, 大小, 修改时间, 摘要)])；无法读取的文件两边都不出现
+        known, pending, moved = {}, [], []
+        cur = self.conn.cursor()
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            row = cur.execute(
+                "SELECT size, mtime_ns, value FROM hashes WHERE path=? AND algorithm=?",
+                (os.path.abspath(path), algorithm)
+            ).fetchone()
+            if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+                known[path] = self._from_db(row[2])
+                continue
+            try:
+                digest = self.digest_file(path)
+            except OSError:
+                continue
+            # 内容相同(改名、复制、重新上传)直接复用已有哈希
+            row = cur.execute(
+                "SELECT value FROM hashes WHERE digest=? AND algorithm=? LIMIT 1",
+                (digest, algorithm)
+            ).fetchone()
+            if row:
+                known[path] = self._from_db(row[0])
+                moved.append((path, st.st_size, st.st_mtime_ns, digest, known[path]))
+            else:
+                pending.append((path, st.st_size, st.st_mtime_ns, digest))
+        self.store(moved, algorithm)
+        return known, pending
+    def store(self, records, algorithm):
+        # records为(路径, 大小, 修改时间, 摘要, 哈希值)
+        if not records:
+            return
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO hashes (path, algorithm, size, mtime_ns, digest, value) VALUES (?, ?, ?, ?, ?, ?)",
+            [(os.path.abspath(path), algorithm, size, mtime_ns, digest, self._to_db(value)) for path, size, mtime_ns, digest, value in records]
+        )
+        self.conn.commit()
+    def prune(self):
+        # 删除磁盘上已不存在的文件记录，返回删除条数
+        paths = [row[0] for row in self.conn.execute("SELECT DISTINCT path FROM hashes")]
+        gone = [(p,) for p in paths if not os.path.exists(p)]
+        self.conn.executemany("DELETE FROM hashes WHERE path=?", gone)
+        self.conn.commit()
+        return len(gone)
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
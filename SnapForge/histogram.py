@@ -0,0 +1,43 @@
+import io
+from PIL import Image, ImageDraw
+
+CHANNELS = (("r", (220, 40, 40)), ("g", (40, 160, 40)), ("b", (40, 80, 220)))
+
+def compute_histogram(img):
+    # 返回{"r"/"g"/"b": 256个计数}；img可以是路径或已打开的图片
+    if not isinstance(img, Image.Image):
+        with Image.open(img) as opened:
+            return compute_histogram(opened)
+    hist = (img if img.mode == "RGB" else img.convert("RGB")).histogram()
+    return {"r": hist[:256], "g": hist[256:512], "b": hist[512:]}
+
+def render_histogram(histogram, size=(400, 150), fmt="PNG"):
+    # 直接用PIL画三条折线，返回图片字节流；纵轴按三个通道的最大值统一缩放
+    width, height = size
+    margin = 6
+    canvas = Image.new("RGB", size, (255, 255, 255))
+    draw = ImageDraw.Draw(canvas)
+    plot_w, plot_h = width - 2 * margin, height - 2 * margin
+    peak = max(max(histogram[c]) for c, _ in CHANNELS) or 1
+    draw.rectangle([margin - 1, margin - 1, width - margin, height - margin], outline=(180, 180, 180))
+    for c, color in CHANNELS:
+        values = histogram[c]
+        step = plot_w / (len(values) - 1)
+        points = [(margin + i * step, margin + plot_h - v * plot_h / peak) for i, v in enumerate(values)]
+        draw.line(points, fill=color, width=1)
+    # 图例
+    for i, (c, color) in enumerate(CHANNELS):
+        x = width - margin - 36
+        y = margin + 3 + i * 12
+        draw.rectangle([x, y + 2, x + 8, y + 8], fill=color)
+        draw.text((x + 12, y), c.upper(), fill=(60, 60, 60))
+    buf = io.BytesIO()
+    canvas.save(buf, format=fmt)
+    buf.seek(0)
+    return buf
+
+def plot_image_histogram(image_path):
+    try:
+        return render_histogram(compute_histogram(image_path))
+    except Exception:
+        return None
@@ -1,11 +1,44 @@
 import os
-from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageEnhance
-import imagehash
-import piexif
-from colorthief import ColorThief
-import matplotlib.pyplot as plt
+from PIL import Image
 import io
-import pytesseract
+import math
+import shutil
+import tempfile
+import importlib
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from watermark import draw_watermark
+from encoder import encode_image
+from filters import FILTER_VERSION, apply_chain, is_grayscale
+from tiled import can_tile, exceeds_pillow_limit, open_large, process_tiled, should_tile
+
+# 各功能拆分在独立模块中，首次访问时才导入，import logic 只加载图片处理核心
+_LAZY_EXPORTS = {
+    "find_duplicate_images": "dedup",
+    "get_exif_data": "analysis",
+    "analyze_images": "analysis",
+    "compute_histograms": "analysis",
+    "smart_classify": "analysis",
+    "classify_images": "analysis",
+    "get_image_main_color": "palette",
+    "plot_image_histogram": "histogram",
+    "render_histogram": "histogram",
+    "ocr_image": "ocr",
+    "ocr_images": "ocr",
+    "ai_image_recognition_cloud": "cloud",
+    "ai_recognition_baidu": "cloud",
+    "ai_recognition_deepseek": "cloud",
+    "remove_background": "background",
+    "remove_backgrounds": "background",
+}
+
+def __getattr__(name):
+    module = _LAZY_EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
 
 class ProcessLog:
     def __init__(self):
@@ -16,8 +49,12 @@ class ProcessLog:
     def get_text(self) -> str:
         return "\n".join(self.entries)
 
+class InvalidImageError(Exception):
+    pass
+
 class ImageProcessor:
-    def __init__(self):
+    def __init__(self, cache=None):
+        self.cache = cache
         self.supported_formats = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tiff", ".webp"}
         self.format_mapping = {
             ".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG",
@@ -43,7 +80,11 @@ class ImageProcessor:
         rotate=0,
         filter_type=None,
         exif_edit=None,
-        process_log=None
+        process_log=None,
+        workers=None,
+        executor=None,
+        encode=None,
+        encode_stats=None
     ):
         if extension:
             extension = self._normalize_extension(extension)
@@ -57,45 +98,189 @@ class ImageProcessor:
                 progress_callback(100, "")
             return (0, 0, [])
         out_dir = os.path.dirname(os.path.abspath(files[0]))
-        for index, file_path in enumerate(files):
-            filename = os.path.basename(file_path)
-            filename = "".join(x for x in filename if x.isalnum() or x in "._-")
-            try:
-                file_ext = self._normalize_extension(os.path.splitext(file_path)[1])
-                if extension and file_ext != extension:
-                    if process_log: process_log.add(f"跳过: {filename}（类型不符，仅处理{extension}）", level="skip")
-                    continue
+        options = self._job_options(
+            convert_format, quality, preserve_metadata, resize_enabled, resize_width, resize_height,
+            resize_mode, resize_only_shrink, watermark, crop_params, rotate, filter_type, exif_edit, encode
+        )
+        pool, own_pool = self._create_executor(executor, workers)
+        try:
+            # 先按顺序生成任务（并行模式下立即提交），再按原顺序收集结果，保证编号与日志顺序确定
+            jobs = []
+            for index, file_path in enumerate(files):
+                filename = os.path.basename(file_path)
+                filename = "".join(x for x in filename if x.isalnum() or x in "._-")
+                job = {"filename": filename, "src": file_path, "skip": None, "error": None, "temp_path": None, "task": None}
+                jobs.append(job)
                 try:
-                    with Image.open(file_path) as test_img:
-                        test_img.verify()
-                except Exception:
-                    if process_log: process_log.add(f"跳过: {filename}（不是有效图片）", level="skip")
-                    continue
-                if resize_enabled and (not resize_width or not resize_height or resize_width < 1 or resize_height < 1):
-                    if process_log: process_log.add(f"跳过: {filename}（非法尺寸参数）", level="skip")
-                    continue
-                if convert_format and file_ext == convert_format and not quality:
-                    if process_log: process_log.add(f"跳过: {filename}（输入输出格式相同且无压缩变更）", level="skip")
-                    continue
-                new_filename = self._generate_filename(
-                    prefix, start_number + processed,
-                    convert_format or file_ext, out_dir
-                )
-                temp_path = os.path.join(out_dir, new_filename)
-                self._process_image(
-                    file_path, temp_path,
-                    convert_format, quality, preserve_metadata,
-                    resize_enabled, resize_width, resize_height, resize_mode, resize_only_shrink,
-                    watermark, crop_params, rotate, filter_type, exif_edit
-                )
-                processed += 1
-                result_paths.append(temp_path)
-                if process_log: process_log.add(f"成功: {filename} → {new_filename}", level="info")
-            except Exception as e:
-                if process_log: process_log.add(f"失败: {filename}，原因: {str(e)}", level="error")
-            finally:
-                self._update_progress(progress_callback, index + 1, total_files, filename)
+                    file_ext = self._normalize_extension(os.path.splitext(file_path)[1])
+                    if extension and file_ext != extension:
+                        job["skip"] = f"类型不符，仅处理{extension}"
+                        continue
+                    if resize_enabled and (not resize_width or not resize_height or resize_width < 1 or resize_height < 1):
+                        job["skip"] = "非法尺寸参数"
+                        continue
+                    if convert_format and file_ext == convert_format and not quality and not encode:
+                        job["skip"] = "输入输出格式相同且无压缩变更"
+                        continue
+                    job["out_ext"] = convert_format or file_ext
+                    fd, job["temp_path"] = tempfile.mkstemp(prefix=".snapforge-", suffix=job["out_ext"], dir=out_dir)
+                    os.close(fd)
+                    args = (self, file_path, job["temp_path"], options)
+                    job["task"] = pool.submit(_run_process_job, *args) if pool else args
+                except Exception as e:
+                    job["error"] = e
+            for index, job in enumerate(jobs):
+                filename = job["filename"]
+                try:
+                    if job["error"] is not None:
+                        raise job["error"]
+                    if job["skip"]:
+                        if process_log: process_log.add(f"跳过: {filename}（{job['skip']}）", level="skip")
+                        continue
+                    task = job["task"]
+                    status = task.result() if pool else _run_process_job(*task)
+                    if self.cache is not None and status in ("hit", "miss"):
+                        self.cache.record(status == "hit")
+                        if status == "miss" and isinstance(pool, ProcessPoolExecutor):
+                            # 子进程里写入的是缓存对象的副本，这里补记新条目的大小
+                            self.cache.track(os.path.getsize(job["temp_path"]))
+                    if status == "invalid":
+                        if process_log: process_log.add(f"跳过: {filename}（不是有效图片）", level="skip")
+                        continue
+                    new_filename = self._generate_filename(
+                        prefix, start_number + processed,
+                        job["out_ext"], out_dir
+                    )
+                    dest_path = os.path.join(out_dir, new_filename)
+                    os.replace(job["temp_path"], dest_path)
+                    job["temp_path"] = None
+                    processed += 1
+                    result_paths.append(dest_path)
+                    note = "（缓存命中）" if status == "hit" else ""
+                    if encode:
+                        original, encoded = os.path.getsize(job["src"]), os.path.getsize(dest_path)
+                        if encode_stats is not None:
+                            encode_stats.record(original, encoded)
+                        note += f"（{original / 1024:.0f} KB → {encoded / 1024:.0f} KB，节省 {1 - encoded / max(1, original):.0%}）"
+                    if process_log: process_log.add(f"成功: {filename} → {new_filename}{note}", level="info")
+                except Exception as e:
+                    if process_log: process_log.add(f"失败: {filename}，原因: {str(e)}", level="error")
+                finally:
+                    if job["temp_path"] and os.path.exists(job["temp_path"]):
+                        os.remove(job["temp_path"])
+                    self._update_progress(progress_callback, index + 1, total_files, filename)
+        finally:
+            if own_pool:
+                pool.shutdown(wait=True, cancel_futures=True)
         return (processed, total_files, result_paths)
+    def process_bytes(self, data, filename=None, **options):
+        # 内存中处理一张图片：输入为bytes/bytearray/memoryview或可读文件对象，返回(输出字节, 扩展名)，全程不读写临时文件
+        out = io.BytesIO()
+        out_ext = self.process_stream(data, out, filename, **options)
+        return out.getvalue(), out_ext
+    def process_stream(
+        self,
+        source,
+        out,
+        filename=None,
+        convert_format=None,
+        quality=None,
+        preserve_metadata=True,
+        resize_enabled=False,
+        resize_width=None,
+        resize_height=None,
+        resize_mode="fit",
+        resize_only_shrink=True,
+        watermark=None,
+        crop_params=None,
+        rotate=0,
+        filter_type=None,
+        exif_edit=None,
+        encode=None
+    ):
+        # 与batch_process共用_process_image，编码结果直接写入可写文件对象out，返回输出扩展名；
+        # filename只用来确定源格式，没有扩展名时按文件头识别。不是有效图片时抛出InvalidImageError
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            data = source
+        else:
+            data = source.read()
+        convert_format = self._normalize_extension(convert_format)
+        if resize_enabled and (not resize_width or not resize_height or resize_width < 1 or resize_height < 1):
+            raise ValueError("非法尺寸参数")
+        out_ext = self._output_extension(data, filename, convert_format)
+        options = self._job_options(
+            convert_format, quality, preserve_metadata, resize_enabled, resize_width, resize_height,
+            resize_mode, resize_only_shrink, watermark, crop_params, rotate, filter_type, exif_edit, encode
+        )
+        cache = self.cache
+        key = None
+        if cache is not None:
+            key = _cache_key(cache, cache.digest_bytes(data), options, out_ext)
+            cached = cache.get_bytes(key, out_ext)
+            cache.record(cached is not None)
+            if cached is not None:
+                out.write(cached)
+                return out_ext
+        # bytes直接作为BytesIO的底层缓冲区，不复制；bytearray/memoryview会复制一次
+        buf = out if cache is None else io.BytesIO()
+        # 内存输入多来自网络上传：保留Pillow的像素上限，体积很小的高压缩图片不能让进程分配数GB内存
+        self._process_image(filename, buf, source=io.BytesIO(data), allow_large=False, **options)
+        if cache is not None:
+            result = buf.getbuffer()
+            cache.put_bytes(key, result, out_ext)
+            out.write(result)
+        return out_ext
+    def _job_options(
+        self,
+        convert_format=None,
+        quality=None,
+        preserve_metadata=True,
+        resize_enabled=False,
+        resize_width=None,
+        resize_height=None,
+        resize_mode="fit",
+        resize_only_shrink=True,
+        watermark=None,
+        crop_params=None,
+        rotate=0,
+        filter_type=None,
+        exif_edit=None,
+        encode=None
+    ):
+        # 批量/内存处理参数 → _process_image的参数；缓存key也由它计算，各入口设置相同时key一致
+        return {
+            "target_ext": self._normalize_extension(convert_format), "quality": quality,
+            "preserve_metadata": preserve_metadata, "resize_enabled": resize_enabled,
+            "resize_width": resize_width, "resize_height": resize_height, "resize_mode": resize_mode,
+            "resize_only_shrink": resize_only_shrink, "watermark": watermark, "crop_params": crop_params,
+            "rotate": rotate, "filter_type": filter_type, "exif_edit": exif_edit, "encode": encode
+        }
+    def _output_extension(self, data, filename, convert_format):
+        ext = convert_format or self._normalize_extension(os.path.splitext(filename or "")[1])
+        if ext:
+            return ext
+        # 只解析文件头，不解码像素
+        with self._open_image(io.BytesIO(data), allow_large=False) as img:
+            ext = self._format_extension(img.format)
+        if ext is None:
+            raise ValueError("无法确定输出格式，请指定convert_format")
+        return ext
+    def _format_extension(self, pil_format):
+        return next((ext for ext, fmt in self.format_mapping.items() if fmt == pil_format), None)
+    def _create_executor(self, executor, workers):
+        if isinstance(executor, Executor):
+            return executor, False
+        if executor is None:
+            if not workers or workers <= 1:
+                return None, False
+            executor = "process"
+        workers = workers or os.cpu_count() or 1
+        if executor == "process":
+            # 使用spawn避免fork继承onnxruntime等库的线程状态导致子进程/退出时卡死
+            return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")), True
+        if executor == "thread":
+            return ThreadPoolExecutor(max_workers=workers), True
+        raise ValueError(f"未知的执行器类型: {executor}")
     def _normalize_extension(self, ext):
         if not ext:
             return None
@@ -105,11 +290,12 @@ class ImageProcessor:
         if ext == ".jpeg":
             return ".jpg"
         return ext
-    def _generate_filename(self, prefix, number, extension, target_dir):
+    def _generate_filename(self, prefix, number, extension, target_dir=None):
+        # target_dir为None时不检查重名(内存处理的结果不落盘)
         base_name = f"{prefix}_{number:04d}" if prefix else f"{number:04d}"
         new_name = f"{base_name}{extension}"
         counter = 1
-        while os.path.exists(os.path.join(target_dir, new_name)):
+        while target_dir is not None and os.path.exists(os.path.join(target_dir, new_name)):
             new_name = f"{base_name}_{counter}{extension}"
             counter += 1
         return new_name
@@ -129,277 +315,285 @@ class ImageProcessor:
         crop_params=None,
         rotate=0,
         filter_type=None,
-        exif_edit=None
+        exif_edit=None,
+        encode=None,
+        source=None,
+        allow_large=True
     ):
-        file_ext = self._normalize_extension(os.path.splitext(src_path)[1])
-        with Image.open(src_path) as img:
-            img = img.convert("RGBA") if img.mode not in ("RGB", "RGBA") else img.copy()
+        # src_path可为None(内存处理)，此时源格式按文件头识别；dest_path也可以是可写文件对象
+        file_ext = self._normalize_extension(os.path.splitext(src_path or "")[1])
+        with self._open_image(source or src_path, allow_large) as img:
+            file_ext = file_ext or self._format_extension(img.format)
+            stream_format = None
+            if hasattr(dest_path, "write"):
+                # 写入文件对象时Pillow无法从文件名推断格式，需显式指定
+                stream_format = self.format_mapping.get(target_ext or file_ext)
+                if stream_format is None:
+                    raise ValueError("无法确定输出格式，请指定convert_format")
+            has_alpha = img.mode in ("RGBA", "LA", "PA", "RGBa", "La") or "transparency" in img.info
+            plan, draft_mode, draft_size = self._compile_plan(
+                img.size, img.mode, has_alpha, target_ext or file_ext,
+                resize_enabled, resize_width, resize_height, resize_mode, resize_only_shrink,
+                watermark, crop_params, rotate, filter_type
+            )
+            src_size = img.size
+            if should_tile(src_size):
+                # 超大图片按条带处理：输入逐块解码，输出逐块写出，不整幅解码也不整幅转换RGBA
+                if can_tile(plan, src_size):
+                    exif_data = img.info.get("exif") if preserve_metadata else None
+                    process_tiled(self, img, plan, draft_mode, draft_size, dest_path,
+                                  self._save_params(target_ext, quality, exif_data, stream_format), encode)
+                    return
+                if exceeds_pillow_limit(src_size):
+                    raise ValueError("图片过大，分块模式不支持旋转或超出画面的裁剪")
+            region = self._load_image(img, draft_mode, draft_size)
             exif_data = img.info.get("exif") if preserve_metadata else None
-            if crop_params:
-                x, y, w, h = crop_params.get("x",0), crop_params.get("y",0), crop_params.get("w"), crop_params.get("h")
-                img = img.crop((x, y, x+w, y+h)) if w and h else img
-            if rotate:
-                img = img.rotate(rotate, expand=True)
-            if resize_enabled and resize_width and resize_height:
-                img = self._resize_image(img, resize_width, resize_height, resize_mode, resize_only_shrink)
-            if filter_type:
-                img = self.apply_filter(img, filter_type)
-            if watermark:
-                img = self.apply_watermark(img, watermark)
-            save_params = {}
-            if target_ext:
-                pil_format = self.format_mapping.get(target_ext)
-                if pil_format:
-                    save_params["format"] = pil_format
-            if quality is not None:
-                if target_ext in (".jpg", ".jpeg", ".webp"):
-                    save_params["quality"] = max(1, min(100, quality))
-                elif target_ext == ".png":
-                    save_params["compress_level"] = min(9, max(0, 9 - quality // 11))
-            if exif_data:
-                save_params["exif"] = exif_data
-            if target_ext in [".jpg", ".jpeg"] and img.mode in ("RGBA", "LA"):
-                img = img.convert("RGB")
-            img.save(dest_path, **save_params)
-    def _resize_image(self, img, width, height, mode="fit", only_shrink=True):
-        orig_w, orig_h = img.size
+            img = self._run_plan(img, plan, src_size, region)
+            save_params = self._save_params(target_ext, quality, exif_data, stream_format)
+            if encode:
+                # 按目标体积/目标SSIM搜索质量并启用更省字节的编码选项，见encoder模块
+                encode_image(img, dest_path, save_params, encode)
+            else:
+                img.save(dest_path, **save_params)
+    def _save_params(self, target_ext, quality, exif_data, default_format=None):
+        save_params = {}
+        if target_ext:
+            pil_format = self.format_mapping.get(target_ext)
+            if pil_format:
+                save_params["format"] = pil_format
+        if default_format and "format" not in save_params:
+            save_params["format"] = default_format
+        if quality is not None:
+            if target_ext in (".jpg", ".jpeg", ".webp"):
+                save_params["quality"] = max(1, min(100, quality))
+            elif target_ext == ".png":
+                save_params["compress_level"] = min(9, max(0, 9 - quality // 11))
+        if exif_data:
+            save_params["exif"] = exif_data
+        return save_params
+    def _open_image(self, src_path, allow_large=True):
+        # 解码即校验：只打开一次文件，解码失败视为无效图片，取代单独的verify()预检
+        try:
+            return Image.open(src_path)
+        except Image.DecompressionBombError as e:
+            if not allow_large:
+                raise ValueError(f"图片像素数超过上限: {e}") from e
+            # 超过Pillow默认像素上限的图片交给分块模式，仍受tiled.MAX_PIXELS限制
+            try:
+                return open_large(src_path)
+            except Exception as e:
+                raise InvalidImageError(str(e)) from e
+        except Exception as e:
+            raise InvalidImageError(str(e)) from e
+    def _load_image(self, img, draft_mode=None, draft_size=None):
+        # 返回原图在解码结果中对应的区域；JPEG按DCT缩放解码时坐标会按比例缩小
+        src_w, src_h = img.size
+        region = (0, 0, src_w, src_h)
+        try:
+            if draft_mode or draft_size:
+                res = img.draft(draft_mode, draft_size)
+                if res is not None:
+                    region = res[1]
+            img.load()
+        except Exception as e:
+            img.close()
+            raise InvalidImageError(str(e)) from e
+        return region
+    def _compile_plan(
+        self, size, mode, has_alpha, out_ext,
+        resize_enabled, resize_width, resize_height, resize_mode, resize_only_shrink,
+        watermark, crop_params, rotate, filter_type
+    ):
+        # 把处理参数编译成操作序列：先裁剪/缩放以减少后续像素量，裁剪框并入resize的box，
+        # 整条链路只选一次最省的工作色彩模式，省掉无意义的copy与来回转换
+        rotate = rotate % 360 if rotate else 0
+        resize = None
+        if resize_enabled and resize_width and resize_height:
+            resize = (resize_width, resize_height, resize_mode, resize_only_shrink)
+        crop_box = None
+        if crop_params:
+            x, y, w, h = crop_params.get("x",0), crop_params.get("y",0), crop_params.get("w"), crop_params.get("h")
+            if w and h:
+                crop_box = (x, y, x+w, y+h)
+        grayscale = is_grayscale(filter_type)
+        need_alpha = has_alpha or rotate % 90 or (resize and resize_mode == "pad")
+        if grayscale:
+            # 灰度滤镜本就丢弃透明通道，直接在L模式下完成整条链路
+            work_mode = "L"
+        elif mode in ("RGB", "RGBA"):
+            work_mode = mode
+        elif need_alpha:
+            work_mode = "RGBA"
+        elif mode in ("1", "L", "I", "I;16", "F") and not watermark:
+            work_mode = "L"
+        else:
+            work_mode = "RGB"
+        # 通道数减少、缩放不支持的模式、旋转或留白需要透明底时，在缩放前转换；否则缩放后再转换
+        convert_early = work_mode != mode and (
+            grayscale or mode not in ("L", "LA", "RGB", "RGBA") or need_alpha
+        )
+        fuse = (
+            crop_box is not None and resize is not None and not rotate and not convert_early
+            and resize_mode in ("fit", "fill", "pad")
+            and crop_box[0] >= 0 and crop_box[1] >= 0 and crop_box[2] <= size[0] and crop_box[3] <= size[1]
+        )
+        plan = []
+        if crop_box and not fuse:
+            plan.append(("crop", crop_box))
+        if convert_early:
+            plan.append(("convert", work_mode))
+        if rotate:
+            plan.append(("rotate", rotate))
+        if resize:
+            plan.append(("resize", resize, crop_box if fuse else None))
+        if work_mode != mode and not convert_early:
+            plan.append(("convert", work_mode))
+        if filter_type and not grayscale:
+            plan.append(("filter", filter_type))
+        if watermark:
+            plan.append(("watermark", watermark))
+        if out_ext in (".jpg", ".jpeg"):
+            plan.append(("flatten", "RGB"))
+        draft_mode = "L" if work_mode == "L" else None
+        draft_size = None
+        if resize and (crop_box is None or fuse):
+            region = (crop_box[2] - crop_box[0], crop_box[3] - crop_box[1]) if fuse else None
+            draft_size = self._plan_draft_size(size, *resize, rotate=rotate, region=region)
+        return plan, draft_mode, draft_size
+    def _run_plan(self, img, plan, src_size, region):
+        # region为原图在当前像素坐标下的范围；按比例解码后需把原图坐标的裁剪框同比缩放
+        scale = region[2] / src_size[0]
+        rotated = False
+        for step in plan:
+            op = step[0]
+            if op == "crop":
+                img = img.crop(step[1])
+            elif op == "convert":
+                if img.mode != step[1]:
+                    img = img.convert(step[1])
+            elif op == "rotate":
+                img = img.rotate(step[1], expand=True)
+                rotated = True
+            elif op == "resize":
+                box = step[2]
+                if box is not None:
+                    box = tuple(v * scale for v in box)
+                elif scale != 1 and not rotated:
+                    box = region
+                img = self._resize_image(img, *step[1], box=box)
+            elif op == "filter":
+                img = self.apply_filter(img, step[1])
+            elif op == "watermark":
+                # 流水线中的图片是本次处理自己打开/生成的，直接原地绘制
+                img = draw_watermark(img, step[1])
+            elif op == "flatten":
+                if img.mode in ("RGBA", "LA"):
+                    img = img.convert(step[1])
+        return img
+    def _plan_draft_size(self, size, width, height, mode="fit", only_shrink=True, rotate=0, region=None, reducing_gap=2.0):
+        if mode not in ("fit", "pad", "fill") or rotate % 90:
+            return None
+        orig_w, orig_h = region or size
+        if rotate % 180:
+            width, height = height, width
         if only_shrink and orig_w <= width and orig_h <= height:
-            return img
-        if mode == "fit":
-            img_copy = img.copy()
-            img_copy.thumbnail((width, height), Image.LANCZOS)
-            return img_copy
-        elif mode == "fill":
+            return None
+        if mode == "fill":
             ratio = max(width / orig_w, height / orig_h)
-            new_size = (int(orig_w * ratio), int(orig_h * ratio))
-            img2 = img.resize(new_size, Image.LANCZOS)
-            left = (img2.width - width) // 2
-            top = (img2.height - height) // 2
-            return img2.crop((left, top, left + width, top + height))
-        elif mode == "pad":
-            img_copy = img.copy()
-            img_copy.thumbnail((width, height), Image.LANCZOS)
-            new_img = Image.new("RGBA", (width, height), (255,255,255,0))
-            offset_x = (width - img_copy.width) // 2
-            offset_y = (height - img_copy.height) // 2
-            new_img.paste(img_copy, (offset_x, offset_y))
+        else:
+            ratio = min(width / orig_w, height / orig_h)
+        # 保留reducing_gap倍余量，最后再用LANCZOS高质量重采样，避免画质损失
+        ratio *= reducing_gap
+        if ratio >= 1:
+            return None
+        return (math.ceil(size[0] * ratio), math.ceil(size[1] * ratio))
+    def _fit_size(self, size, width, height):
+        # 与Image.thumbnail相同的取整规则，只缩小不放大；无需缩放时返回None
+        orig_w, orig_h = size
+        if width >= orig_w and height >= orig_h:
+            return None
+        aspect = orig_w / orig_h
+        if width / height >= aspect:
+            width = max(min(math.floor(height * aspect), math.ceil(height * aspect), key=lambda n: abs(aspect - n / height)), 1)
+        else:
+            height = max(min(math.floor(width / aspect), math.ceil(width / aspect), key=lambda n: 0 if n == 0 else abs(aspect - width / n)), 1)
+        return (width, height)
+    def _resize_image(self, img, width, height, mode="fit", only_shrink=True, box=None):
+        box = box or (0, 0, img.width, img.height)
+        orig_w, orig_h = box[2] - box[0], box[3] - box[1]
+        whole = box == (0, 0, img.width, img.height)
+        if only_shrink and orig_w <= width and orig_h <= height:
+            return img if whole else img.crop(box)
+        if mode in ("fit", "pad"):
+            new_size = self._fit_size((orig_w, orig_h), width, height)
+            if new_size:
+                img = img.resize(new_size, Image.LANCZOS, box=box, reducing_gap=2.0)
+            elif not whole:
+                img = img.crop(box)
+            if mode == "fit":
+                return img
+            if img.mode == "L":
+                new_img = Image.new("L", (width, height), 255)
+            else:
+                new_img = Image.new("RGBA", (width, height), (255,255,255,0))
+            offset_x = (width - img.width) // 2
+            offset_y = (height - img.height) // 2
+            new_img.paste(img, (offset_x, offset_y))
             return new_img
+        elif mode == "fill":
+            ratio = max(width / orig_w, height / orig_h)
+            new_w, new_h = int(orig_w * ratio), int(orig_h * ratio)
+            left = (new_w - width) // 2
+            top = (new_h - height) // 2
+            # 在缩放后的坐标系里居中取目标区域，再映射回原图坐标，一次resize完成缩放+裁剪
+            scale_x, scale_y = orig_w / new_w, orig_h / new_h
+            sub_box = (
+                max(0, box[0] + left * scale_x), max(0, box[1] + top * scale_y),
+                min(img.width, box[0] + (left + width) * scale_x), min(img.height, box[1] + (top + height) * scale_y)
+            )
+            return img.resize((width, height), Image.LANCZOS, box=sub_box, reducing_gap=2.0)
         elif mode == "crop":
+            if not whole:
+                img = img.crop(box)
             left = max(0, (orig_w - width) // 2)
             top = max(0, (orig_h - height) // 2)
             return img.crop((left, top, left + width, top + height))
         else:
-            return img
+            return img if whole else img.crop(box)
     def _update_progress(self, callback, processed, total, filename=""):
         if callback:
             progress = int(processed / total * 100)
             callback(progress, filename)
     def apply_watermark(self, img, watermark):
-        text = watermark.get("text")
-        font_path = watermark.get("font", None)
-        font_size = watermark.get("size", 32)
-        color = watermark.get("color", (255,255,255,128))
-        pos = watermark.get("pos", "bottom-right")
-        if not text:
-            return img
-        if img.mode != "RGBA":
-            img = img.convert("RGBA")
-        overlay = Image.new("RGBA", img.size, (0,0,0,0))
-        try:
-            font = ImageFont.truetype(font_path or "arial.ttf", font_size)
-        except:
-            font = ImageFont.load_default()
-        draw = ImageDraw.Draw(overlay)
-        text_size = draw.textsize(text, font=font)
-        margin = 10
-        positions = {
-            "bottom-right": (img.width - text_size[0] - margin, img.height - text_size[1] - margin),
-            "bottom-left": (margin, img.height - text_size[1] - margin),
-            "top-right": (img.width - text_size[0] - margin, margin),
-            "top-left": (margin, margin),
-            "center": ((img.width-text_size[0])//2, (img.height-text_size[1])//2)
-        }
-        xy = positions.get(pos, positions["bottom-right"])
-        draw.text(xy, text, font=font, fill=color)
-        return Image.alpha_composite(img, overlay)
+        # 返回新图，不改动传入的图片。字体和渲染好的文字小图按参数缓存，批量处理同一水印时只渲染一次，见watermark模块
+        return draw_watermark(img.copy(), watermark)
     def apply_filter(self, img, filter_type):
-        if filter_type == "grayscale":
-            return img.convert("L").convert("RGBA")
-        elif filter_type == "sharpen":
-            return img.filter(ImageFilter.SHARPEN)
-        elif filter_type == "blur":
-            return img.filter(ImageFilter.BLUR)
-        elif filter_type == "contour":
-            return img.filter(ImageFilter.CONTOUR)
-        elif filter_type == "emboss":
-            return img.filter(ImageFilter.EMBOSS)
-        elif filter_type == "edge":
-            return img.filter(ImageFilter.FIND_EDGES)
-        elif filter_type == "enhance":
-            enhancer = ImageEnhance.Contrast(img)
-            return enhancer.enhance(1.5)
-        else:
-            return img
-
-def find_duplicate_images(file_paths, threshold=8):
-    hashes = {}
-    groups = []
-    for path in file_paths:
-        try:
-            with Image.open(path) as img:
-                h = imagehash.phash(img)
-            hashes[path] = h
-        except Exception:
-            continue
-    used = set()
-    for path1, hash1 in hashes.items():
-        if path1 in used:
-            continue
-        group = [path1]
-        for path2, hash2 in hashes.items():
-            if path2 != path1 and path2 not in used and hash1 - hash2 <= threshold:
-                group.append(path2)
-                used.add(path2)
-        if len(group) > 1:
-            for p in group:
-                used.add(p)
-            groups.append(group)
-    return groups
+        # filter_type可为单个滤镜或滤镜链，如"sharpen,enhance"、[{"type": "gaussian", "radius": 3}]，见filters模块
+        return apply_chain(img, filter_type)
 
-def get_exif_data(image_path):
-    try:
-        exif_dict = piexif.load(image_path)
-        exif_data = {}
-        for ifd in exif_dict:
-            if isinstance(exif_dict[ifd], dict):
-                for tag in exif_dict[ifd]:
-                    tag_name = piexif.TAGS[ifd][tag]["name"]
-                    value = exif_dict[ifd][tag]
-                    if isinstance(value, bytes):
-                        try:
-                            value = value.decode()
-                        except Exception:
-                            value = str(value)
-                    exif_data[tag_name] = value
-        return exif_data
-    except Exception:
-        return {}
-
-def get_image_main_color(image_path):
-    try:
-        ct = ColorThief(image_path)
-        dom_color = ct.get_color(quality=1)
-        palette = ct.get_palette(color_count=6)
-        return dom_color, palette
-    except Exception:
-        return None, []
+def _cache_key(cache, digest, options, suffix):
+    # digest为源文件内容的哈希，options为_job_options的结果；路径处理、内存处理与API用同一种key，结果可互相命中
+    params = dict(options, output=suffix)
+    if options.get("filter_type"):
+        params["filter_version"] = FILTER_VERSION
+    return cache.make_key(digest, params)
 
-def plot_image_histogram(image_path):
+def _run_process_job(processor, src_path, dest_path, options):
+    # 进程池要求可序列化的顶层函数；返回"invalid"表示源文件不是有效图片，"hit"/"miss"为缓存命中情况
+    cache = processor.cache
     try:
-        img = Image.open(image_path).convert('RGB')
-        plt.figure(figsize=(4,1.5))
-        color = ('r','g','b')
-        for i,c in enumerate(color):
-            histo = img.getchannel(i).histogram()
-            plt.plot(histo, color=c, label=f"{c.upper()}")
-        plt.legend()
-        plt.tight_layout()
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        plt.close()
-        buf.seek(0)
-        return buf
-    except Exception:
-        return None
-
-def ocr_image(image_path, lang="chi_sim"):
-    try:
-        img = Image.open(image_path)
-        text = pytesseract.image_to_string(img, lang=lang)
-        return text.strip()
-    except Exception as e:
-        return f"OCR失败: {e}"
-
-def smart_classify(image_path):
-    try:
-        img = Image.open(image_path)
-        w, h = img.size
-        if w > h*1.5:
-            shape = "横幅"
-        elif h > w*1.5:
-            shape = "竖幅"
-        else:
-            shape = "方形"
-        dom_color, _ = get_image_main_color(image_path)
-        color_str = str(dom_color) if dom_color else "未知"
-        return [shape, f"主色:{color_str}"]
-    except Exception:
-        return ["无法识别"]
-
-def ai_image_recognition_cloud(file_paths, provider="baidu", **provider_kwargs):
-    if provider == "baidu":
-        return ai_recognition_baidu(file_paths, **provider_kwargs)
-    elif provider == "deepseek":
-        return ai_recognition_deepseek(file_paths, **provider_kwargs)
-    else:
-        return {path: ["未实现"] for path in file_paths}
-
-def ai_recognition_baidu(file_paths, app_id=None, api_key=None, secret_key=None, **kwargs):
-    try:
-        from aip import AipImageClassify
-    except ImportError:
-        raise Exception("请先 pip install baidu-aip")
-    if not app_id or not api_key or not secret_key:
-        return {path: ["缺少API参数"] for path in file_paths}
-    client = AipImageClassify(app_id, api_key, secret_key)
-    results = {}
-    for path in file_paths:
-        with open(path, 'rb') as f:
-            img_data = f.read()
-        res = client.advancedGeneral(img_data)
-        tags = [item['keyword'] for item in res.get('result', [])]
-        results[path] = tags or ["未识别"]
-    return results
-
-def ai_recognition_deepseek(file_paths, api_key=None, endpoint=None, **kwargs):
-    import requests
-    if not api_key:
-        return {path: ["缺少API参数"] for path in file_paths}
-    results = {}
-    for path in file_paths:
-        with open(path, 'rb') as f:
-            img_data = f.read()
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/octet-stream"
-        }
-        allowed_endpoints = ["https://api.deepseek.com/v1/vision/detect"]
-        url = endpoint if endpoint in allowed_endpoints else "https://api.deepseek.com/v1/vision/detect"
-        try:
-            response = requests.post(
-                url,
-                data=img_data,
-                headers=headers,
-                timeout=15
-            )
-            response.raise_for_status()
-            res = response.json()
-            if "labels" in res:
-                tags = res["labels"]
-            elif "result" in res:
-                tags = [item.get("label", "") for item in res["result"]]
-            else:
-                tags = ["未识别"]
-            results[path] = tags or ["未识别"]
-        except Exception as e:
-            results[path] = [f"调用失败: {e}"]
-    return results
-
-# ==== 图片去背景 ====
-from rembg import remove
-def remove_background(image_path, output_path=None):
-    with Image.open(image_path) as img:
-        result = remove(img)
-        if output_path:
-            result.save(output_path)
-        return result
+        if cache is None:
+            processor._process_image(src_path, dest_path, **options)
+            return "done"
+        # 分块计算哈希，不把整个源文件读进内存：大图仍可走分块处理
+        suffix = os.path.splitext(dest_path)[1]
+        key = _cache_key(cache, cache.digest_file(src_path), options, suffix)
+        cached = cache.get(key, suffix)
+        if cached:
+            shutil.copyfile(cached, dest_path)
+            return "hit"
+        processor._process_image(src_path, dest_path, **options)
+        cache.put_file(key, dest_path, suffix)
+        return "miss"
+    except InvalidImageError:
+        return "invalid"
@@ -0,0 +1,117 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import io
+import os
+import subprocess
+from PIL import Image, ImageOps
+
+TARGET_DPI = 300
+# 未标注DPI的图片按最长边限制尺寸，过大的扫描件先缩小
+MAX_SIDE = 3500
+PREPROCESS_VERSION = 1
+
+def otsu_threshold(gray):
+    # 在灰度直方图上求类间方差最大的阈值
+    hist = gray.histogram()[:256]
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    best, best_var = 127, -1.0
+    weight_bg = sum_bg = 0
+    for t in range(256):
+        weight_bg += hist[t]
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += t * hist[t]
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        var = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if var > best_var:
+            best, best_var = t, var
+    return best
+
+def preprocess_image(img, target_dpi=TARGET_DPI, max_side=MAX_SIDE):
+    # 灰度 -> 按DPI归一化缩放 -> Otsu二值化；返回1位图，写临时文件和识别都更快
+    dpi = img.info.get("dpi")
+    gray = ImageOps.exif_transpose(img).convert("L")
+    scale = 1.0
+    if dpi and dpi[0]:
+        scale = min(max(target_dpi / float(dpi[0]), 0.5), 2.0)
+    if max(gray.size) * scale > max_side:
+        scale = max_side / max(gray.size)
+    if abs(scale - 1.0) > 0.05:
+        size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+        gray = gray.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0 if scale < 1 else None)
+    threshold = otsu_threshold(gray)
+    return gray.point(lambda v: 255 if v > threshold else 0, mode="1")
+
+def _cache_key(cache, data, lang, preprocess):
+    params = {"task": "ocr", "lang": lang, "preprocess": PREPROCESS_VERSION if preprocess else 0}
+    return cache.make_key(cache.digest_bytes(data), params)
+
+def _tesseract_input(img):
+    # 与pytesseract相同：透明部分铺白底；PNG写不了的模式(CMYK、YCbCr等)先转RGB
+    if "A" in img.getbands() or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(rgba, (0, 0), rgba.getchannel("A"))
+        return background
+    if img.mode not in ("1", "L", "P", "RGB", "I", "I;16"):
+        return img.convert("RGB")
+    return img
+
+def run_tesseract(img, lang, args=()):
+    # 图片经stdin传给tesseract，结果从stdout读取，不写临时文件。每个tesseract进程只用一个线程，
+    # 并发度由线程池控制；OMP_THREAD_LIMIT只设在子进程环境里，不影响本进程加载的其他库
+    import pytesseract
+    buf = io.BytesIO()
+    _tesseract_input(img).save(buf, "PNG")
+    cmd = [pytesseract.pytesseract.tesseract_cmd, "stdin", "stdout", "-l", lang, *args]
+    env = dict(os.environ, OMP_THREAD_LIMIT="1")
+    proc = subprocess.run(cmd, input=buf.getvalue(), capture_output=True, env=env)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.decode("utf-8", "replace").strip())
+    return proc.stdout.decode("utf-8", "replace").strip()
+
+def ocr_image(image_path, lang="chi_sim", preprocess=False, cache=None):
+    # preprocess=True时先灰度、按DPI缩放并二值化：适合扫描件，照片和彩色文字可能反而变差
+    try:
+        with open(image_path, "rb") as f:
+            data = f.read()
+        key = None
+        if cache is not None:
+            key = _cache_key(cache, data, lang, preprocess)
+            cached = cache.get_bytes(key, ".txt")
+            cache.record(cached is not None)
+            if cached is not None:
+                return cached.decode("utf-8")
+        with Image.open(io.BytesIO(data)) as img:
+            if preprocess:
+                text = run_tesseract(preprocess_image(img), lang, ("--dpi", str(TARGET_DPI)))
+            else:
+                text = run_tesseract(img, lang)
+        if key:
+            cache.put_bytes(key, text.encode("utf-8"), ".txt")
+        return text
+    except Exception as e:
+        return f"OCR失败: {e}"
+
+def ocr_images(image_paths, lang="chi_sim", workers=None, preprocess=False, cache=None):
+    # 批量OCR：有界线程池并发调用tesseract，按完成先后逐个产出(路径, 文本)，不必等整批结束
+    workers = workers or os.cpu_count() or 1
+    paths = iter(image_paths)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = {}
+        def submit_next():
+            path = next(paths, None)
+            if path is not None:
+                running[pool.submit(ocr_image, path, lang, preprocess, cache)] = path
+        for _ in range(workers * 2):
+            submit_next()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = running.pop(future)
+                submit_next()
+                yield path, future.result()
@@ -0,0 +1,104 @@
+import numpy as np
+from PIL import Image
+
+# 取色只需要几万像素，大图先按DCT缩放解码再最近邻采样，不混出原图没有的颜色
+SAMPLE_SIZE = 256
+SIGBITS = 5
+# 前75%的颜色按像素数切分，其余按像素数×体积切分，兼顾大色块和色彩跨度大的区域
+FRACT_BY_POPULATIONS = 0.75
+
+_SIDE = 1 << SIGBITS
+_CENTERS = (np.arange(_SIDE) + 0.5) * (1 << (8 - SIGBITS))
+
+def sample_pixels(img, sample_size=SAMPLE_SIZE):
+    # 返回(N, 3)的uint8像素：去掉半透明和接近纯白的像素，与ColorThief的取样规则一致
+    img.draft("RGB", (sample_size, sample_size))
+    if max(img.size) > sample_size:
+        scale = sample_size / max(img.size)
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.Resampling.NEAREST)
+    rgba = np.asarray(img.convert("RGBA")).reshape(-1, 4)
+    keep = (rgba[:, 3] >= 125) & ~np.all(rgba[:, :3] > 250, axis=1)
+    return rgba[keep, :3]
+
+def _histogram(pixels):
+    q = pixels >> (8 - SIGBITS)
+    index = (q[:, 0].astype(np.intp) << (2 * SIGBITS)) | (q[:, 1].astype(np.intp) << SIGBITS) | q[:, 2]
+    return np.bincount(index, minlength=_SIDE ** 3).reshape(_SIDE, _SIDE, _SIDE)
+
+def _tight(hist, box):
+    # 收缩到盒内非零格子的包围盒，保证切分后两边都有像素
+    (r1, r2), (g1, g2), (b1, b2) = box
+    sub = hist[r1:r2 + 1, g1:g2 + 1, b1:b2 + 1]
+    bounds = []
+    for axis, lo in enumerate((r1, g1, b1)):
+        nz = np.nonzero(sub.sum(axis=tuple(a for a in range(3) if a != axis)))[0]
+        bounds.append((lo + int(nz[0]), lo + int(nz[-1])))
+    return tuple(bounds)
+
+def _box_info(hist, box):
+    (r1, r2), (g1, g2), (b1, b2) = box
+    sub = hist[r1:r2 + 1, g1:g2 + 1, b1:b2 + 1]
+    count = int(sub.sum())
+    volume = (r2 - r1 + 1) * (g2 - g1 + 1) * (b2 - b1 + 1)
+    return {"box": box, "count": count, "volume": volume}
+
+def _split(hist, box):
+    # 沿最长的轴在像素数中位处切开(MMCQ规则：切点向较长的一侧偏移半个余量)
+    (r1, r2), (g1, g2), (b1, b2) = box
+    sub = hist[r1:r2 + 1, g1:g2 + 1, b1:b2 + 1]
+    axis = int(np.argmax(sub.shape))
+    length = sub.shape[axis]
+    if length == 1:
+        return None
+    cum = np.cumsum(sub.sum(axis=tuple(a for a in range(3) if a != axis)))
+    i = int(np.searchsorted(cum, cum[-1] / 2, side="right"))
+    left, right = i, length - 1 - i
+    cut = min(length - 2, int(i + right / 2)) if left <= right else max(0, int(i - 1 - left / 2))
+    lo = box[axis][0]
+    first, second = list(box), list(box)
+    first[axis] = (lo, lo + cut)
+    second[axis] = (lo + cut + 1, box[axis][1])
+    return _tight(hist, tuple(first)), _tight(hist, tuple(second))
+
+def _cut(hist, boxes, target, key):
+    while len(boxes) < target:
+        candidates = [b for b in boxes if b["volume"] > 1]
+        if not candidates:
+            break
+        box = max(candidates, key=key)
+        boxes.remove(box)
+        boxes.extend(_box_info(hist, b) for b in _split(hist, box["box"]))
+    return boxes
+
+def _average(hist, box):
+    (r1, r2), (g1, g2), (b1, b2) = box
+    sub = hist[r1:r2 + 1, g1:g2 + 1, b1:b2 + 1]
+    total = sub.sum()
+    r = (sub.sum(axis=(1, 2)) * _CENTERS[r1:r2 + 1]).sum() / total
+    g = (sub.sum(axis=(0, 2)) * _CENTERS[g1:g2 + 1]).sum() / total
+    b = (sub.sum(axis=(0, 1)) * _CENTERS[b1:b2 + 1]).sum() / total
+    return int(r), int(g), int(b)
+
+def quantize(pixels, color_count=6):
+    # 在5位量化的32³直方图上做中位切分，返回按像素数降序的颜色列表
+    if len(pixels) == 0:
+        return []
+    hist = _histogram(pixels)
+    full = ((0, _SIDE - 1),) * 3
+    boxes = [_box_info(hist, _tight(hist, full))]
+    boxes = _cut(hist, boxes, int(FRACT_BY_POPULATIONS * color_count), lambda b: b["count"])
+    boxes = _cut(hist, boxes, color_count, lambda b: b["count"] * b["volume"])
+    boxes.sort(key=lambda b: b["count"], reverse=True)
+    return [_average(hist, b["box"]) for b in boxes]
+
+def extract_palette(img, color_count=6, sample_size=SAMPLE_SIZE):
+    # 一次采样同时得到主色和调色板：主色即像素最多的颜色；没有有效像素时返回(None, [])
+    palette = quantize(sample_pixels(img, sample_size), color_count)
+    return (palette[0] if palette else None), palette
+
+def get_image_main_color(image_path):
+    try:
+        with Image.open(image_path) as img:
+            return extract_palette(img)
+    except Exception:
+        return None, []
@@ -0,0 +1,604 @@
+import math
+import os
+import struct
+import zlib
+from PIL import Image
+from encoder import encode_image
+from filters import apply_chain, chain_halo, contrast_steps
+from watermark import composite, watermark_layout
+
+# 像素数超过TILED_PIXELS的图片自动按条带处理；MEMORY_BUDGET决定每条带的行数，
+# MAX_PIXELS为分块模式可打开的上限，超过Pillow默认上限(约1.8亿像素)的扫描件/全景图也能处理
+TILED_PIXELS = int(os.environ.get("SNAPFORGE_TILED_PIXELS", 64 * 1024 * 1024))
+MEMORY_BUDGET = int(os.environ.get("SNAPFORGE_TILED_MEMORY", 256 * 1024 * 1024))
+MAX_PIXELS = int(os.environ.get("SNAPFORGE_TILED_MAX_PIXELS", 4 * 1024 * 1024 * 1024))
+LANCZOS_SUPPORT = 3.0
+REDUCING_GAP = 2.0
+TIFF_ROWS_PER_STRIP = 64
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+class NotTileable(Exception):
+    pass
+
+def open_large(source):
+    # Pillow对超大图片直接抛DecompressionBombError。像素上限是进程全局设置，临时放宽会让其他线程的
+    # 内存输入失去保护；这里按Image.open的方式识别格式、直接构造图片对象(只读文件头)，改以MAX_PIXELS为界
+    if hasattr(source, "read"):
+        source.seek(0)
+        prefix = source.read(16)
+    else:
+        with open(source, "rb") as f:
+            prefix = f.read(16)
+    Image.init()
+    for fmt in Image.ID:
+        factory, accept = Image.OPEN[fmt]
+        result = not accept or accept(prefix)
+        if not result or isinstance(result, str):
+            continue
+        if hasattr(source, "seek"):
+            source.seek(0)
+        try:
+            img = factory(source)
+        except (SyntaxError, IndexError, TypeError, struct.error):
+            continue
+        if img.width * img.height > MAX_PIXELS:
+            img.close()
+            raise Image.DecompressionBombError(f"图片像素数 {img.width * img.height} 超过分块处理上限 {MAX_PIXELS}")
+        return img
+    raise Image.UnidentifiedImageError(f"无法识别的图片文件: {source!r}")
+
+def should_tile(size):
+    return size[0] * size[1] > TILED_PIXELS
+
+def exceeds_pillow_limit(size):
+    return bool(Image.MAX_IMAGE_PIXELS) and size[0] * size[1] > 2 * Image.MAX_IMAGE_PIXELS
+
+def can_tile(plan, size):
+    # 条带只能自上而下读取：旋转需要整列像素，不支持；裁剪框须在画面内
+    for step in plan:
+        if step[0] == "rotate":
+            return False
+        if step[0] == "crop":
+            x0, y0, x1, y1 = step[1]
+            if x0 < 0 or y0 < 0 or x1 > size[0] or y1 > size[1] or x1 <= x0 or y1 <= y0:
+                return False
+    return True
+
+def _like(img, size):
+    # 与img同模式、同调色板和透明色的空白图
+    block = Image.new(img.mode, size)
+    if img.mode in ("P", "PA"):
+        block.putpalette(img.getpalette())
+    if "transparency" in img.info:
+        block.info["transparency"] = img.info["transparency"]
+    return block
+
+class _ImageReader:
+    # 已解码(JPEG可按比例解码)的整幅图片，按行裁出条带；用于无法逐块解码的格式
+    def __init__(self, img):
+        self.img = img
+        self.size = img.size
+        self.mode = img.mode
+    def read(self, y0, y1):
+        return self.img.crop((0, y0, self.size[0], y1))
+
+class _RawReader:
+    # 未压缩格式(BMP/PPM/TGA/未压缩TIFF)：按行偏移只读取所需字节，不解码整幅图片
+    def __init__(self, img):
+        self.fp = img.fp
+        self.size = img.size
+        self.mode = img.mode
+        # 调色板可能还是文件中的原始字节(如BMP的BGRX)，按原始格式整体传给条带
+        self.palette = img.palette.getdata() if img.palette and img.mode in ("P", "PA") else None
+        self.transparency = img.info.get("transparency")
+        self.strips = []
+        width = img.width
+        for tile in img.tile:
+            name, extents, offset, args = tile
+            if name != "raw" or extents[0] != 0 or extents[2] != width or self.fp is None:
+                raise NotTileable(name)
+            args = (args,) if isinstance(args, str) else tuple(args)
+            rawmode = args[0]
+            stride = args[1] if len(args) > 1 else 0
+            orientation = args[2] if len(args) > 2 else 1
+            if not stride:
+                stride = len(Image.new(img.mode, (width, 1)).tobytes("raw", rawmode))
+            self.strips.append((extents[1], extents[3], offset, rawmode, stride, orientation))
+    def read(self, y0, y1):
+        width = self.size[0]
+        block = Image.new(self.mode, (width, y1 - y0))
+        for top, bottom, offset, rawmode, stride, orientation in self.strips:
+            a, b = max(y0, top), min(y1, bottom)
+            if a >= b:
+                continue
+            # 自下而上存储的文件(BMP)行序相反
+            start = offset + ((bottom - b) if orientation < 0 else (a - top)) * stride
+            self.fp.seek(start)
+            part = Image.frombytes(self.mode, (width, b - a), self.fp.read((b - a) * stride), "raw", rawmode, stride, orientation)
+            block.paste(part, (0, a - y0))
+        if self.palette:
+            rawmode, data = self.palette
+            block.putpalette(data, rawmode)
+        if self.transparency is not None:
+            block.info["transparency"] = self.transparency
+        return block
+
+class _PngReader:
+    # 非隔行8位PNG：流式解压IDAT，每次取若干行，连同上一块的最后一行(滤波类型0)交给Pillow的PNG解码器还原滤波；
+    # 只能自上而下读取，内存中只保留最近一次读出的条带
+    def __init__(self, img, skip_rows):
+        fp = img.fp
+        if fp is None:
+            raise NotTileable("png")
+        fp.seek(0)
+        if fp.read(8) != PNG_SIGNATURE:
+            raise NotTileable("png")
+        self.fp = fp
+        self.size = img.size
+        self.mode = img.mode
+        self.skip_rows = skip_rows
+        self.palette = self.palette_mode = None
+        if img.mode == "P" and img.palette is not None:
+            self.palette_mode, self.palette = img.palette.getdata()
+        self.info = {"transparency": img.info["transparency"]} if "transparency" in img.info else {}
+        while True:
+            length, kind = struct.unpack(">I4s", fp.read(8))
+            if kind == b"IDAT":
+                self.remaining = length
+                break
+            data = fp.read(length)
+            fp.read(4)
+            if kind == b"IHDR":
+                depth, color, _, _, interlace = struct.unpack(">BBBBB", data[8:13])
+                if depth != 8 or interlace or color not in PNG_CHANNELS:
+                    raise NotTileable("png")
+                self.row_bytes = self.size[0] * PNG_CHANNELS[color] + 1
+        self.inflate = zlib.decompressobj()
+        self.pending = bytearray()
+        self.prev = None
+        self.next_row = 0
+        self.buf = None
+        self.buf_y0 = 0
+    def _feed(self):
+        if self.remaining == 0:
+            self.fp.read(4)
+            length, kind = struct.unpack(">I4s", self.fp.read(8))
+            if kind != b"IDAT":
+                raise ValueError("PNG数据不完整")
+            self.remaining = length
+        data = self.fp.read(min(self.remaining, 1024 * 1024))
+        if not data:
+            raise ValueError("PNG数据不完整")
+        self.remaining -= len(data)
+        self.pending += self.inflate.decompress(data)
+    def _decode(self, rows):
+        need = rows * self.row_bytes
+        while len(self.pending) < need:
+            self._feed()
+        # 未压缩的deflate存储块交给Pillow的PNG解码器还原滤波，省去拼PNG文件、算CRC
+        data = bytearray(b"\x00" + self.prev if self.prev else b"")
+        with memoryview(self.pending) as view:
+            data += view[:need]
+        del self.pending[:need]
+        block = Image.frombytes(self.mode, (self.size[0], rows + (1 if self.prev else 0)), zlib.compress(data, 0), "zip", self.mode)
+        del data
+        if self.palette is not None:
+            block.putpalette(self.palette, self.palette_mode)
+        block.info.update(self.info)
+        if self.prev:
+            block = block.crop((0, 1, block.width, block.height))
+        self.prev = block.crop((0, rows - 1, block.width, rows)).tobytes()
+        self.next_row += rows
+        return block
+    def read(self, y0, y1):
+        width = self.size[0]
+        if y0 < self.buf_y0:
+            raise NotTileable("png")
+        while self.next_row < y0:
+            self._decode(min(y0 - self.next_row, self.skip_rows))
+            self.buf = None
+        parts = []
+        if self.buf is not None and y0 < self.next_row:
+            parts.append(self.buf.crop((0, y0 - self.buf_y0, width, min(y1, self.next_row) - self.buf_y0)))
+        if y1 > self.next_row:
+            parts.append(self._decode(y1 - self.next_row))
+        block = parts[0]
+        if len(parts) > 1:
+            block = _like(parts[1], (width, y1 - y0))
+            block.paste(parts[0], (0, 0))
+            block.paste(parts[1], (0, parts[0].height))
+        if y1 >= self.next_row:
+            self.buf, self.buf_y0 = block, y0
+        return block
+
+def _open_reader(processor, img, draft_mode, draft_size, skip_rows):
+    # 返回(读取器, 解码比例, 原图在解码结果中的区域)；能逐块解码的格式不整幅加载
+    try:
+        if img.format == "PNG":
+            return _PngReader(img, skip_rows), 1, (0, 0) + img.size
+        if img.tile and all(tile[0] == "raw" for tile in img.tile):
+            return _RawReader(img), 1, (0, 0) + img.size
+    except Exception:
+        # 不支持逐块读取的变体(16位、隔行、压缩TIFF等)退回整幅解码
+        pass
+    src_w = img.width
+    region = processor._load_image(img, draft_mode, draft_size)
+    return _ImageReader(img), region[2] / src_w, region
+
+class _Layout:
+    # 缩放/裁剪的几何：src_box为源图上的取样框，out为缩放结果尺寸；canvas不为None时结果再贴到该尺寸的底图上
+    def __init__(self, src_box, out, resample, canvas=None, offset=(0, 0), background=None):
+        self.src_box = src_box
+        self.out = out
+        self.resample = resample
+        self.canvas = canvas
+        self.offset = offset
+        self.background = background
+
+def _resize_layout(processor, box, width, height, mode="fit", only_shrink=True):
+    # 与ImageProcessor._resize_image的各模式逐一对应，只计算几何不处理像素
+    orig_w, orig_h = box[2] - box[0], box[3] - box[1]
+    whole = _Layout(tuple(round(v) for v in box), (round(orig_w), round(orig_h)), False)
+    if only_shrink and orig_w <= width and orig_h <= height:
+        return whole
+    if mode in ("fit", "pad"):
+        new_size = processor._fit_size((orig_w, orig_h), width, height)
+        layout = _Layout(box, new_size, True) if new_size else whole
+        if mode == "pad":
+            layout.canvas = (width, height)
+            layout.offset = ((width - layout.out[0]) // 2, (height - layout.out[1]) // 2)
+            layout.background = "pad"
+        return layout
+    if mode == "fill":
+        ratio = max(width / orig_w, height / orig_h)
+        new_w, new_h = int(orig_w * ratio), int(orig_h * ratio)
+        left, top = (new_w - width) // 2, (new_h - height) // 2
+        scale_x, scale_y = orig_w / new_w, orig_h / new_h
+        sub_box = (
+            box[0] + left * scale_x, box[1] + top * scale_y,
+            box[0] + (left + width) * scale_x, box[1] + (top + height) * scale_y
+        )
+        return _Layout(sub_box, (width, height), True)
+    if mode == "crop":
+        x0, y0 = whole.src_box[0] + max(0, (orig_w - width) // 2), whole.src_box[1] + max(0, (orig_h - height) // 2)
+        x1, y1 = min(x0 + width, whole.src_box[2]), min(y0 + height, whole.src_box[3])
+        layout = _Layout((x0, y0, x1, y1), (x1 - x0, y1 - y0), False)
+        if layout.out != (width, height):
+            layout.canvas = (width, height)
+            layout.background = "zero"
+        return layout
+    return whole
+
+def _split_plan(processor, plan, size, scale, region):
+    # 把操作序列拆成：缩放前逐条带的模式转换、缩放几何、缩放后逐条带的操作；bounds为重采样可取到的像素范围
+    bounds = (0, 0) + size
+    pre, post = [], []
+    layout = None
+    for step in plan:
+        op = step[0]
+        if op == "crop":
+            bounds = step[1]
+        elif op == "resize":
+            box = step[2]
+            if box is not None:
+                box = tuple(v * scale for v in box)
+            elif scale != 1:
+                box = region
+            else:
+                box = bounds
+            layout = _resize_layout(processor, box, *step[1])
+        elif op == "rotate":
+            raise NotTileable("rotate")
+        elif layout is None and op == "convert":
+            pre.append(step)
+        else:
+            post.append(step)
+    if layout is None:
+        layout = _Layout(bounds, (bounds[2] - bounds[0], bounds[3] - bounds[1]), False)
+    return pre, post, layout, bounds
+
+def _convert(img, steps):
+    for step in steps:
+        if img.mode != step[1]:
+            img = img.convert(step[1])
+    return img
+
+class _Renderer:
+    # 按输出行号生成条带：先取所需的源行(含重采样核的余量)，整数倍缩小后再用LANCZOS精确缩放
+    def __init__(self, reader, pre, layout, bounds):
+        self.reader = reader
+        self.pre = pre
+        self.layout = layout
+        self.bounds = bounds
+        self.mode = _convert(Image.new(reader.mode, (1, 1)), pre).mode
+        self.alpha = self.mode in ("LA", "RGBA")
+    def out_rows(self, r0, r1):
+        sx0, sy0, sx1, sy1 = self.layout.src_box
+        ow, oh = self.layout.out
+        tx0, ty0, tx1, ty1 = self.bounds
+        if not self.layout.resample:
+            rows = self.reader.read(sy0 + r0, sy0 + r1)
+            return _convert(rows.crop((sx0, 0, sx0 + ow, r1 - r0)), self.pre)
+        scale_x, scale_y = (sx1 - sx0) / ow, (sy1 - sy0) / oh
+        fx, fy = max(1, int(scale_x / REDUCING_GAP)), max(1, int(scale_y / REDUCING_GAP))
+        if self.alpha:
+            # Image.resize对带透明通道的图片忽略reducing_gap，直接在预乘空间里重采样，保持一致
+            fx = fy = 1
+        support = LANCZOS_SUPPORT * max(scale_y / fy, 1.0) + 1
+        top = (sy0 - ty0) / fy + r0 * scale_y / fy
+        bottom = (sy0 - ty0) / fy + r1 * scale_y / fy
+        lo = max(0, math.floor(top - support))
+        hi = min(math.ceil((ty1 - ty0) / fy), math.ceil(bottom + support))
+        rows = self.reader.read(ty0 + lo * fy, min(ty1, ty0 + hi * fy))
+        rows = _convert(rows.crop((tx0, 0, tx1, rows.height)), self.pre)
+        mode = rows.mode
+        if self.alpha:
+            rows = rows.convert({"LA": "La", "RGBA": "RGBa"}[mode])
+        if fx > 1 or fy > 1:
+            rows = rows.reduce((fx, fy))
+        box = ((sx0 - tx0) / fx, top - lo, min((sx1 - tx0) / fx, rows.width), min(bottom - lo, rows.height))
+        rows = rows.resize((ow, r1 - r0), Image.Resampling.LANCZOS, box=box)
+        return rows.convert(mode) if rows.mode != mode else rows
+    def canvas_rows(self, a, b):
+        layout = self.layout
+        if layout.canvas is None:
+            return self.out_rows(a, b)
+        (cw, _), (ox, oy) = layout.canvas, layout.offset
+        r0, r1 = max(a - oy, 0), min(b - oy, layout.out[1])
+        part = self.out_rows(r0, r1) if r0 < r1 else None
+        mode = self.mode
+        if layout.background == "pad":
+            strip = Image.new("L", (cw, b - a), 255) if mode == "L" else Image.new("RGBA", (cw, b - a), (255, 255, 255, 0))
+        else:
+            strip = Image.new(mode, (cw, b - a))
+        if part is not None:
+            strip.paste(part, (ox, r0 + oy - a))
+        return strip
+
+def _apply_post(strip, post, top, marks, means):
+    for step in post:
+        op = step[0]
+        if op == "convert":
+            if strip.mode != step[1]:
+                strip = strip.convert(step[1])
+        elif op == "filter":
+            # 对比度的中心用预扫描得到的整幅均值
+            strip = apply_chain(strip, step[1], means)
+        elif op == "watermark":
+            if marks:
+                if strip.mode not in ("RGBA", "RGB", "L"):
+                    strip = strip.convert("RGBA")
+                tile, positions = marks
+                for x, y in positions:
+                    if y < top + strip.height and y + tile.height > top:
+                        composite(strip, tile, x, y - top)
+        elif op == "flatten":
+            if strip.mode in ("RGBA", "LA"):
+                strip = strip.convert(step[1])
+    return strip
+
+def _open_output(dest_path):
+    # dest_path为可写文件对象(内存处理)时直接写入，由调用方负责关闭
+    if hasattr(dest_path, "write"):
+        return dest_path, False
+    return open(dest_path, "wb"), True
+
+class _MemoryWriter:
+    # 输出不大(在内存预算内)或格式不支持逐块写出时，拼成整幅后按常规方式保存；encode不为空时同样走编码调优
+    def __init__(self, dest_path, size, save_params, encode=None):
+        self.dest_path = dest_path
+        self.size = size
+        self.save_params = save_params
+        self.encode = encode
+        self.img = None
+        self.y = 0
+    def write(self, strip):
+        if self.img is None:
+            self.img = Image.new(strip.mode, self.size)
+        self.img.paste(strip, (0, self.y))
+        self.y += strip.height
+    def close(self):
+        if self.encode:
+            encode_image(self.img, self.dest_path, self.save_params, self.encode)
+        else:
+            self.img.save(self.dest_path, **self.save_params)
+
+class _PngWriter:
+    # 逐条带写PNG：每行在None/Sub/Up/Average/Paeth中选绝对值和最小的滤波，压缩后分段写入IDAT
+    COLOR_TYPES = {"L": 0, "LA": 4, "RGB": 2, "RGBA": 6}
+    def __init__(self, dest_path, size, mode, compress_level=6, exif=None):
+        if mode not in self.COLOR_TYPES:
+            raise NotTileable(mode)
+        self.out, self.own = _open_output(dest_path)
+        self.channels = len(mode)
+        self.prev = None
+        self.zlib = zlib.compressobj(compress_level)
+        self.out.write(PNG_SIGNATURE)
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", size[0], size[1], 8, self.COLOR_TYPES[mode], 0, 0, 0))
+        if exif:
+            self._chunk(b"eXIf", exif[6:] if exif.startswith(b"Exif\x00\x00") else exif)
+    def _chunk(self, kind, data):
+        self.out.write(struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data)))
+    def write(self, strip):
+        import numpy as np
+        rows = np.asarray(strip, dtype=np.uint8).reshape(strip.height, -1)
+        c = self.channels
+        up = np.empty_like(rows)
+        up[0] = self.prev if self.prev is not None else 0
+        up[1:] = rows[:-1]
+        left = np.zeros_like(rows)
+        left[:, c:] = rows[:, :-c]
+        upleft = np.zeros_like(rows)
+        upleft[:, c:] = up[:, :-c]
+        left16, up16, upleft16 = left.astype(np.int16), up.astype(np.int16), upleft.astype(np.int16)
+        p = left16 + up16 - upleft16
+        pa, pb, pc = np.abs(p - left16), np.abs(p - up16), np.abs(p - upleft16)
+        paeth = np.where((pa <= pb) & (pa <= pc), left, np.where(pb <= pc, up, upleft))
+        candidates = np.stack([
+            rows, rows - left, rows - up,
+            rows - ((left16 + up16) >> 1).astype(np.uint8), rows - paeth
+        ])
+        cost = np.minimum(candidates, 256 - candidates.astype(np.int16)).sum(axis=2, dtype=np.int64)
+        choice = cost.argmin(axis=0)
+        filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = choice
+        filtered[:, 1:] = candidates[choice, np.arange(rows.shape[0])]
+        self.prev = rows[-1].copy()
+        data = self.zlib.compress(filtered.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+    def close(self):
+        self._chunk(b"IDAT", self.zlib.flush())
+        self._chunk(b"IEND", b"")
+        if self.own:
+            self.out.close()
+
+class _TiffWriter:
+    # 逐条带写TIFF：每TIFF_ROWS_PER_STRIP行一个条带，水平差分预测+Deflate压缩，最后写目录(IFD)
+    PHOTOMETRIC = {"L": 1, "LA": 1, "RGB": 2, "RGBA": 2}
+    def __init__(self, dest_path, size, mode, compress_level=1):
+        if mode not in self.PHOTOMETRIC:
+            raise NotTileable(mode)
+        self.out, self.own = _open_output(dest_path)
+        self.size = size
+        self.mode = mode
+        self.channels = len(mode)
+        self.level = compress_level
+        self.offsets, self.counts = [], []
+        self.pending = None
+        # 写入文件对象时可能不是从开头写起，TIFF内的偏移都相对于起始位置
+        self.base = self.out.tell()
+        self.out.write(b"II*\x00\x00\x00\x00\x00")
+    def _flush(self, rows):
+        diff = rows.copy()
+        diff[:, self.channels:] -= rows[:, :-self.channels]
+        data = zlib.compress(diff.tobytes(), self.level)
+        self.offsets.append(self.out.tell() - self.base)
+        self.counts.append(len(data))
+        self.out.write(data)
+    def write(self, strip):
+        import numpy as np
+        rows = np.asarray(strip, dtype=np.uint8).reshape(strip.height, -1)
+        if self.pending is not None:
+            rows = np.concatenate([self.pending, rows])
+        full = rows.shape[0] // TIFF_ROWS_PER_STRIP * TIFF_ROWS_PER_STRIP
+        for y in range(0, full, TIFF_ROWS_PER_STRIP):
+            self._flush(rows[y:y + TIFF_ROWS_PER_STRIP])
+        self.pending = rows[full:] if full < rows.shape[0] else None
+    def close(self):
+        if self.pending is not None:
+            self._flush(self.pending)
+        out = self.out
+        if out.tell() - self.base + 8 * len(self.offsets) + 256 > 0xFFFFFFFF:
+            if self.own:
+                out.close()
+            raise ValueError("TIFF输出超过4GB")
+        def array(kind, values):
+            # 超过4字节的取值写在目录之外，条目里记偏移
+            fmt = "<" + kind * len(values)
+            if struct.calcsize(fmt) <= 4:
+                return (struct.pack(fmt, *values) + b"\x00\x00\x00\x00")[:4]
+            if (out.tell() - self.base) % 2:
+                out.write(b"\x00")
+            offset = out.tell() - self.base
+            out.write(struct.pack(fmt, *values))
+            return struct.pack("<I", offset)
+        SHORT, LONG = 3, 4
+        entries = [
+            (256, LONG, [self.size[0]]), (257, LONG, [self.size[1]]),
+            (258, SHORT, [8] * self.channels), (259, SHORT, [8]),
+            (262, SHORT, [self.PHOTOMETRIC[self.mode]]), (273, LONG, self.offsets),
+            (277, SHORT, [self.channels]), (278, LONG, [TIFF_ROWS_PER_STRIP]),
+            (279, LONG, self.counts), (284, SHORT, [1]), (317, SHORT, [2]),
+        ]
+        if self.mode in ("LA", "RGBA"):
+            entries.append((338, SHORT, [2]))
+        packed = [(tag, kind, len(values), array("H" if kind == SHORT else "I", values)) for tag, kind, values in entries]
+        if (out.tell() - self.base) % 2:
+            out.write(b"\x00")
+        ifd = out.tell() - self.base
+        out.write(struct.pack("<H", len(packed)))
+        for tag, kind, count, value in packed:
+            out.write(struct.pack("<HHI", tag, kind, count) + value)
+        out.write(b"\x00\x00\x00\x00")
+        end = out.tell()
+        out.seek(self.base + 4)
+        out.write(struct.pack("<I", ifd))
+        out.seek(end)
+        if self.own:
+            out.close()
+
+def _output_format(dest_path, save_params):
+    return save_params.get("format") or Image.registered_extensions().get(os.path.splitext(dest_path)[1].lower())
+
+def _open_writer(dest_path, size, mode, save_params, memory, encode=None):
+    if size[0] * size[1] * len(mode) > memory:
+        fmt = _output_format(dest_path, save_params)
+        try:
+            if fmt == "PNG":
+                # 逐块写出时无法统计整幅颜色数，编码调优只取最高压缩等级，不做调色板转换
+                level = 9 if encode and encode.get("optimize", True) else save_params.get("compress_level", 6)
+                return _PngWriter(dest_path, size, mode, level, save_params.get("exif"))
+            if fmt == "TIFF":
+                # 整幅保存的TIFF不压缩；条带输出用最快一档Deflate，速度接近不压缩，文件小得多
+                return _TiffWriter(dest_path, size, mode, save_params.get("compress_level", 1))
+        except NotTileable:
+            pass
+    if exceeds_pillow_limit(size):
+        raise ValueError("输出超过Pillow像素上限，只能以PNG/TIFF格式分块写出")
+    # JPEG/WEBP等Pillow编码器只能一次性编码整幅图片，按内存方式输出
+    return _MemoryWriter(dest_path, size, save_params, encode)
+
+def process_tiled(processor, img, plan, draft_mode, draft_size, dest_path, save_params, encode=None, memory=MEMORY_BUDGET):
+    # 整条操作序列按输出条带执行：输入逐块解码，缩放/滤镜/水印只处理当前条带，结果逐块写出
+    src_w = img.width
+    rows_hint = max(16, memory // max(1, 16 * src_w))
+    reader, scale, region = _open_reader(processor, img, draft_mode, draft_size, rows_hint)
+    pre, post, layout, bounds = _split_plan(processor, plan, reader.size, scale, region)
+    renderer = _Renderer(reader, pre, layout, bounds)
+    cw, ch = layout.canvas or layout.out
+    if exceeds_pillow_limit((cw, ch)) and _output_format(dest_path, save_params) not in ("PNG", "TIFF"):
+        # 不能逐块写出的格式需要整幅图在内存中，超过Pillow上限直接拒绝，不先做完整条处理
+        raise ValueError("输出超过Pillow像素上限，只能以PNG/TIFF格式分块写出")
+    ratio = (layout.src_box[3] - layout.src_box[1]) / layout.out[1] if layout.resample else 1.0
+    # 每输出一行约需ratio行输入；按4通道、约4份中间副本估算每行占用，求条带行数
+    row_bytes = 4 * 4 * (cw + max(ratio, 1.0) * (bounds[2] - bounds[0]))
+    strip_h = max(16, int(memory // row_bytes))
+    halo = sum(chain_halo(s[1]) for s in post if s[0] == "filter")
+    watermark = next((s[1] for s in post if s[0] == "watermark"), None)
+    marks = watermark_layout((cw, ch), watermark) if watermark and watermark.get("text") else None
+    means = {}
+    position = next((i for i, s in enumerate(post) if s[0] == "filter"), None)
+    for index in contrast_steps(post[position][1]) if position is not None else ():
+        # 每个对比度步骤预扫描一遍，求该步之前整幅图的平均亮度(与ImageEnhance.Contrast一致)；PNG只能顺序读取，扫描后重新打开
+        hist = [0] * 256
+        for y0 in range(0, ch, strip_h):
+            y1 = min(ch, y0 + strip_h)
+            a, b = max(0, y0 - halo), min(ch, y1 + halo)
+            strip = _apply_post(renderer.canvas_rows(a, b), post[:position], a, marks, means)
+            strip = apply_chain(strip, post[position][1], means, stop=index)
+            if halo:
+                strip = strip.crop((0, y0 - a, cw, y1 - a))
+            for i, count in enumerate(strip.convert("L").histogram()):
+                hist[i] += count
+        means[index] = int(sum(i * h for i, h in enumerate(hist)) / (cw * ch) + 0.5)
+        if isinstance(reader, _PngReader):
+            renderer.reader = _PngReader(img, rows_hint)
+    writer = None
+    try:
+        for y0 in range(0, ch, strip_h):
+            y1 = min(ch, y0 + strip_h)
+            a, b = max(0, y0 - halo), min(ch, y1 + halo)
+            strip = _apply_post(renderer.canvas_rows(a, b), post, a, marks, means)
+            if halo:
+                strip = strip.crop((0, y0 - a, cw, y1 - a))
+            if writer is None:
+                writer = _open_writer(dest_path, (cw, ch), strip.mode, save_params, memory, encode)
+            writer.write(strip)
+        writer.close()
+    except Exception:
+        # 写了一半的文件由调用方随临时文件一起清理，这里只关闭句柄
+        if getattr(writer, "own", False):
+            writer.out.close()
+        raise
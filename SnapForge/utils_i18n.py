@@ -7,6 +7,7 @@ lang_dict = {
     "处理记录": "Processing History",
     "图片去背景": "Remove Background",
     "上传图片进行去背景": "Upload images for background removal",
+    "大图缩小后求蒙版（更快）": "Compute mask on downscaled image (faster)",
     "开始去背景": "Start Background Removal",
     "⬇️ 下载全部去背景结果（zip包）": "⬇️ Download all background removal results (zip)",
     "上传图片文件": "Upload Image Files",
@@ -37,6 +38,7 @@ lang_dict = {
     "水印内容": "Watermark Text",
     "水印位置": "Watermark Position",
     "水印字号": "Watermark Font Size",
+    "水印角度": "Watermark Angle",
     "启用批量裁剪": "Enable Crop",
     "裁剪X": "Crop X",
     "裁剪Y": "Crop Y",
@@ -44,6 +46,13 @@ lang_dict = {
     "裁剪高": "Crop Height",
     "批量旋转角度": "Rotate Angle",
     "批量滤镜": "Filter",
+    "亮度系数": "Brightness Factor",
+    "对比度系数": "Contrast Factor",
+    "高斯模糊半径": "Gaussian Blur Radius",
+    "USM锐化半径": "Unsharp Mask Radius",
+    "USM锐化强度(%)": "Unsharp Mask Amount (%)",
+    "USM锐化阈值": "Unsharp Mask Threshold",
+    "并行进程数": "Parallel Workers",
     "📂 上传图片 & 选择模式": "📂 Upload Images & Choose Mode",
     "🛠️ 图片处理参数": "🛠️ Image Processing Params",
     "重命名、格式转换与压缩": "File Rename/Format/Compression",
@@ -56,6 +65,7 @@ lang_dict = {
     "⚠️ 有部分图片未处理成功：": "⚠️ Some images failed: ",
     "✅ 处理完成：": "✅ Done: ",
     "⬇️ 下载全部处理结果（zip包）": "⬇️ Download all results (zip)",
+    "⬇️ 下载处理结果": "⬇️ Download result",
     "请上传图片并设置参数后，点击【开始处理图片】": "Please upload images and set parameters, then click [Start Processing]",
     "🚀 开始处理图片": "🚀 Start Processing",
     "请先上传图片文件！": "Please upload image files first!",
@@ -82,6 +92,9 @@ lang_dict = {
     "上传需去重的图片": "Upload images to deduplicate",
     "相似度阈值(越低越严格)": "Similarity Threshold (lower = stricter)",
     "开始去重": "Start Deduplication",
+    "分组方式": "Grouping",
+    "相似聚类（cluster）": "Cluster (connected)",
+    "逐个比对（greedy）": "Greedy",
     "未检测到重复图片。": "No duplicates found.",
     "检测到 ": "Found ",
     " 组重复图片：": " groups of duplicates:",
@@ -92,10 +105,18 @@ lang_dict = {
     "开始AI识别": "Start AI Recognition",
     "正在识别图片内容...": "Recognizing...",
     "识别标签：": "Tags:",
+    "上传前缩小图片（更快）": "Downscale images before upload (faster)",
+    "上传体积：": "Upload size: ",
+    "优化编码（更小文件）": "Optimize encoding (smaller files)",
+    "目标体积（KB，0为不限）": "Target size (KB, 0 = no limit)",
+    "目标画质SSIM（0为不限）": "Target quality SSIM (0 = no limit)",
+    "输出体积：": "Output size: ",
     "AI识别调用失败: ": "AI recognition failed: ",
     "批量OCR文字识别": "Batch OCR Text Recognition",
     "上传图片进行OCR": "Upload images for OCR",
+    "扫描件预处理（灰度、二值化）": "Scan preprocessing (grayscale, binarize)",
     "开始OCR识别": "Start OCR Recognition",
+    "识别中...": "Recognizing...",
     "识别结果": "Result",
     "智能图片分类（尺寸/主色调）": "Smart Image Classification (shape/color)",
     "上传图片进行智能分类": "Upload images for smart classification",
@@ -0,0 +1,86 @@
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+
+DEFAULT_FONT = "arial.ttf"
+MARGIN = 10
+# 平铺水印相邻两块之间的默认间距(像素)
+TILE_SPACING = 80
+
+@lru_cache(maxsize=32)
+def load_font(font_path=None, size=32):
+    # 同一(字体, 字号)在进程内只从磁盘加载一次；找不到字体时退回Pillow自带字体
+    try:
+        return ImageFont.truetype(font_path or DEFAULT_FONT, size)
+    except OSError:
+        try:
+            return ImageFont.load_default(size)
+        except TypeError:
+            return ImageFont.load_default()
+
+@lru_cache(maxsize=64)
+def render_text(text, font_path=None, size=32, color=(255, 255, 255, 128), angle=0):
+    # 文字只渲染一次到紧贴字形的RGBA小图；返回(小图, 字形在排版框内的偏移, 排版框尺寸)。
+    # 排版框与原先textsize的含义一致，用于计算位置，保证水印落点与之前相同。返回的小图只读，不要修改
+    font = load_font(font_path, size)
+    left, top, right, bottom = font.getbbox(text)
+    tile = Image.new("RGBA", (max(1, right - left), max(1, bottom - top)), (0, 0, 0, 0))
+    ImageDraw.Draw(tile).text((-left, -top), text, font=font, fill=tuple(color))
+    if angle % 360:
+        tile = tile.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True)
+        return tile, (0, 0), tile.size
+    return tile, (left, top), (right, bottom)
+
+def composite(img, tile, x, y):
+    # 只在水印覆盖的区域内混合；超出画面的部分先裁掉。RGBA原地alpha_composite，其它模式用透明度作蒙版贴上颜色
+    left, top = max(x, 0), max(y, 0)
+    right, bottom = min(x + tile.width, img.width), min(y + tile.height, img.height)
+    if right <= left or bottom <= top:
+        return
+    source = (left - x, top - y, right - x, bottom - y)
+    if img.mode == "RGBA":
+        img.alpha_composite(tile, dest=(left, top), source=source)
+        return
+    part = tile.crop(source) if source != (0, 0) + tile.size else tile
+    fill = part if img.mode == "RGB" else part.convert(img.mode)
+    img.paste(fill, (left, top), part.getchannel("A"))
+
+def tile_positions(size, tile_size, spacing=TILE_SPACING):
+    # 平铺水印的落点：按行铺满画面，隔行错开半个步长
+    width, height = size
+    step_x, step_y = tile_size[0] + spacing, tile_size[1] + spacing
+    for row, y in enumerate(range(-tile_size[1] // 2, height, step_y)):
+        shift = (step_x // 2) if row % 2 else 0
+        for x in range(-shift, width, step_x):
+            yield x, y
+
+def watermark_layout(size, watermark):
+    # 按画面尺寸求水印小图及其所有落点(左上角坐标)；分块处理时各条带按自身偏移复用同一组落点
+    tile, (off_x, off_y), (text_w, text_h) = render_text(
+        watermark.get("text"), watermark.get("font"), watermark.get("size", 32),
+        tuple(watermark.get("color", (255, 255, 255, 128))), watermark.get("angle", 0)
+    )
+    width, height = size
+    pos = watermark.get("pos", "bottom-right")
+    if pos == "tile":
+        return tile, list(tile_positions(size, tile.size, watermark.get("spacing", TILE_SPACING)))
+    positions = {
+        "bottom-right": (width - text_w - MARGIN, height - text_h - MARGIN),
+        "bottom-left": (MARGIN, height - text_h - MARGIN),
+        "top-right": (width - text_w - MARGIN, MARGIN),
+        "top-left": (MARGIN, MARGIN),
+        "center": ((width - text_w) // 2, (height - text_h) // 2)
+    }
+    x, y = positions.get(pos, positions["bottom-right"])
+    return tile, [(x + off_x, y + off_y)]
+
+def draw_watermark(img, watermark):
+    # 直接在img上绘制并返回；RGB/L图片不再转换成RGBA，也不分配整幅透明图层。
+    # pos取"tile"时在整幅画面平铺，spacing为间距，angle为文字旋转角度
+    if not watermark.get("text"):
+        return img
+    if img.mode not in ("RGBA", "RGB", "L"):
+        img = img.convert("RGBA")
+    tile, positions = watermark_layout(img.size, watermark)
+    for x, y in positions:
+        composite(img, tile, x, y)
+    return img
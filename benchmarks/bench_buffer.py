@@ -0,0 +1,84 @@
+# 单张请求：改造前API的落盘流程(上传写临时文件→batch_process写结果→读回) 对比 process_bytes内存处理的耗时与写入字节数
+# 用法: python benchmarks/bench_buffer.py [宽] [高] [次数]
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "SnapForge"))
+
+from logic import ImageProcessor  # noqa: E402
+
+
+def written_bytes():
+    # 本进程经write系统调用写出的字节数(含页缓存)，不支持时返回0
+    try:
+        with open("/proc/self/io") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("wchar"))
+    except (OSError, StopIteration):
+        return 0
+
+
+def via_files(processor, data, options):
+    # 改造前/process/的做法
+    temp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(temp_dir, "0000_upload.jpg")
+        with open(path, "wb") as out:
+            out.write(data)
+        _, _, res_paths = processor.batch_process(files=[path], prefix="api", **options)
+        with open(res_paths[0], "rb") as fin:
+            return fin.read()
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def via_bytes(processor, data, options):
+    return processor.process_bytes(data, "upload.jpg", **options)[0]
+
+
+def measure(func, processor, data, options, repeat):
+    before = written_bytes()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(processor, data, options)
+    seconds = (time.perf_counter() - start) / repeat
+    return result, seconds * 1000, (written_bytes() - before) / repeat
+
+
+def main():
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 1600
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 1200
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([(x / 8) % 256, (y / 6) % 256, ((x + y) / 10) % 256], axis=-1)
+    buf = io.BytesIO()
+    Image.fromarray((base + rng.normal(0, 8, base.shape)).clip(0, 255).astype(np.uint8)).save(buf, "JPEG", quality=90)
+    data = buf.getvalue()
+
+    processor = ImageProcessor()
+    tasks = {
+        "转WEBP": {"convert_format": ".webp"},
+        "缩放到400px": {"resize_enabled": True, "resize_width": 400, "resize_height": 400},
+        "缩放+水印+转PNG": {
+            "resize_enabled": True, "resize_width": 800, "resize_height": 800, "convert_format": ".png",
+            "watermark": {"text": "SnapForge", "pos": "bottom-right"},
+        },
+    }
+    print(f"{width}x{height} JPEG {len(data) / 1024:.0f} KB  每项{repeat}次取平均")
+    for name, options in tasks.items():
+        old, t_old, w_old = measure(via_files, processor, data, options, repeat)
+        new, t_new, w_new = measure(via_bytes, processor, data, options, repeat)
+        print(f"{name:<14} 落盘 {t_old:7.1f} ms 写入 {w_old / 1024:7.0f} KB   内存 {t_new:7.1f} ms 写入 {w_new / 1024:7.0f} KB"
+              f"  输出一致 {old == new}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# 云端识别吞吐：本地模拟服务(固定延迟，按比例返回429)上对比逐张串行请求与并发连接池客户端，以及上传前缩图节省的字节
+# 用法: python benchmarks/bench_cloud.py [图片数] [延迟毫秒] [429比例]
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "SnapForge"))
+
+
+# 模拟上行带宽(字节/秒)：本机回环没有带宽成本，按请求体大小额外等待，所有连接共享同一条链路
+UPLINK_BYTES_PER_SEC = 20 * 1024 * 1024
+UPLINK = threading.Lock()
+
+
+def make_handler(latency, throttle_ratio):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        connections = set()
+
+        def do_POST(self):
+            Handler.connections.add(self.client_address)
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with UPLINK:
+                time.sleep(len(body) / UPLINK_BYTES_PER_SEC)
+            time.sleep(latency)
+            if random.random() < throttle_ratio:
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            payload = json.dumps({"labels": [f"size-{len(body)}"]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def make_photos(directory, count, size=(6000, 4000)):
+    # 带噪声的渐变图，按高质量JPEG保存，体积接近相机原图
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:size[1], 0:size[0]]
+    base = np.stack([(x / 24) % 256, (y / 16) % 256, ((x + y) / 40) % 256], axis=-1)
+    paths = []
+    for i in range(count):
+        noisy = (base + rng.normal(0, 25, base.shape)).clip(0, 255).astype(np.uint8)
+        path = os.path.join(directory, f"photo_{i}.jpg")
+        Image.fromarray(noisy).save(path, quality=97)
+        paths.append(path)
+    return paths
+
+
+def serial(paths, url):
+    # 改造前的做法：每张图一个新连接，串行等待
+    results = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        response = requests.post(url, data=data, timeout=15)
+        results[path] = response.json()["labels"] if response.ok else ["调用失败"]
+    return results
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+    throttle = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+
+    handler = make_handler(latency, throttle)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v1/vision/detect"
+    os.environ["SNAPFORGE_DEEPSEEK_ENDPOINTS"] = url
+
+    import cloud
+    from cache import ResultCache
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(n):
+            path = os.path.join(tmp, f"{i}.jpg")
+            with open(path, "wb") as f:
+                f.write(os.urandom(2048 + i))
+            paths.append(path)
+
+        handler.connections.clear()
+        start = time.perf_counter()
+        serial(paths, url)
+        t_serial = time.perf_counter() - start
+        print(f"串行逐张请求      {t_serial:7.2f} s  {n / t_serial:7.1f} 张/秒  连接数 {len(handler.connections)}")
+
+        cache = ResultCache(os.path.join(tmp, ".cache"))
+        for concurrency in (4, 16, 32):
+            handler.connections.clear()
+            start = time.perf_counter()
+            results = cloud.ai_recognition_deepseek(
+                paths, api_key="test", endpoint=url, concurrency=concurrency, rate=1000, cache=None
+            )
+            elapsed = time.perf_counter() - start
+            failed = sum(1 for tags in results.values() if tags[0].startswith("调用失败"))
+            print(f"并发 {concurrency:>2} 连接池     {elapsed:7.2f} s  {n / elapsed:7.1f} 张/秒  "
+                  f"连接数 {len(handler.connections)}  失败 {failed}  加速 {t_serial / elapsed:5.1f}x")
+
+        for label in ("首次(写缓存)", "再次(命中缓存)"):
+            start = time.perf_counter()
+            cloud.ai_recognition_deepseek(paths, api_key="test", endpoint=url, concurrency=16, rate=1000, cache=cache)
+            elapsed = time.perf_counter() - start
+            print(f"并发 16 {label}  {elapsed:7.2f} s  {n / elapsed:7.1f} 张/秒")
+        print(f"缓存统计: {cache.stats()}")
+
+        # 限速：rate=20 时除去初始突发的20个令牌外，其余请求按每秒20次发出
+        sample = paths[:60]
+        start = time.perf_counter()
+        cloud.ai_recognition_deepseek(sample, api_key="test", endpoint=url, concurrency=16, rate=20)
+        elapsed = time.perf_counter() - start
+        print(f"限速 20 次/秒 {len(sample)} 张 {elapsed:7.2f} s  平均 {len(sample) / elapsed:5.1f} 次/秒(含初始突发)")
+
+        # 上传前缩图：相机原图大小的JPEG，对比原图上传与缩图后上传的字节数
+        photos = make_photos(tmp, 8)
+        for label, max_side in (("原图上传", 0), ("缩图上传", cloud.UPLOAD_MAX_SIDE)):
+            stats = cloud.UploadStats()
+            start = time.perf_counter()
+            cloud.ai_recognition_deepseek(photos, api_key="test", endpoint=url, concurrency=8, rate=1000,
+                                          max_side=max_side, stats=stats)
+            elapsed = time.perf_counter() - start
+            info = stats.stats()
+            print(f"{label}  {elapsed:7.2f} s  原始 {info['original_bytes'] / 1e6:7.1f} MB  "
+                  f"上传 {info['uploaded_bytes'] / 1e6:7.2f} MB  节省 {info['saved_ratio']:.1%}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
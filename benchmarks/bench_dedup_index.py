@@ -0,0 +1,85 @@
+# 对比 逐对比较 与 多索引哈希 的近似重复分组耗时，并校验两者分组结果一致；另测并查集聚类耗时
+# 用法: python benchmarks/bench_dedup_index.py [哈希数量...] [--threshold N] [--pairwise-limit N] [--workers N]
+# 数据为模拟图库：随机基准哈希 + 若干翻转少量比特的近似副本
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "SnapForge"))
+
+from hashindex import cluster_near_duplicates, group_near_duplicates
+
+
+def make_hashes(count, dup_ratio=0.2, max_flips=6, seed=0):
+    rng = random.Random(seed)
+    hashes = []
+    bases = []
+    for i in range(count):
+        if bases and rng.random() < dup_ratio:
+            value = rng.choice(bases)
+            for _ in range(rng.randint(0, max_flips)):
+                value ^= 1 << rng.randrange(64)
+        else:
+            value = rng.getrandbits(64)
+            bases.append(value)
+        hashes.append((f"img_{i:07d}.jpg", value))
+    return hashes
+
+
+def pairwise_groups(hashes, threshold):
+    # 与原实现相同的贪心两两比较
+    used = set()
+    groups = []
+    for path1, hash1 in hashes:
+        if path1 in used:
+            continue
+        group = [path1]
+        for path2, hash2 in hashes:
+            if path2 != path1 and path2 not in used and (hash1 ^ hash2).bit_count() <= threshold:
+                group.append(path2)
+                used.add(path2)
+        if len(group) > 1:
+            used.update(group)
+            groups.append(group)
+    return groups
+
+
+def main():
+    args = sys.argv[1:]
+    threshold = 8
+    pairwise_limit = 10000
+    workers = None
+    sizes = []
+    while args:
+        arg = args.pop(0)
+        if arg == "--threshold":
+            threshold = int(args.pop(0))
+        elif arg == "--pairwise-limit":
+            pairwise_limit = int(args.pop(0))
+        elif arg == "--workers":
+            workers = int(args.pop(0))
+        else:
+            sizes.append(int(arg))
+    sizes = sizes or [10000, 100000, 1000000]
+
+    for count in sizes:
+        hashes = make_hashes(count)
+        start = time.perf_counter()
+        groups = group_near_duplicates(hashes, threshold, workers)
+        indexed = time.perf_counter() - start
+        start = time.perf_counter()
+        clusters = cluster_near_duplicates(hashes, threshold, workers)
+        clustered = time.perf_counter() - start
+        line = (f"{count:>8} 张  阈值 {threshold}  索引 {indexed:8.2f}s  分组 {len(groups)}"
+                f"  聚类 {clustered:8.2f}s  聚类组 {len(clusters)}")
+        if count <= pairwise_limit:
+            start = time.perf_counter()
+            expected = pairwise_groups(hashes, threshold)
+            pairwise = time.perf_counter() - start
+            line += f"  逐对比较 {pairwise:8.2f}s  一致 {groups == expected}"
+        print(line, flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# 编码调优：默认参数保存 对比 encoder模块(optimize/progressive、目标体积/目标SSIM搜索、WEBP method、PNG调色板)的字节数与CPU耗时
+# 用法: python benchmarks/bench_encoder.py [宽] [高] [CPU预算秒]
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "SnapForge"))
+
+import encoder  # noqa: E402
+
+
+def make_photo(width, height):
+    # 带噪声的渐变图，近似相机照片
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([(x / 24) % 256, (y / 16) % 256, ((x + y) / 40) % 256], axis=-1)
+    return Image.fromarray((base + rng.normal(0, 12, base.shape)).clip(0, 255).astype(np.uint8))
+
+
+def make_graphic(width, height):
+    # 颜色很少的图表/截图
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    for i in range(40):
+        x, y = i * width // 40, i * height // 60
+        draw.rectangle((x, y, x + width // 8, y + height // 12), fill=(i * 6, 100, 255 - i * 6), outline="black")
+    return img
+
+
+def default_size(img, fmt, **params):
+    buf = io.BytesIO()
+    start = time.thread_time()
+    img.save(buf, format=fmt, **params)
+    return buf.tell(), time.thread_time() - start
+
+
+def tuned_size(img, fmt, options, tmp, **params):
+    path = os.path.join(tmp, "out")
+    start = time.thread_time()
+    size = encoder.encode_image(img, path, dict(params, format=fmt), options)
+    seconds = time.thread_time() - start
+    with Image.open(path) as out:
+        score = encoder.ssim(img, out) if fmt != "PNG" else 1.0
+    return size, seconds, score
+
+
+def main():
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+    budget = float(sys.argv[3]) if len(sys.argv) > 3 else encoder.CPU_BUDGET
+
+    photo, graphic = make_photo(width, height), make_graphic(width // 2, height // 2)
+    cases = [
+        ("照片 JPEG q85", photo, "JPEG", {"quality": 85}, {}),
+        ("照片 JPEG ≤800KB", photo, "JPEG", {"quality": 85}, {"target_size": 800 * 1024}),
+        ("照片 JPEG SSIM≥0.9", photo, "JPEG", {"quality": 95}, {"target_ssim": 0.9}),
+        ("照片 WEBP q80", photo, "WEBP", {"quality": 80}, {}),
+        ("照片 WEBP ≤500KB", photo, "WEBP", {"quality": 80}, {"target_size": 500 * 1024}),
+        ("图表 PNG", graphic, "PNG", {}, {}),
+        ("图表 WEBP", graphic, "WEBP", {"quality": 80}, {}),
+    ]
+    print(f"{width}x{height}  CPU预算 {budget:.1f} s/张")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, img, fmt, params, options in cases:
+            before, t_before = default_size(img, fmt, **params)
+            after, t_after, score = tuned_size(img, fmt, dict(options, cpu_budget=budget), tmp, **params)
+            print(f"{name:<18} 默认 {before / 1024:8.0f} KB {t_before:5.2f} s   调优 {after / 1024:8.0f} KB {t_after:5.2f} s"
+                  f"  节省 {1 - after / before:6.1%}  SSIM {score:.3f}")
+
+
+if __name__ == "__main__":
+    main()
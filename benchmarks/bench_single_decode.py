@@ -0,0 +1,69 @@
+# 对比 verify()+解码 两次打开 与 解码即校验 单次打开 的读盘量和耗时
+# 用法: python benchmarks/bench_single_decode.py [图片数量] [边长]
+import io
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+
+class CountingFile(io.FileIO):
+    bytes_read = 0
+    opens = 0
+
+    def __init__(self, path):
+        super().__init__(path, "rb")
+        CountingFile.opens += 1
+
+    def read(self, size=-1):
+        data = super().read(size)
+        CountingFile.bytes_read += len(data)
+        return data
+
+    def readinto(self, b):
+        n = super().readinto(b)
+        CountingFile.bytes_read += n or 0
+        return n
+
+
+def two_pass(path):
+    with Image.open(CountingFile(path)) as img:
+        img.verify()
+    with Image.open(CountingFile(path)) as img:
+        img.load()
+
+
+def single_pass(path):
+    with Image.open(CountingFile(path)) as img:
+        img.load()
+
+
+def run(name, func, paths):
+    CountingFile.bytes_read = 0
+    CountingFile.opens = 0
+    start = time.perf_counter()
+    for path in paths:
+        func(path)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} 打开次数={CountingFile.opens:<6} 读取={CountingFile.bytes_read / 1024 / 1024:8.1f} MB  耗时={elapsed:6.2f}s")
+    return CountingFile.bytes_read
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    edge = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i, ext in enumerate([".jpg", ".png"] * (count // 2)):
+            path = os.path.join(tmp, f"{i:04d}{ext}")
+            Image.effect_noise((edge, edge), 64).convert("RGB").save(path)
+            paths.append(path)
+        old = run("verify+解码", two_pass, paths)
+        new = run("单次解码", single_pass, paths)
+        print(f"节省读取: {(old - new) / 1024 / 1024:.1f} MB ({(1 - new / old) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
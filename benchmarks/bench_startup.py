@@ -0,0 +1,54 @@
+# 测量冷启动：在全新子进程中导入 logic / api / app，记录导入耗时和进程峰值内存
+# 用法: python benchmarks/bench_startup.py [重复次数] [模块...]
+# app 为 Streamlit 脚本，直接导入时以 bare 模式执行一遍页面代码
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "SnapForge"))
+
+CHILD = """
+import resource, sys, time, json, warnings, logging
+warnings.filterwarnings("ignore")
+logging.disable(logging.WARNING)
+sys.path.insert(0, {src!r})
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+print(json.dumps({{"seconds": seconds, "rss_mb": rss_mb, "modules": len(sys.modules)}}))
+"""
+
+
+def measure(module):
+    # 在临时目录中运行，避免app导入时在仓库里创建output目录
+    with tempfile.TemporaryDirectory() as cwd:
+        proc = subprocess.run(
+            [sys.executable, "-c", CHILD.format(src=SRC_DIR, module=module)],
+            cwd=cwd, capture_output=True, text=True, check=True
+        )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    args = sys.argv[1:]
+    repeat = int(args.pop(0)) if args and args[0].isdigit() else 5
+    modules = args or ["logic", "api", "app"]
+
+    for module in modules:
+        try:
+            runs = [measure(module) for _ in range(repeat)]
+        except subprocess.CalledProcessError as e:
+            print(f"{module:>6}  导入失败: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        seconds = statistics.median(r["seconds"] for r in runs)
+        rss = statistics.median(r["rss_mb"] for r in runs)
+        print(f"{module:>6}  导入 {seconds * 1000:8.1f} ms  峰值内存 {rss:7.1f} MB  已加载模块 {runs[0]['modules']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# 超大图片分块处理：生成一张超大PNG，分别测量缩放、裁剪+滤镜+水印两类任务的耗时与子进程峰值内存
+# 用法: python benchmarks/bench_tiled.py [边长] [内存预算MB]
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "SnapForge"))
+sys.path.insert(0, SRC_DIR)
+
+CHILD = """
+import json, os, resource, sys, time
+sys.path.insert(0, {src!r})
+import tiled
+if {budget}:
+    tiled.process_tiled.__defaults__ = ({budget},)
+if not {tiled}:
+    tiled.TILED_PIXELS = 1 << 62
+from logic import ImageProcessor, ProcessLog
+log = ProcessLog()
+start = time.perf_counter()
+done, _, paths = ImageProcessor().batch_process(files=[{path!r}], prefix={prefix!r}, process_log=log, **{options!r})
+seconds = time.perf_counter() - start
+# ru_maxrss会继承父进程(生成源图时)的峰值，Linux上改读本进程的VmHWM
+try:
+    rss = next(int(l.split()[1]) for l in open("/proc/self/status") if l.startswith("VmHWM")) / 1024
+except OSError:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps({{"seconds": seconds, "rss_mb": rss, "done": done, "log": log.get_text()}}))
+"""
+
+
+def make_png(path, side):
+    # 用分块写出器逐条带生成，生成过程本身也不需要整幅内存
+    import numpy as np
+    from PIL import Image
+    from tiled import _PngWriter
+
+    writer = _PngWriter(path, (side, side), "RGB", compress_level=1)
+    x = np.arange(side, dtype=np.uint32)
+    for y0 in range(0, side, 128):
+        y = np.arange(y0, min(side, y0 + 128), dtype=np.uint32)[:, None]
+        rows = np.stack([(x[None] * 255 // side) + 0 * y, (y * 255 // side) + 0 * x[None], (x[None] ^ y) & 255], axis=-1)
+        writer.write(Image.fromarray(rows.astype(np.uint8)))
+    writer.close()
+
+
+def run(path, prefix, options, tiled=True, budget=0):
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD.format(src=SRC_DIR, path=path, prefix=prefix, options=options, tiled=tiled, budget=budget)],
+        capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    side = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    budget = int(sys.argv[2]) * 1024 * 1024 if len(sys.argv) > 2 else 0
+    tasks = {
+        "缩放到2000px": {"resize_enabled": True, "resize_width": 2000, "resize_height": 2000, "convert_format": ".jpg"},
+        "裁剪+锐化+平铺水印": {
+            "crop_params": {"x": 100, "y": 100, "w": side - 200, "h": side - 200}, "filter_type": "sharpen",
+            "watermark": {"text": "SnapForge", "size": 64, "pos": "tile", "angle": 30}, "convert_format": ".tiff",
+        },
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "huge.png")
+        make_png(path, side)
+        print(f"源图 {side}x{side}  {os.path.getsize(path) / 1e6:.1f} MB  未压缩 {side * side * 3 / 1e9:.2f} GB")
+        for name, options in tasks.items():
+            for label, tiled in (("整幅", False), ("分块", True)):
+                result = run(path, f"{label}", options, tiled, budget)
+                if "error" in result:
+                    print(f"{name:<12} {label}  失败: {result['error']}")
+                elif not result["done"]:
+                    print(f"{name:<12} {label}  {result['log']}")
+                else:
+                    print(f"{name:<12} {label}  {result['seconds']:7.1f} s  峰值内存 {result['rss_mb']:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 源码为平铺模块(from logic import ...)，测试直接从SnapForge目录导入
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "SnapForge"))
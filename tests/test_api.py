@@ -0,0 +1,56 @@
+import io
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import api
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(api.app) as c:
+        yield c
+
+
+@pytest.fixture(scope="module")
+def png():
+    buf = io.BytesIO()
+    Image.new("RGB", (40, 30), "red").save(buf, "PNG")
+    return buf.getvalue()
+
+
+def test_batch_prefix_cannot_escape_output_dir(client, png, tmp_path):
+    target = tmp_path / "pwned"
+    prefix = "../" * 20 + str(target).lstrip("/")
+    r = client.post("/process/batch", files=[("files", ("a.png", png))], data={"prefix": prefix})
+    assert r.status_code == 200
+    assert zipfile.ZipFile(io.BytesIO(r.content)).namelist() == ["pwned_0001.png"]
+    assert not list(tmp_path.iterdir())
+
+
+def test_multipart_filename_is_quoted(client, png):
+    r = client.post("/process/batch", files=[("files", ("a.png", png))], data={"prefix": "图\"x", "output": "multipart"})
+    assert r.status_code == 200
+    assert "Content-Disposition: attachment; filename*=utf-8''%E5%9B%BEx_0001.png" in r.content.decode("latin-1")
+
+
+def test_single_prefix_is_sanitized(client, png):
+    r = client.post("/process/", files={"file": ("a.png", png)}, data={"prefix": "../../etc/x"})
+    assert r.json()["filename"] == "x_0001.png"
+
+
+def test_upload_size_limit(client, png, monkeypatch):
+    monkeypatch.setattr(api, "MAX_UPLOAD_BYTES", len(png) - 1)
+    r = client.post("/process/", files={"file": ("a.png", png)})
+    assert r.status_code == 413
+
+
+@pytest.mark.parametrize("path,field", [("/process/", "file"), ("/process/batch", "files")])
+def test_full_queue_rejects_before_reading_body(client, png, monkeypatch, path, field):
+    monkeypatch.setattr(api.pool, "queued", api.pool.max_queue)
+    monkeypatch.setattr(api, "read_upload", lambda file: pytest.fail("读取了请求体"))
+    monkeypatch.setattr(api, "save_upload", lambda *args: pytest.fail("读取了请求体"))
+    r = client.post(path, files=[(field, ("a.png", png))])
+    assert r.status_code == 429
@@ -0,0 +1,61 @@
+from PIL import Image
+
+from cache import ResultCache
+from logic import ImageProcessor
+
+
+def test_size_is_tracked_incrementally(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=10 ** 6)
+    key = cache.make_key("digest", {"quality": 80})
+    cache.put_bytes(key, b"x" * 100, ".jpg")
+    assert cache.stats()["bytes"] == 100
+    # 覆盖同一个key只计大小之差
+    cache.put_bytes(key, b"x" * 40, ".jpg")
+    assert cache.stats()["bytes"] == 40
+    assert cache.get_bytes(key, ".jpg") == b"x" * 40
+
+
+def test_stats_does_not_rescan_directory(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    monkeypatch.setattr(cache, "_entries", lambda: (_ for _ in ()).throw(AssertionError("扫描了目录")))
+    cache.put_bytes("ab" * 32, b"data")
+    cache.record(True)
+    assert cache.stats()["bytes"] == 4 and cache.stats()["hits"] == 1
+
+
+def test_eviction_keeps_size_under_limit(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1000)
+    for i in range(5):
+        cache.put_bytes(cache.make_key(str(i), {}), b"x" * 300)
+    assert cache.stats()["bytes"] <= 900
+    assert cache.stats()["bytes"] == cache._scan_size()
+
+
+def test_track_adds_entries_written_elsewhere(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    copy = ResultCache.__new__(ResultCache)
+    copy.__setstate__(cache.__getstate__())
+    copy.put_bytes("cd" * 32, b"x" * 50)
+    assert cache.stats()["bytes"] == 0
+    cache.track(50)
+    assert cache.stats()["bytes"] == 50 == cache._scan_size()
+
+
+def test_batch_hashes_and_decodes_from_path(tmp_path, monkeypatch):
+    # 有缓存时源文件也按路径解码(大图可走分块处理)，且与内存处理共用缓存条目
+    src = tmp_path / "a.png"
+    Image.new("RGB", (30, 20), "red").save(src)
+    opened = []
+    real_open = ImageProcessor._open_image
+    def open_image(self, source, allow_large=True):
+        opened.append(source)
+        return real_open(self, source, allow_large)
+    monkeypatch.setattr(ImageProcessor, "_open_image", open_image)
+    processor = ImageProcessor(cache=ResultCache(str(tmp_path / "cache")))
+    _, _, paths = processor.batch_process(files=[str(src)], prefix="out", convert_format=".jpg", workers=1)
+    assert opened == [str(src)]
+    assert processor.cache.stats()["misses"] == 1
+    data, _ = processor.process_bytes(src.read_bytes(), "a.png", convert_format=".jpg")
+    assert processor.cache.stats()["hits"] == 1
+    with open(paths[0], "rb") as f:
+        assert data == f.read()
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+
+import cloud
+
+
+@pytest.fixture(autouse=True)
+def fresh_buckets(monkeypatch):
+    monkeypatch.setattr(cloud, "_buckets", {})
+
+
+def recognize(paths, identity, rate):
+    return cloud._recognize_all(paths, "test", identity, lambda data: ["ok"], 8, rate, 0, None, 0, 85, 0, None)
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for i in range(10):
+        path = tmp_path / f"{i}.jpg"
+        path.write_bytes(b"x")
+        paths.append(str(path))
+    return paths
+
+
+def test_bucket_is_shared_per_provider_and_identity():
+    bucket = cloud.provider_bucket("baidu", "app", 2.0)
+    assert cloud.provider_bucket("baidu", "app", 2.0) is bucket
+    assert cloud.provider_bucket("baidu", "other", 2.0) is not bucket
+    assert cloud.provider_bucket("deepseek", "app", 2.0) is not bucket
+    # 改限速沿用同一个桶
+    assert cloud.provider_bucket("baidu", "app", 5.0) is bucket and bucket.rate == 5.0
+
+
+def test_concurrent_batches_share_rate_limit(images):
+    # 两批各10张、每秒10次：单独一批可用初始令牌立即发完，两批共用一个桶则需约1秒
+    start = time.monotonic()
+    threads = [threading.Thread(target=recognize, args=(images, "app", 10.0)) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert time.monotonic() - start >= 0.8
+
+
+def test_different_identities_are_not_throttled_together(images):
+    start = time.monotonic()
+    assert set(map(tuple, recognize(images, "a", 10.0).values())) == {("ok",)}
+    recognize(images, "b", 10.0)
+    assert time.monotonic() - start < 0.7
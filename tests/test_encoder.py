@@ -0,0 +1,103 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from encoder import MIN_QUALITY, encode_image, ssim, to_palette
+
+
+@pytest.fixture(scope="module")
+def photo():
+    # 大于探针阈值，质量搜索走拼块探针
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:720, 0:800]
+    base = np.stack([(x / 5) % 256, (y / 4) % 256, ((x + y) / 7) % 256], axis=-1)
+    return Image.fromarray((base + rng.normal(0, 12, base.shape)).clip(0, 255).astype(np.uint8))
+
+
+def encode(img, fmt, options, **save_params):
+    if fmt == "WEBP":
+        # 慢速档太耗时，测试用默认档
+        options = dict(options, method=4)
+    buf = io.BytesIO()
+    size = encode_image(img, buf, dict(save_params, format=fmt), options)
+    assert size == len(buf.getvalue())
+    return buf.getvalue()
+
+
+def plain(img, fmt, **save_params):
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, **save_params)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("fmt", ["JPEG", "WEBP"])
+@pytest.mark.parametrize("ratio", [0.3, 0.6])
+def test_target_size(photo, fmt, ratio):
+    target = int(len(plain(photo, fmt, quality=95)) * ratio)
+    data = encode(photo, fmt, {"target_size": target})
+    assert len(data) <= target
+    # 不应为了达标而压得过狠
+    assert len(data) > target * 0.5
+
+
+@pytest.mark.parametrize("fmt", ["JPEG", "WEBP"])
+def test_unreachable_target_size_floors_at_min_quality(photo, fmt):
+    data = encode(photo, fmt, {"target_size": 1000})
+    params = {"optimize": True, "progressive": True} if fmt == "JPEG" else {"method": 4}
+    assert data == plain(photo, fmt, quality=MIN_QUALITY, **params)
+
+
+@pytest.mark.parametrize("fmt", ["JPEG", "WEBP"])
+@pytest.mark.parametrize("target", [0.9, 0.97])
+def test_target_ssim(photo, fmt, target):
+    data = encode(photo, fmt, {"target_ssim": target})
+    with Image.open(io.BytesIO(data)) as decoded:
+        assert ssim(photo, decoded) >= target - 0.005
+    # 满足目标的同时比最高质量小
+    assert len(data) < len(plain(photo, fmt, quality=95))
+
+
+def test_quality_is_upper_bound(photo):
+    # SSIM目标达不到时停在给定质量上，不会超过它
+    data = encode(photo, "JPEG", {"target_ssim": 0.9999, "optimize": False, "progressive": False}, quality=50)
+    assert data == plain(photo, "JPEG", quality=50, optimize=False, progressive=False)
+
+
+def test_size_wins_over_ssim(photo):
+    target = len(plain(photo, "JPEG", quality=30))
+    assert len(encode(photo, "JPEG", {"target_size": target, "target_ssim": 0.999})) <= target
+
+
+def few_colors(mode, count):
+    rng = np.random.default_rng(count)
+    bands = len(Image.new(mode, (1, 1)).getbands())
+    colors = rng.integers(0, 256, (count, bands), dtype=np.uint8)
+    pixels = colors[rng.integers(0, count, (37, 53))]
+    return Image.fromarray(pixels.reshape(37, 53, bands).squeeze(-1) if bands == 1 else pixels, mode)
+
+
+@pytest.mark.parametrize("mode,count", [("L", 2), ("L", 16), ("LA", 40), ("RGB", 5), ("RGB", 256), ("RGBA", 200)])
+def test_to_palette_lossless(mode, count):
+    img = few_colors(mode, count)
+    pal = to_palette(img, img.getcolors(256))
+    assert pal.mode == "P"
+    assert pal.convert(mode).tobytes() == img.tobytes()
+
+
+@pytest.mark.parametrize("mode,count", [("L", 16), ("LA", 40), ("RGB", 5), ("RGBA", 200)])
+def test_png_palette_round_trip(mode, count):
+    img = few_colors(mode, count)
+    data = encode(img, "PNG", {})
+    with Image.open(io.BytesIO(data)) as decoded:
+        assert decoded.mode == "P"
+        assert decoded.convert(mode).tobytes() == img.tobytes()
+    assert len(data) < len(plain(img, "PNG"))
+
+
+def test_png_keeps_many_colors(photo):
+    data = encode(photo, "PNG", {"cpu_budget": 0})
+    with Image.open(io.BytesIO(data)) as decoded:
+        assert decoded.mode == "RGB"
+        assert decoded.tobytes() == photo.tobytes()
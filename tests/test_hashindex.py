@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+import hashindex
+from hashindex import choose_chunks, cluster_near_duplicates, group_near_duplicates, near_pairs
+
+
+def brute_pairs(values, threshold):
+    return [(i, j) for i in range(len(values)) for j in range(i + 1, len(values))
+            if bin(values[i] ^ values[j]).count("1") <= threshold]
+
+
+def brute_greedy(hashes, threshold):
+    # 逐对比较的原有贪心分组
+    used, groups = set(), []
+    for i, (key, value) in enumerate(hashes):
+        if key in used:
+            continue
+        group = [key] + [k for k, v in hashes[i + 1:] if k not in used and bin(value ^ v).count("1") <= threshold]
+        if len(group) > 1:
+            used.update(group)
+            groups.append(group)
+    return groups
+
+
+def flip(value, bits):
+    for b in bits:
+        value ^= 1 << b
+    return value
+
+
+def sample_hashes(n, seed=0):
+    # 一批随机哈希，再在其附近派生若干近似哈希，保证各阈值下都有命中
+    rng = random.Random(seed)
+    values = [rng.getrandbits(64) for _ in range(n)]
+    for _ in range(n):
+        base = rng.choice(values)
+        values.append(flip(base, rng.sample(range(64), rng.randint(0, 12))))
+    rng.shuffle(values)
+    return values
+
+
+@pytest.mark.parametrize("threshold", [0, 3, 8, 12, 40])
+def test_near_pairs_matches_brute_force(threshold):
+    values = sample_hashes(150)
+    assert near_pairs(values, threshold).tolist() == [list(p) for p in brute_pairs(values, threshold)]
+
+
+def test_both_search_paths():
+    # 小阈值走多索引哈希，阈值很大时退化为两两比较
+    assert choose_chunks(8, 100000)
+    assert not choose_chunks(60, 100)
+
+
+def test_small_blocks(monkeypatch):
+    monkeypatch.setattr(hashindex, "MAX_PAIRS_PER_BLOCK", 7)
+    values = sample_hashes(80, seed=1) + [12345] * 20
+    for threshold in (4, 40):
+        assert near_pairs(values, threshold).tolist() == [list(p) for p in brute_pairs(values, threshold)]
+
+
+def test_parallel_matches_serial(monkeypatch):
+    monkeypatch.setattr(hashindex, "PARALLEL_MIN_HASHES", 0)
+    values = sample_hashes(200, seed=2)
+    assert near_pairs(values, 8, workers=2).tolist() == near_pairs(values, 8).tolist()
+
+
+def test_near_pairs_empty():
+    assert near_pairs([], 8).shape == (0, 2)
+    assert near_pairs([1], 8).shape == (0, 2)
+    assert near_pairs([0, (1 << 64) - 1], 8).shape == (0, 2)
+
+
+@pytest.mark.parametrize("threshold", [4, 10])
+def test_greedy_matches_pairwise(threshold):
+    hashes = [(f"img{i}", v) for i, v in enumerate(sample_hashes(120, seed=3))]
+    assert group_near_duplicates(hashes, threshold) == brute_greedy(hashes, threshold)
+
+
+def test_cluster_vs_greedy_on_chain():
+    # a-b、b-c各相距4位，a-c相距8位：greedy以a为组首只收b，c落单；cluster按连通性三者一组
+    a = 0
+    b = flip(a, range(4))
+    c = flip(b, range(4, 8))
+    far = (1 << 64) - 1
+    hashes = [("a", a), ("b", b), ("c", c), ("far", far)]
+    assert group_near_duplicates(hashes, 4) == [["a", "b"]]
+    assert cluster_near_duplicates(hashes, 4) == [["a", "b", "c"]]
+
+
+def test_cluster_independent_of_order():
+    hashes = [(f"img{i}", v) for i, v in enumerate(sample_hashes(100, seed=4))]
+    groups = cluster_near_duplicates(hashes, 6)
+    shuffled = hashes[:]
+    random.Random(5).shuffle(shuffled)
+    assert sorted(sorted(g) for g in cluster_near_duplicates(shuffled, 6)) == sorted(sorted(g) for g in groups)
+    # 距离<=阈值的两条目必在同一组
+    owner = {key: n for n, group in enumerate(groups) for key in group}
+    for i, j in brute_pairs([v for _, v in hashes], 6):
+        ki, kj = hashes[i][0], hashes[j][0]
+        assert ki in owner and owner[ki] == owner.get(kj)
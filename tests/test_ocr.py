@@ -0,0 +1,64 @@
+import io
+import os
+import stat
+
+import pytest
+import pytesseract
+from PIL import Image
+
+import ocr
+
+
+@pytest.fixture
+def fake_tesseract(tmp_path, monkeypatch):
+    # 假的tesseract：输出收到的参数、OMP_THREAD_LIMIT和stdin字节数
+    script = tmp_path / "tesseract"
+    script.write_text('#!/bin/sh\nn=$(wc -c)\necho "$* omp=$OMP_THREAD_LIMIT bytes=$n"\n')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(pytesseract.pytesseract, "tesseract_cmd", str(script))
+    monkeypatch.delenv("OMP_THREAD_LIMIT", raising=False)
+    return script
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / "a.png"
+    Image.new("RGB", (40, 20), "white").save(path)
+    return str(path)
+
+
+def test_thread_limit_only_in_subprocess(fake_tesseract, image):
+    text = ocr.ocr_image(image, lang="eng")
+    assert "omp=1" in text
+    assert "OMP_THREAD_LIMIT" not in os.environ
+
+
+def test_preprocess_is_opt_in(fake_tesseract, image):
+    assert "--dpi" not in ocr.ocr_image(image, lang="eng")
+    assert f"--dpi {ocr.TARGET_DPI}" in ocr.ocr_image(image, lang="eng", preprocess=True)
+
+
+def test_tesseract_failure(tmp_path, monkeypatch, image):
+    script = tmp_path / "broken"
+    script.write_text("#!/bin/sh\necho boom >&2\nexit 1\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(pytesseract.pytesseract, "tesseract_cmd", str(script))
+    assert "boom" in ocr.ocr_image(image, lang="eng")
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "LA", "PA"])
+def test_transparency_flattened_onto_white(mode):
+    img = Image.new("RGBA", (8, 4), (255, 0, 0, 0)).convert(mode)
+    prepared = ocr._tesseract_input(img)
+    assert prepared.mode == "RGB" and prepared.getpixel((0, 0)) == (255, 255, 255)
+
+
+@pytest.mark.parametrize("mode", ["CMYK", "YCbCr", "I;16", "P", "1"])
+def test_tesseract_input_is_png_writable(mode):
+    ocr._tesseract_input(Image.new(mode, (8, 4))).save(io.BytesIO(), "PNG")
+
+
+def test_cmyk_jpeg(fake_tesseract, tmp_path):
+    path = tmp_path / "cmyk.jpg"
+    Image.new("CMYK", (40, 20)).save(path)
+    assert "omp=1" in ocr.ocr_image(str(path), lang="eng")
@@ -0,0 +1,317 @@
+import functools
+import io
+import struct
+import zlib
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import logic
+import tiled
+from logic import ImageProcessor
+
+ADAM7 = [(0, 0, 8, 8), (4, 0, 8, 8), (0, 4, 4, 8), (2, 0, 4, 4), (0, 2, 2, 4), (1, 0, 2, 2), (0, 1, 1, 2)]
+
+
+def random_image(mode, size=(37, 53), seed=0):
+    rng = np.random.default_rng(seed)
+    if mode == "P":
+        # 超过16色，PNG按8位深度保存
+        img = Image.fromarray(rng.integers(0, 200, size[::-1], dtype=np.uint8), "L").convert("P")
+        img.putpalette(rng.integers(0, 256, 200 * 3, dtype=np.uint8).tolist())
+        img.info["transparency"] = bytes(rng.integers(0, 256, 200, dtype=np.uint8))
+        return img
+    bands = len(Image.new(mode, (1, 1)).getbands())
+    pixels = rng.integers(0, 256, size[::-1] + (bands,), dtype=np.uint8)
+    return Image.fromarray(pixels[:, :, 0] if bands == 1 else pixels).convert(mode)
+
+
+def photo(size=(160, 120), alpha=False):
+    # 渐变加少量噪声，缩放结果对取整误差不敏感
+    y, x = np.mgrid[0:size[1], 0:size[0]]
+    rng = np.random.default_rng(1)
+    bands = [x * 255 // size[0], y * 255 // size[1], (x + y) * 255 // sum(size)]
+    if alpha:
+        bands.append(128 + (x % 64) * 2)
+    pixels = np.stack(bands, axis=-1) + rng.integers(0, 8, (size[1], size[0], len(bands)))
+    return Image.fromarray(pixels.clip(0, 255).astype(np.uint8))
+
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def interlaced_png(img):
+    # Pillow不能写隔行PNG，按Adam7手工生成(全部用滤波类型0)
+    pixels = np.asarray(img)
+    height, width = pixels.shape[:2]
+    raw = b""
+    for x0, y0, dx, dy in ADAM7:
+        sub = pixels[y0::dy, x0::dx]
+        if sub.size:
+            raw += b"".join(b"\x00" + row.tobytes() for row in sub)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 1)
+    return tiled.PNG_SIGNATURE + png_chunk(b"IHDR", header) + png_chunk(b"IDAT", zlib.compress(raw)) + png_chunk(b"IEND", b"")
+
+
+def encoded(img, fmt, **params):
+    buf = io.BytesIO()
+    img.save(buf, fmt, **params)
+    return buf.getvalue()
+
+
+def read_strips(reader, ranges):
+    return [reader.read(y0, y1) for y0, y1 in ranges]
+
+
+# 与_Renderer的读取方式相同：相邻条带有重叠(重采样余量)，也会跳过一段行
+RANGES = [(0, 10), (8, 20), (20, 21), (21, 33), (40, 53)]
+
+
+@pytest.mark.parametrize("mode", ["L", "LA", "RGB", "RGBA", "P"])
+def test_png_reader_matches_full_decode(mode):
+    img = random_image(mode)
+    src = Image.open(io.BytesIO(encoded(img, "PNG")))
+    reader = tiled._PngReader(src, skip_rows=4)
+    full = Image.open(io.BytesIO(encoded(img, "PNG")))
+    full.load()
+    for (y0, y1), strip in zip(RANGES, read_strips(reader, RANGES)):
+        expected = full.crop((0, y0, full.width, y1))
+        assert strip.mode == expected.mode
+        assert strip.tobytes() == expected.tobytes()
+        if mode == "P":
+            assert strip.getpalette() == expected.getpalette()
+            assert strip.info["transparency"] == full.info["transparency"]
+
+
+def test_png_reader_rejects_backwards_read():
+    src = Image.open(io.BytesIO(encoded(random_image("RGB"), "PNG")))
+    reader = tiled._PngReader(src, skip_rows=4)
+    reader.read(20, 30)
+    with pytest.raises(tiled.NotTileable):
+        reader.read(0, 10)
+
+
+@pytest.mark.parametrize("data", [
+    interlaced_png(random_image("RGB")),
+    encoded(random_image("L").convert("I;16"), "PNG"),
+    encoded(random_image("L").convert("1"), "PNG"),
+], ids=["interlaced", "16bit", "1bit"])
+def test_unsupported_png_falls_back_to_full_decode(data):
+    src = Image.open(io.BytesIO(data))
+    with pytest.raises(tiled.NotTileable):
+        tiled._PngReader(src, skip_rows=4)
+    reader, scale, region = tiled._open_reader(ImageProcessor(), src, None, None, 4)
+    assert isinstance(reader, tiled._ImageReader)
+    full = Image.open(io.BytesIO(data))
+    full.load()
+    assert reader.read(5, 17).tobytes() == full.crop((0, 5, full.width, 17)).tobytes()
+
+
+@pytest.mark.parametrize("mode,fmt", [
+    ("RGB", "BMP"), ("L", "BMP"), ("P", "BMP"), ("RGB", "TIFF"), ("RGBA", "TIFF"), ("L", "PPM"),
+])
+def test_raw_reader_matches_full_decode(mode, fmt):
+    data = encoded(random_image(mode), fmt)
+    src = Image.open(io.BytesIO(data))
+    reader, _, _ = tiled._open_reader(ImageProcessor(), src, None, None, 4)
+    assert isinstance(reader, tiled._RawReader)
+    full = Image.open(io.BytesIO(data))
+    full.load()
+    for (y0, y1), strip in zip(RANGES, read_strips(reader, RANGES)):
+        expected = full.crop((0, y0, full.width, y1))
+        assert strip.convert("RGBA").tobytes() == expected.convert("RGBA").tobytes()
+
+
+def test_compressed_tiff_falls_back_to_full_decode():
+    data = encoded(random_image("RGB"), "TIFF", compression="tiff_deflate")
+    reader, _, _ = tiled._open_reader(ImageProcessor(), Image.open(io.BytesIO(data)), None, None, 4)
+    assert isinstance(reader, tiled._ImageReader)
+
+
+def write_strips(writer, img, height=17):
+    for y in range(0, img.height, height):
+        writer.write(img.crop((0, y, img.width, min(img.height, y + height))))
+    writer.close()
+
+
+@pytest.mark.parametrize("mode", ["L", "LA", "RGB", "RGBA"])
+def test_png_writer_round_trip(tmp_path, mode):
+    img = random_image(mode, (41, 150))
+    path = tmp_path / "out.png"
+    exif = Image.Exif()
+    exif[0x010F] = "SnapForge"
+    write_strips(tiled._PngWriter(str(path), img.size, mode, exif=exif.tobytes()), img)
+    with Image.open(path) as out:
+        assert out.mode == mode
+        assert out.tobytes() == img.tobytes()
+        assert out.getexif()[0x010F] == "SnapForge"
+
+
+@pytest.mark.parametrize("mode", ["L", "LA", "RGB", "RGBA"])
+def test_tiff_writer_round_trip(mode):
+    img = random_image(mode, (41, tiled.TIFF_ROWS_PER_STRIP * 2 + 22))
+    # 写入已有内容的文件对象：TIFF内的偏移相对于写入起点
+    out = io.BytesIO(b"prefix")
+    out.seek(0, io.SEEK_END)
+    write_strips(tiled._TiffWriter(out, img.size, mode), img)
+    assert out.tell() == len(out.getvalue())
+    with Image.open(io.BytesIO(out.getvalue()[len(b"prefix"):])) as result:
+        assert result.mode == mode
+        assert result.tobytes() == img.tobytes()
+
+
+@pytest.mark.parametrize("writer", [tiled._PngWriter, tiled._TiffWriter])
+def test_streaming_writers_reject_other_modes(tmp_path, writer):
+    with pytest.raises(tiled.NotTileable):
+        writer(str(tmp_path / "out"), (10, 10), "P")
+
+
+@pytest.mark.parametrize("name,mode,expected", [
+    ("out.png", "RGB", tiled._PngWriter),
+    ("out.tiff", "RGBA", tiled._TiffWriter),
+    ("out.png", "P", tiled._MemoryWriter),
+    ("out.jpg", "RGB", tiled._MemoryWriter),
+    ("out.webp", "RGB", tiled._MemoryWriter),
+])
+def test_open_writer_chooses_streaming_or_memory(tmp_path, name, mode, expected):
+    writer = tiled._open_writer(str(tmp_path / name), (100, 100), mode, {}, memory=1000)
+    assert isinstance(writer, expected)
+    if hasattr(writer, "out"):
+        writer.out.close()
+
+
+def test_open_writer_keeps_small_outputs_in_memory(tmp_path):
+    writer = tiled._open_writer(str(tmp_path / "out.png"), (100, 100), "RGB", {}, memory=10 ** 9)
+    assert isinstance(writer, tiled._MemoryWriter)
+
+
+def test_unstreamable_output_over_pillow_limit_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(tiled, "exceeds_pillow_limit", lambda size: size[0] * size[1] > 5000)
+    with pytest.raises(ValueError):
+        tiled._open_writer(str(tmp_path / "out.jpg"), (100, 100), "RGB", {}, memory=1000)
+    writer = tiled._open_writer(str(tmp_path / "out.png"), (100, 100), "RGB", {}, memory=1000)
+    assert isinstance(writer, tiled._PngWriter)
+    writer.out.close()
+
+
+@pytest.mark.parametrize("plan,tileable", [
+    ([("resize", (50, 50, "fit", True), None), ("filter", "sharpen")], True),
+    ([("crop", (10, 10, 90, 90))], True),
+    ([("crop", (-5, 0, 50, 50))], False),
+    ([("crop", (0, 0, 120, 50))], False),
+    ([("rotate", 90)], False),
+])
+def test_can_tile(plan, tileable):
+    assert tiled.can_tile(plan, (100, 100)) is tileable
+
+
+@pytest.fixture
+def process(tmp_path, monkeypatch):
+    # strips=True时任何尺寸都按条带处理，且内存预算很小，条带只有16行并使用逐块写出器
+    def run(src_name, data, out_ext, strips, **options):
+        monkeypatch.setattr(tiled, "TILED_PIXELS", 0 if strips else 1 << 60)
+        monkeypatch.setattr(logic, "process_tiled", functools.partial(tiled.process_tiled, memory=4000))
+        src = tmp_path / src_name
+        src.write_bytes(data)
+        dest = tmp_path / f"{'strips' if strips else 'whole'}{out_ext}"
+        ImageProcessor()._process_image(str(src), str(dest), out_ext, None, True, **options)
+        with Image.open(dest) as out:
+            out.load()
+            return out
+    return run
+
+
+SOURCES = {
+    "rgb.png": lambda: encoded(photo(), "PNG"),
+    "rgba.png": lambda: encoded(photo(alpha=True), "PNG"),
+    "p.png": lambda: encoded(photo().quantize(64), "PNG"),
+    "interlaced.png": lambda: interlaced_png(photo()),
+    "rgb.bmp": lambda: encoded(photo(), "BMP"),
+    "deflate.tiff": lambda: encoded(photo(), "TIFF", compression="tiff_deflate"),
+    "rgb.jpg": lambda: encoded(photo(), "JPEG", quality=95),
+}
+
+EXACT_OPTIONS = {
+    "crop+sharpen+watermark": {
+        "crop_params": {"x": 7, "y": 5, "w": 140, "h": 101}, "filter_type": "sharpen",
+        "watermark": {"text": "SnapForge", "size": 14, "pos": "tile", "angle": 30},
+    },
+    "contrast+blur": {"filter_type": "contrast:1.4,blur"},
+    "grayscale": {"filter_type": "grayscale"},
+    "rotate (整幅回退)": {"rotate": 90},
+}
+
+
+@pytest.mark.parametrize("out_ext", [".png", ".tiff"])
+@pytest.mark.parametrize("options", EXACT_OPTIONS.values(), ids=EXACT_OPTIONS.keys())
+@pytest.mark.parametrize("src_name", SOURCES)
+def test_strips_match_whole_image(process, src_name, options, out_ext):
+    data = SOURCES[src_name]()
+    whole = process(src_name, data, out_ext, False, **options)
+    strips = process(src_name, data, out_ext, True, **options)
+    assert strips.size == whole.size and strips.mode == whole.mode
+    assert strips.tobytes() == whole.tobytes()
+
+
+@pytest.mark.parametrize("mode", ["fit", "fill", "pad", "crop"])
+@pytest.mark.parametrize("src_name", ["rgb.png", "rgba.png", "rgb.bmp"])
+def test_strip_resize_close_to_whole_image(process, src_name, mode):
+    data = SOURCES[src_name]()
+    options = {"resize_enabled": True, "resize_width": 70, "resize_height": 50, "resize_mode": mode}
+    whole = process(src_name, data, ".png", False, **options)
+    strips = process(src_name, data, ".png", True, **options)
+    assert strips.size == whole.size and strips.mode == whole.mode
+    # 分块缩放按条带取样，与整幅缩放只允许取整误差
+    diff = np.abs(np.asarray(strips, dtype=np.int16) - np.asarray(whole, dtype=np.int16))
+    assert diff.max() <= 8
+    assert diff.mean() < 0.5
+
+
+def test_strip_jpeg_output_matches_whole_image(process):
+    data = SOURCES["rgba.png"]()
+    whole = process("rgba.png", data, ".jpg", False, filter_type="sharpen")
+    strips = process("rgba.png", data, ".jpg", True, filter_type="sharpen")
+    assert strips.tobytes() == whole.tobytes()
+
+
+def test_in_memory_input_keeps_pillow_limit(tmp_path, monkeypatch):
+    # 路径输入超过Pillow上限时交给分块模式；内存输入(API上传)仍按Pillow上限拒绝
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 2000)
+    data = encoded(photo(), "PNG")
+    with pytest.raises(ValueError):
+        ImageProcessor().process_bytes(data, "a.png", convert_format=".tiff")
+    src = tmp_path / "a.png"
+    src.write_bytes(data)
+    with ImageProcessor()._open_image(str(src)) as img:
+        assert img.size == (160, 120)
+
+
+def test_open_large_leaves_pillow_limit_alone(tmp_path, monkeypatch):
+    # 打开超限图片期间其他线程的内存输入仍受Pillow上限保护
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 2000)
+    factory, accept = Image.OPEN["PNG"]
+    def checked(*args):
+        assert Image.MAX_IMAGE_PIXELS == 2000
+        return factory(*args)
+    monkeypatch.setitem(Image.OPEN, "PNG", (checked, accept))
+    src = tmp_path / "a.png"
+    src.write_bytes(encoded(photo(), "PNG"))
+    with tiled.open_large(str(src)) as img:
+        assert img.format == "PNG" and img.size == (160, 120)
+        img.load()
+    with open(src, "rb") as f, tiled.open_large(f) as img:
+        assert img.size == (160, 120)
+
+
+def test_open_large_limits(tmp_path, monkeypatch):
+    src = tmp_path / "a.tiff"
+    src.write_bytes(encoded(photo(), "TIFF"))
+    monkeypatch.setattr(tiled, "MAX_PIXELS", 160 * 120 - 1)
+    with pytest.raises(Image.DecompressionBombError):
+        tiled.open_large(str(src))
+    junk = tmp_path / "junk.png"
+    junk.write_bytes(b"not an image at all")
+    with pytest.raises(Image.UnidentifiedImageError):
+        tiled.open_large(str(junk))
@@ -0,0 +1,14 @@
+import pytest
+from PIL import Image
+
+from logic import ImageProcessor
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L", "P"])
+def test_apply_watermark_leaves_source_untouched(mode):
+    img = Image.new("RGB", (120, 80), (10, 20, 30)).convert(mode)
+    before = img.tobytes()
+    out = ImageProcessor().apply_watermark(img, {"text": "SnapForge", "size": 20, "color": (255, 255, 255, 255)})
+    assert img.tobytes() == before
+    assert out is not img
+    assert out.convert("RGB").getextrema() != img.convert("RGB").getextrema()
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from api import WorkerPool
+
+
+def run(coro_func, workers=1, max_queue=4, timeout=5.0):
+    async def main():
+        pool = WorkerPool(workers, max_queue, timeout)
+        pool.start()
+        try:
+            return await coro_func(pool)
+        finally:
+            pool.shutdown()
+    return asyncio.run(main())
+
+
+async def until(check, limit=10.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + limit
+    while not check():
+        assert loop.time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_not_started():
+    async def main():
+        await WorkerPool(1, 1, 1).run(abs, -1)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main())
+    assert exc.value.status_code == 503
+
+
+def test_result_and_metrics():
+    async def main(pool):
+        result = await pool.run(abs, -3)
+        await until(lambda: pool.completed == 1)
+        return result, pool.metrics()
+    result, metrics = run(main)
+    assert result == 3
+    assert metrics["in_flight"] == 0 and metrics["queued"] == 0 and metrics["failed"] == 0
+
+
+def test_queue_full():
+    async def main(pool):
+        running = asyncio.ensure_future(pool.run(time.sleep, 1))
+        await until(lambda: pool.in_flight == 1)
+        waiting = asyncio.ensure_future(pool.run(abs, -1))
+        await until(lambda: pool.queued == 1)
+        with pytest.raises(HTTPException) as exc:
+            await pool.run(abs, -1)
+        assert exc.value.status_code == 429
+        assert exc.value.headers["Retry-After"]
+        # 拒绝不影响已在执行和排队的请求
+        assert await running is None
+        assert await waiting == 1
+        return pool.metrics()
+    metrics = run(main, max_queue=1)
+    assert metrics["rejected"] == 1
+
+
+def test_timeouts():
+    abandoned = []
+    async def main(pool):
+        slow = asyncio.ensure_future(pool.run(time.sleep, 1.5, on_abandon=abandoned.append))
+        await until(lambda: pool.in_flight == 1)
+        # 唯一的槽位被占着，排队等待超时
+        with pytest.raises(HTTPException) as queued:
+            await pool.run(abs, -1)
+        with pytest.raises(HTTPException) as running:
+            await slow
+        # 超时的请求已返回，但任务仍占着槽位直到真正结束
+        assert pool.in_flight == 1
+        assert len(abandoned) == 1 and not abandoned[0].done()
+        await until(lambda: pool.in_flight == 0)
+        return queued.value.status_code, running.value.status_code, pool.metrics()
+    queued, running, metrics = run(main, timeout=0.5)
+    assert (queued, running) == (503, 504)
+    assert metrics["timed_out"] == 2 and metrics["completed"] == 1
+
+
+def test_cancel_calls_on_abandon():
+    abandoned = []
+    async def main(pool):
+        task = asyncio.ensure_future(pool.run(time.sleep, 0.5, on_abandon=abandoned.append))
+        await until(lambda: pool.in_flight == 1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await until(lambda: pool.in_flight == 0)
+    run(main)
+    assert len(abandoned) == 1 and abandoned[0].done()
+
+
+def test_broken_pool_restarts():
+    async def main(pool):
+        with pytest.raises(HTTPException) as exc:
+            await pool.run(os._exit, 1)
+        assert exc.value.status_code == 503
+        return await pool.run(abs, -2)
+    assert run(main) == 2
+
+
+def test_crash_restarts_pool_once():
+    async def main(pool):
+        broken = pool.executor
+        # 同一次崩溃让两个在途请求都失败，只重建一次
+        results = await asyncio.gather(pool.run(os._exit, 1), pool.run(time.sleep, 2), return_exceptions=True)
+        assert [r.status_code for r in results] == [503, 503]
+        fresh = pool.executor
+        assert fresh is not broken
+        # 迟到的失败请求不再替换新池，已提交到新池的任务不受影响
+        task = asyncio.ensure_future(pool.run(abs, -4))
+        await until(lambda: pool.in_flight == 1)
+        pool._restart(broken)
+        assert pool.executor is fresh
+        return await task
+    assert run(main, workers=2) == 4